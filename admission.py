@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Admission control for the chat endpoints
+
+Every chat turn passes through one AdmissionController before any storage or
+model work:
+
+- a per-client token bucket rejects clients sending faster than the rate limit
+- turns for the same session run one at a time, so a double-submit waits for
+  the turn in progress instead of racing it into save_session
+- a global cap bounds how many turns are in flight, with a short bounded
+  queue behind it
+
+Anything that cannot be admitted in time is rejected at once with
+AdmissionRejected, which carries a Retry-After hint for the 429 response, so
+an overloaded server keeps answering the turns it has taken on instead of
+timing out for everyone. Priority (crisis) turns have their own, more generous
+rate limit and go to the head of the queue, ahead of every waiting ordinary
+turn, but share the in-flight cap and queue bound. They don't know their
+session until the user is resolved, so they take its turn lock afterwards with
+Admission.hold_session.
+
+Limits are per process; under gunicorn each worker enforces its own.
+"""
+
+import math
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """Raised when a turn cannot be admitted; maps to HTTP 429"""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(f"Request rejected ({reason}), retry after {retry_after:.0f}s")
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """Refills rate tokens per second up to burst"""
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def take(self) -> float:
+        """Take one token; returns 0 on success, else seconds until one is available"""
+        now = time.monotonic()
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+
+class Admission:
+    """A granted admission; release() once the turn is over (also works as a with-block)"""
+
+    def __init__(self, controller: "AdmissionController", session: Optional[list], waited: float):
+        self.controller = controller
+        self.session = session
+        self.waited = waited
+        self.started = time.monotonic()
+        self._holds_session = session is not None
+        self._released = False
+
+    def hold_session(self, session_id: str, blocking: bool = True) -> bool:
+        """Take session_id's turn lock for the rest of this admission
+
+        For priority turns, which are admitted before their session is known.
+        They are never turned away for a busy session: with blocking=False
+        this returns False if another turn holds the lock, and a later call
+        waits for it.
+        """
+        if self.session is None:
+            self.session = self.controller._join_session(session_id)
+        if not self._holds_session:
+            self._holds_session = self.session[0].acquire(blocking)
+        return self._holds_session
+
+    def transfer(self) -> "Admission":
+        """Hand the admission to a new owner, e.g. a background task; release() here becomes a no-op"""
+        other = Admission(self.controller, self.session, self.waited)
+        other.started = self.started
+        other._holds_session = self._holds_session
+        self._released = True
+        return other
+
+    def release(self):
+        if self._released:
+            return
+        self._released = True
+        self.controller._release_slot(time.monotonic() - self.started)
+        if self.session is not None:
+            if self._holds_session:
+                self.session[0].release()
+            self.controller._leave_session(self.session)
+
+    def __enter__(self) -> "Admission":
+        return self
+
+    def __exit__(self, *exc):
+        self.release()
+
+
+class AdmissionController:
+    """Global in-flight cap, bounded wait queue, per-session serialization and
+    per-client rate limits"""
+
+    def __init__(self, max_in_flight: int = 16, max_queue: int = 32, queue_timeout: float = 10.0,
+                 rate_per_minute: float = 20.0, burst: int = 5, session_queue: int = 1,
+                 max_clients: int = 10000, priority_rate_per_minute: float = 60.0,
+                 priority_burst: int = 10):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.rate = rate_per_minute / 60.0
+        self.burst = burst
+        self.priority_rate = priority_rate_per_minute / 60.0
+        self.priority_burst = priority_burst
+        self.session_queue = session_queue
+        self.max_clients = max_clients
+
+        self._in_flight = 0
+        self._queued = 0
+        self._priority_queued = 0
+        self._slots = threading.Condition()
+        self._sessions: Dict[str, list] = {}  # session_id -> [lock, holders + waiters, session_id]
+        self._sessions_lock = threading.Lock()
+        self._buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._priority_buckets: "OrderedDict[str, TokenBucket]" = OrderedDict()
+        self._buckets_lock = threading.Lock()
+        self._turn_seconds = 1.0  # moving average, for Retry-After estimates
+        self._counts_lock = threading.Lock()
+        self.admitted = 0
+        self.rejected: Dict[str, int] = {}
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        """Build a controller from ADMISSION_* / RATE_LIMIT_* environment settings"""
+        return cls(
+            max_in_flight=int(os.environ.get("ADMISSION_MAX_IN_FLIGHT", 16)),
+            max_queue=int(os.environ.get("ADMISSION_MAX_QUEUE", 32)),
+            queue_timeout=float(os.environ.get("ADMISSION_QUEUE_TIMEOUT", 10)),
+            rate_per_minute=float(os.environ.get("RATE_LIMIT_PER_MINUTE", 20)),
+            burst=int(os.environ.get("RATE_LIMIT_BURST", 5)),
+            session_queue=int(os.environ.get("ADMISSION_SESSION_QUEUE", 1)),
+            priority_rate_per_minute=float(os.environ.get("CRISIS_RATE_LIMIT_PER_MINUTE", 60)),
+            priority_burst=int(os.environ.get("CRISIS_RATE_LIMIT_BURST", 10)),
+        )
+
+    def acquire(self, client: str, session_id: Optional[str] = None, priority: bool = False) -> Admission:
+        """Admit one turn or raise AdmissionRejected
+
+        Order matters: the rate limit is checked first (cheapest), then the
+        session lock, so a double-submit waits without holding a global slot.
+        Priority turns are checked against their own rate limit and wait for a
+        slot ahead of everyone else; their session lock comes later.
+        """
+        started = time.monotonic()
+        if priority:
+            self._check_rate(client, priority=True)
+            session = None
+        else:
+            self._check_rate(client)
+            session = self._enter_session(session_id, started)
+        try:
+            self._acquire_slot(priority, started)
+        except BaseException:
+            if session is not None:
+                session[0].release()
+                self._leave_session(session)
+            raise
+        with self._counts_lock:
+            self.admitted += 1
+        return Admission(self, session, time.monotonic() - started)
+
+    def _reject(self, reason: str, retry_after: float):
+        with self._counts_lock:
+            self.rejected[reason] = self.rejected.get(reason, 0) + 1
+        raise AdmissionRejected(reason, max(1, math.ceil(retry_after)))
+
+    def _check_rate(self, client: str, priority: bool = False):
+        buckets = self._priority_buckets if priority else self._buckets
+        with self._buckets_lock:
+            bucket = buckets.get(client)
+            if bucket is None:
+                if priority:
+                    bucket = buckets[client] = TokenBucket(self.priority_rate, self.priority_burst)
+                else:
+                    bucket = buckets[client] = TokenBucket(self.rate, self.burst)
+                while len(buckets) > self.max_clients:
+                    buckets.popitem(last=False)
+            else:
+                buckets.move_to_end(client)
+            wait = bucket.take()
+        if wait:
+            self._reject("priority_rate_limited" if priority else "rate_limited", wait)
+
+    def _enter_session(self, session_id: Optional[str], started: float) -> Optional[list]:
+        """Take the session's turn lock; new sessions have nothing to race with"""
+        if not session_id:
+            return None
+        with self._sessions_lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [threading.Lock(), 0, session_id]
+            if entry[1] > self.session_queue:
+                self._reject("session_busy", self._turn_seconds)
+            entry[1] += 1
+        remaining = self.queue_timeout - (time.monotonic() - started)
+        if not entry[0].acquire(timeout=max(0.0, remaining)):
+            self._leave_session(entry)
+            self._reject("session_busy", self._turn_seconds)
+        return entry
+
+    def _join_session(self, session_id: str) -> list:
+        """Register for a session's turn lock without taking it, whatever the queue"""
+        with self._sessions_lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                entry = self._sessions[session_id] = [threading.Lock(), 0, session_id]
+            entry[1] += 1
+        return entry
+
+    def _leave_session(self, entry: list):
+        with self._sessions_lock:
+            entry[1] -= 1
+            if entry[1] == 0:
+                del self._sessions[entry[2]]
+
+    def _acquire_slot(self, priority: bool, started: float):
+        with self._slots:
+            if self._in_flight >= self.max_in_flight and self._queued >= self.max_queue:
+                self._reject("overloaded", self._retry_after())
+            self._queued += 1
+            if priority:
+                self._priority_queued += 1
+            try:
+                deadline = started + self.queue_timeout
+                # Ordinary turns also wait while a priority turn is queued
+                while self._in_flight >= self.max_in_flight or (self._priority_queued and not priority):
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._reject("queue_timeout", self._retry_after())
+                    self._slots.wait(remaining)
+                self._in_flight += 1
+            finally:
+                self._queued -= 1
+                if priority:
+                    self._priority_queued -= 1
+                    self._slots.notify_all()
+
+    def _release_slot(self, seconds: float):
+        with self._slots:
+            self._in_flight -= 1
+            self._turn_seconds = 0.9 * self._turn_seconds + 0.1 * seconds
+            # Every waiter rechecks, so a queued priority turn takes the slot first
+            self._slots.notify_all()
+
+    def _retry_after(self) -> float:
+        """Rough time for the queue ahead to drain (caller holds _slots)"""
+        return self._turn_seconds * (self._queued + 1) / self.max_in_flight
+
+    def stats(self) -> Dict[str, Any]:
+        with self._slots:
+            in_flight, queued, priority_queued = self._in_flight, self._queued, self._priority_queued
+        with self._counts_lock:
+            admitted, rejected = self.admitted, dict(self.rejected)
+        return {
+            "in_flight": in_flight,
+            "queued": queued,
+            "priority_queued": priority_queued,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "active_sessions": len(self._sessions),
+            "tracked_clients": len(self._buckets),
+            "tracked_priority_clients": len(self._priority_buckets),
+            "avg_turn_seconds": round(self._turn_seconds, 3),
+            "admitted": admitted,
+            "rejected": rejected,
+        }
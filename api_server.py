@@ -4,113 +4,177 @@ Flask API server to connect the therapy chat frontend to Mistral AI backend
 Deployable to Render
 """
 
+import hmac
 import json
 import os
-from flask import Flask, request, jsonify
+import queue
+import signal
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from typing import Optional
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
-import openai
+from admission import Admission, AdmissionController, AdmissionRejected
+from context_builder import ContextBuilder, SummaryUpdate, estimate_tokens
+from crisis import (crisis_detector, crisis_reply, BUSY_RESPONSE, CRISIS_RESPONSE, FALLBACK_RESPONSE,
+                    FOLLOW_UP_INSTRUCTION)
+from idempotency import IdempotencyCache, KeyReused, RequestInProgress, fingerprint
+from identity import USER_ID_PATTERN, Identity, IdentityMap, extract_name, is_guest, new_guest_id, valid_session_id
+from llm_client import AsyncLLMClient
 from memory_system import memory_manager, UserProfile, ChatSession
+from prompts import PromptBuilder
+from resilience import ResilientLLMClient
+from session_cache import SessionCache, SharedSessionCache
+from timeline import GRANULARITIES
+from write_behind import snapshot_session
+import metrics
+from metrics import span
 
-# Configure Mistral API via OpenAI client
+# Configure Mistral API (OpenAI-compatible endpoint)
 if "OPENAI_API_KEY" not in os.environ:
     os.environ["OPENAI_API_KEY"] = "BvXava18NiJ5U62jx9bN9RXkSmHC9tSh"
 if "OPENAI_BASE_URL" not in os.environ:
     os.environ["OPENAI_BASE_URL"] = "https://api.mistral.ai/v1"
 
-# Configure OpenAI client
-openai.api_key = os.environ["OPENAI_API_KEY"]
-openai.api_base = os.environ["OPENAI_BASE_URL"]
+# Shared async client: one keep-alive connection pool for all upstream calls,
+# with deadlines, retries, hedging and a circuit breaker in front of it
+llm_client = ResilientLLMClient.from_env(AsyncLLMClient.from_env())
 
-# Initialize Flask app
-app = Flask(__name__)
-CORS(app)  # Allow frontend to connect
+# Caps in-flight turns, serializes each session and rate-limits each client
+admission = AdmissionController.from_env()
 
-class MentalHealthAPI:
-    def __init__(self):
-        self.current_sessions = {}  # session_id -> ChatSession
-        self.user_profiles = {}     # user_id -> UserProfile
-        
-    def get_system_prompt(self, user_context: dict = None):
-        base_prompt = """You are Dr. Sharma, a professional psychologist and mental health counselor with over 15 years of experience. You specialize in psychological issues including sleep disorders, anger management, temperament issues, anxiety, and stress management.
+# Duplicate submissions of a turn share its reply instead of running again
+idempotency = IdempotencyCache.from_env()
 
-YOUR IDENTITY:
-- Name: Dr. Sharma (Dr. Rajesh Sharma)
-- Profession: Licensed Clinical Psychologist
-- Expertise: Sleep disorders, anger management, stress, anxiety, mood disorders
-- Approach: Professional yet warm, evidence-based counseling, culturally sensitive to Indian lifestyle
+# Bearer token for the clinician-facing /users/<user_id>/timeline endpoint;
+# without one the endpoint stays closed
+TIMELINE_API_TOKEN = os.environ.get("TIMELINE_API_TOKEN", "")
 
-CONVERSATION STYLE:
-- Be friendly, approachable, and empathetic, like a trusted family doctor.
-- Use clear, professional English with subtle Indian cultural understanding.
-- Frequently address patients by their name naturally.
-- Reference relatable Indian experiences: work stress, family dynamics, traffic, festivals, cricket.
-- Keep responses concise (2–3 sentences max), warm, and conversational.
-- Ask ONE simple, direct question at a time.
-- Maintain professionalism while being genuinely caring.
-- Avoid using Hindi phrases, asterisked actions, or overly casual expressions.
-
-COUNSELING APPROACH:
-1. **Listen**: Pay close attention to what the patient shares.
-2. **Ask One Question**: Keep focus on one concern at a time.
-3. **Build Gradually**: Collect details slowly through natural conversation.
-4. **Practical Guidance**: Offer small, doable tips that fit daily Indian life.
-5. **Cultural Sensitivity**: Respect Indian values, family dynamics, and social contexts.
-6. **Lifestyle Integration**: Suggest coping strategies using familiar routines.
-
-SPECIALIZATIONS:
-- **Sleep Issues**: Insomnia, irregular schedules, sleep hygiene, relaxation
-- **Anger Management**: Traffic stress, family/work conflicts, calming routines
-- **Temperament**: Mood swings, emotional awareness, family/social stress
-- **General Psychology**: Anxiety, depression, relationship/work stress in Indian context
-
-RESPONSE STRUCTURE:
-- 2–3 sentences maximum, warm and caring
-- Address patient by name naturally when appropriate
-- Ask ONE simple question at the end
-- Reference Indian contexts subtly when relevant
-- Example: "I understand this feels overwhelming. Work pressure can really affect our sleep, especially with long commutes and deadlines. How long have you been experiencing this?"
-
-CRISIS SITUATIONS:
-- If someone mentions suicide, self-harm, or being in danger, immediately provide Indian crisis resources:
-  - AASRA Helpline: +91-98204 66726
-  - Snehi Helpline: +91-95822 17419
-- Encourage reaching out to trusted family or close friends.
-- Always suggest professional, immediate help.
+# Initialize Flask app
+app = Flask(__name__)
+CORS(app)  # Allow frontend to connect
 
-BOUNDARIES:
-- Be professional yet warm, like a caring family doctor
-- Provide evidence-based advice in simple, conversational language
-- Maintain professional boundaries while showing genuine empathy
-- Suggest follow-up sessions to track progress
+def _llm_error_reason(error: Exception) -> str:
+    """Low-cardinality label for a failed model call"""
+    status = getattr(error, "status", None)
+    if status:
+        return f"http_{status}"
+    return type(error.__cause__ or error).__name__
 
-BE PROFESSIONAL: Always respond as Dr. Sharma - knowledgeable, caring, and understanding of Indian life, helping patients improve their mental health with clear, professional communication."""
+def _client_key() -> str:
+    """Rate-limit key: the original client address (first X-Forwarded-For hop behind Render's proxy)"""
+    return request.access_route[0] if request.access_route else (request.remote_addr or "unknown")
 
-        # Add memory context if available
-        if user_context and user_context.get("profile"):
-            profile = user_context["profile"]
-            memory_context = f"""
+def _admit(endpoint: str, user_message: str, session_id):
+    """Admission for one turn, or a 429 response to return instead"""
+    try:
+        granted = admission.acquire(
+            _client_key(), session_id, priority=bool(crisis_detector.detect(user_message))
+        )
+    except AdmissionRejected as e:
+        print(f"🚦 Rejected {endpoint} turn ({e.reason}), retry after {e.retry_after}s")
+        metrics.ADMISSION_REJECTIONS.inc(endpoint=endpoint, reason=e.reason)
+        metrics.REQUESTS.inc(endpoint=endpoint, outcome="rejected")
+        response = jsonify({
+            "error": "Too many requests",
+            "reason": e.reason,
+            "response": BUSY_RESPONSE,
+            "retry_after": e.retry_after,
+            "status": "error"
+        })
+        response.headers["Retry-After"] = str(e.retry_after)
+        return None, (response, 429)
+    metrics.ADMISSION_WAIT_SECONDS.observe(granted.waited)
+    return granted, None
 
-PATIENT HISTORY:
-- Patient Name: {profile.get('name', 'Not provided')}
-- Previous Concerns: {', '.join(user_context.get('key_topics', []))}
-- Mood Patterns: {', '.join(user_context.get('mood_patterns', []))}
-- Previous Treatment Plan: {user_context.get('previous_advice', [])}
-- Follow-up Items: {user_context.get('follow_ups', [])}
+def _begin_turn(endpoint: str, data: dict, user_message: str, session_id):
+    """Idempotency claim for one turn (possibly a replay), or a 409/422 response to return instead"""
+    key = idempotency.request_key(
+        data.get('idempotency_key') or request.headers.get('Idempotency-Key'), session_id, user_message,
+        client=_client_key()
+    )
+    try:
+        turn = idempotency.begin(key, fingerprint(user_message))
+    except KeyReused as e:
+        print(f"🔁 Rejected {endpoint} turn: idempotency key reused for a different message")
+        metrics.REQUESTS.inc(endpoint=endpoint, outcome="bad_request")
+        return None, (jsonify({"error": str(e), "status": "error"}), 422)
+    except RequestInProgress as e:
+        print(f"🔁 Duplicate {endpoint} turn still waiting on the original, retry after {e.retry_after}s")
+        metrics.REQUESTS.inc(endpoint=endpoint, outcome="conflict")
+        response = jsonify({
+            "error": "Duplicate request still in progress",
+            "response": BUSY_RESPONSE,
+            "retry_after": e.retry_after,
+            "status": "error"
+        })
+        response.headers["Retry-After"] = str(e.retry_after)
+        return None, (response, 409)
+    if turn.replayed:
+        print(f"🔁 Duplicate {endpoint} turn answered from the original ({turn.source})")
+        metrics.DUPLICATE_TURNS.inc(endpoint=endpoint, source=turn.source)
+        metrics.REQUESTS.inc(endpoint=endpoint, outcome="replayed")
+    return turn, None
 
-CONTINUITY GUIDELINES:
-- Address patient by name frequently: "{profile.get('name', 'Patient')}, how have you been since our last session?"
-- Review previous concerns and check progress: "Last time we discussed {', '.join(user_context.get('key_topics', ['your concerns']))}, how has that been going?"
-- Follow up on previous advice: "We worked on {user_context.get('previous_advice', ['some strategies'])}, have you been able to practice those?"
-- Build on treatment plan: "Based on our previous sessions, let's continue working on..."
-- Track progress and adjust treatment plan accordingly"""
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload, ensure_ascii=False)}\n\n"
 
-            return base_prompt + memory_context
+class MentalHealthAPI:
+    def __init__(self):
+        session_limits = dict(
+            max_sessions=int(os.environ.get("SESSION_CACHE_MAX_SESSIONS", 1000)),
+            max_messages=int(os.environ.get("SESSION_CACHE_MAX_MESSAGES", 50000)),
+            max_bytes=int(os.environ.get("SESSION_CACHE_MAX_BYTES", 64 * 1024 * 1024)),
+            idle_ttl=float(os.environ.get("SESSION_CACHE_IDLE_TTL", 1800))
+        )
+        if os.environ.get("SHARED_SESSIONS", "0") == "1":
+            # Several worker processes (see wsgi.py): sessions are shared through storage
+            self.current_sessions = SharedSessionCache(
+                memory_manager,
+                lock_dir=os.path.join(memory_manager.data_dir, "locks"),
+                **session_limits
+            )
+        else:
+            self.current_sessions = SessionCache(memory_manager, **session_limits)
+        # session_id -> user_id and user_id -> UserProfile, so known sessions skip resolution
+        self.identities = IdentityMap(
+            max_sessions=int(os.environ.get("IDENTITY_CACHE_SESSIONS", 10000)),
+            max_profiles=int(os.environ.get("IDENTITY_CACHE_PROFILES", 10000)),
+            profile_ttl=float(os.environ.get("IDENTITY_PROFILE_TTL", 300))
+        )
+        self.prompts = PromptBuilder(
+            max_cached=int(os.environ.get("PROMPT_CACHE_BLOCKS", 4096))
+        )
+        self.context_builder = ContextBuilder(
+            max_prompt_tokens=int(os.environ.get("PROMPT_TOKEN_BUDGET", 3000)),
+            max_history_messages=int(os.environ.get("PROMPT_MAX_HISTORY", 10)),
+            summary_tokens=int(os.environ.get("PROMPT_SUMMARY_TOKENS", 300))
+        )
+        # Crisis follow-ups run here, so /chat returns the helplines at once and
+        # a streamed turn is saved even if the client disconnects mid-stream
+        self.background = ThreadPoolExecutor(
+            max_workers=int(os.environ.get("CRISIS_WORKERS", 8)),
+            thread_name_prefix="crisis-follow-up"
+        )
         
-        return base_prompt
-
-    def get_or_create_user(self, user_identifier: str) -> tuple[str, UserProfile]:
-        """Get or create user profile based on identifier (like name)"""
-        user_id = memory_manager.generate_user_id(user_identifier)
+    def get_system_prompt(self, user_context: dict = None):
+        """Persona, then the patient's history (see prompts.py)"""
+        return self.prompts.build(user_context)
+    
+    def get_or_create_user(self, user_identifier: str, user_id: str = None) -> tuple[str, UserProfile]:
+        """Get or create user profile based on identifier (like name)
+        
+        user_id, if given, is used instead of one derived from the identifier
+        (guest identities). Profiles are served from the identity map when
+        this worker has seen the user recently.
+        """
+        user_id = user_id or memory_manager.generate_user_id(user_identifier)
+        
+        profile = self.identities.profile(user_id)
+        if profile:
+            return user_id, profile
         
         # Try to load existing profile
         profile = memory_manager.load_user_profile(user_id)
@@ -126,109 +190,301 @@ CONTINUITY GUIDELINES:
         else:
             print(f"👤 Loaded existing user: {profile.name} (ID: {user_id})")
         
+        self.identities.remember_profile(profile)
         return user_id, profile
 
-    def extract_user_identifier(self, message: str) -> str:
-        """Extract user identifier from message - simple name detection"""
-        message_lower = message.lower()
-        
-        # Look for name patterns
-        name_patterns = [
-            "my name is ",
-            "i'm ",
-            "i am ",
-            "call me ",
-            "this is "
-        ]
-        
-        for pattern in name_patterns:
-            if pattern in message_lower:
-                start_idx = message_lower.find(pattern) + len(pattern)
-                # Get the next word(s) as name
-                remaining = message[start_idx:].strip()
-                name_parts = remaining.split()
-                if name_parts:
-                    # Take first word as name, clean it
-                    name = name_parts[0].strip('.,!?').title()
-                    if len(name) > 1 and name.isalpha():
-                        return name
-        
-        return "User"  # Default identifier
+    def extract_user_identifier(self, message: str) -> Optional[str]:
+        """Extract user identifier from message - an explicit introduction (None if no name)
+        
+        "I'm ..." and "I am ..." are usually feelings, not names, so only
+        "my name is" / "call me" count (see identity.extract_name).
+        """
+        return extract_name(message)
+    
+    def resolve_identity(self, user_message: str, session_id: str = None) -> Identity:
+        """Work out whose turn this is and which session it belongs to, from memory where possible
+        
+        A named user's session keeps its owner: the message isn't scanned. A
+        guest's messages are scanned for an introduction, which moves the
+        conversation into a new session under that name. A message with no
+        (or an unrecognised) session starts one, as a guest unless it names
+        someone. Sessions this worker hasn't seen are only honoured if they
+        exist in storage (one read, which also warms the session cache).
+        """
+        owner = self.identities.owner(session_id, exists=self._session_exists) if session_id else None
+        if owner and not is_guest(owner):
+            return Identity(owner, session_id)
+        
+        name = self.extract_user_identifier(user_message)
+        if name:
+            user_id = memory_manager.generate_user_id(name)
+            carried_from = session_id if owner else None
+        elif owner:
+            return Identity(owner, session_id)
+        else:
+            user_id = new_guest_id()
+            carried_from = None
+        
+        new_session_id = memory_manager.create_session_id(user_id)
+        self.identities.bind(new_session_id, user_id)
+        return Identity(user_id, new_session_id, name=name or "", new_session=True, carried_from=carried_from)
+    
+    def _session_exists(self, user_id: str, session_id: str) -> bool:
+        """Whether a session parsed from a client's ID is real; loads it into the live cache"""
+        return self.current_sessions.get(user_id, session_id) is not None
+    
+    def _start_session(self, identity: Identity) -> ChatSession:
+        """A new live session; a guest who just gave their name keeps the conversation so far"""
+        session = None
+        if identity.carried_from:
+            previous = self.current_sessions.get(self.identities.owner(identity.carried_from), identity.carried_from)
+            if previous:
+                session = snapshot_session(previous)
+                session.session_id = identity.session_id
+                session.user_id = identity.user_id
+        if session is None:
+            session = ChatSession(
+                session_id=identity.session_id,
+                user_id=identity.user_id
+            )
+        self.current_sessions.put(session)
+        return session
 
-    def get_response(self, user_message: str, session_id: str = None) -> tuple[str, str]:
-        """Get AI response with memory context"""
-        try:
-            # Extract user identifier if this seems like an introduction
-            user_identifier = self.extract_user_identifier(user_message)
-            user_id, profile = self.get_or_create_user(user_identifier)
-            
-            # Get or create session
-            if not session_id:
-                session_id = memory_manager.create_session_id(user_id)
+    def _prepare_turn(self, user_message: str, session_id: str = None, identity: Identity = None):
+        """Resolve user and session, and build the message list for the model"""
+        with span("resolve_user"):
+            identity = identity or self.resolve_identity(user_message, session_id)
+        with span("load_profile"):
+            user_id, profile = self.get_or_create_user(identity.name or "User", identity.user_id)
+        session_id = identity.session_id
+        
+        # Live session from memory, reloaded from storage if it was evicted
+        with span("load_session"):
+            current_session = None
+            if not identity.new_session:
+                current_session = self.current_sessions.get(user_id, session_id)
+            if current_session is None:
+                current_session = self._start_session(identity)
+        
+        # Get user context for AI
+        with span("build_context"):
+            user_context = memory_manager.get_user_context(user_id)
+        
+        # Earlier exchanges that resemble this message, from any past session
+        with span("retrieve"):
+            memories = memory_manager.recall(user_id, user_message, exclude_session_id=session_id)
+        
+        # Prepare messages for API call: system prompt, session summary, memories,
+        # the history that fits the token budget, then the current user message
+        with span("build_prompt"):
+            messages, prompt_stats, summary = self.context_builder.build(
+                self.get_system_prompt(user_context), current_session, user_message,
+                self.prompts.memories_section(user_context, memories)
+            )
+        metrics.LLM_TOKENS.inc(prompt_stats["prompt_tokens"], kind="prompt")
+        print(f"📏 Prompt ~{prompt_stats['prompt_tokens']} tokens "
+              f"({prompt_stats['history_messages']} history messages, {prompt_stats['folded_messages']} folded)")
+        
+        return session_id, profile, current_session, messages, summary
+    
+    def _finish_turn(self, profile: UserProfile, current_session: ChatSession, user_message: str,
+                     ai_response: str, risk_level: str = None, summary: SummaryUpdate = None):
+        """Record a completed exchange and persist session and profile
+        
+        summary is the rolling summary the turn's prompt was built with; it is
+        stored with the exchange, under the same commit.
+        """
+        metrics.LLM_TOKENS.inc(estimate_tokens(ai_response), kind="completion")
+        
+        def apply(session: ChatSession):
+            if summary:
+                summary.apply(session)
+            memory_manager.update_session_data(session, user_message, ai_response)
+            if risk_level:
+                session.risk_level = risk_level
+        
+        with span("persist"):
+            # Update session with new conversation and save it
+            current_session = self.current_sessions.commit(current_session, apply)
             
-            if session_id not in self.current_sessions:
-                # Try to load existing session or create new one
-                existing_sessions = memory_manager.load_user_sessions(user_id, limit=1)
-                if existing_sessions and existing_sessions[0].session_id == session_id:
-                    self.current_sessions[session_id] = existing_sessions[0]
-                else:
-                    self.current_sessions[session_id] = ChatSession(
-                        session_id=session_id,
-                        user_id=user_id
-                    )
+            # Save profile
+            memory_manager.save_user_profile(profile)
+        
+        print(f"✅ Mistral responded to {profile.name}: {ai_response[:50]}...")
+        print(f"💾 Session saved: {current_session.session_id}")
+
+    def _crisis_follow_up(self, user_message: str, identity: Identity, on_token=None,
+                          admission: Admission = None) -> str:
+        """Get the model's follow-up to a crisis message and persist the turn
+        (helplines + follow-up) with the session marked high risk
+        
+        on_token, if given, receives each follow-up token and finally None.
+        admission, if given, first waits for the session's turn lock, so the
+        turn is saved before the session takes its next one.
+        Returns the full reply; the helplines alone if the turn couldn't be built.
+        """
+        session_id = identity.session_id
+        reply = CRISIS_RESPONSE
+        try:
+            if admission:
+                admission.hold_session(session_id)
+            session_id, profile, current_session, messages, summary = self._prepare_turn(user_message, identity=identity)
+            messages[0]["content"] += FOLLOW_UP_INSTRUCTION
             
-            current_session = self.current_sessions[session_id]
+            parts = []
+            try:
+                with span("llm"):
+                    for token in llm_client.stream(messages, max_tokens=500, temperature=0.7, priority=True):
+                        parts.append(token)
+                        if on_token:
+                            on_token(token)
+            except Exception as e:
+                # The helplines already went out; keep whatever follow-up arrived
+                metrics.LLM_ERRORS.inc(reason=_llm_error_reason(e))
+                print(f"❌ Crisis follow-up from Mistral failed: {e}")
             
-            # Get user context for AI
-            user_context = memory_manager.get_user_context(user_id)
+            reply = crisis_reply("".join(parts).strip())
+            self._finish_turn(profile, current_session, user_message, reply, risk_level="high", summary=summary)
+        except Exception as e:
+            print(f"❌ Error recording crisis turn for session {session_id}: {e}")
+        finally:
+            if on_token:
+                on_token(None)
+        return reply
+    
+    def get_response(self, user_message: str, session_id: str = None,
+                     admission: Admission = None) -> tuple[str, str]:
+        """Get AI response with memory context
+        
+        Crisis turns are answered with the helplines at once. The model's
+        follow-up is saved from a background task, which takes over admission
+        (if given) and holds the session's turn lock until the turn is saved.
+        """
+        if crisis_detector.detect(user_message):
+            identity = self.resolve_identity(user_message, session_id)
+            session_id = identity.session_id
+            print(f"🆘 Crisis language detected, answering with helplines (session {session_id})")
+            metrics.CRISIS_TURNS.inc(endpoint="chat")
+            metrics.REQUESTS.inc(endpoint="chat", outcome="crisis")
             
-            # Prepare messages for API call
-            messages = [
-                {"role": "system", "content": self.get_system_prompt(user_context)}
-            ]
+            follow_up_admission = admission.transfer() if admission else None
+            if follow_up_admission:
+                # Nobody else knows a new session's ID yet, so this only misses
+                # when another turn of an existing session is in flight
+                follow_up_admission.hold_session(session_id, blocking=False)
             
-            # Add recent conversation history
-            recent_messages = current_session.messages[-10:]  # Last 10 messages
-            for msg in recent_messages:
-                messages.append({
-                    "role": msg["role"],
-                    "content": msg["content"]
-                })
+            def follow_up():
+                with follow_up_admission or nullcontext():
+                    self._crisis_follow_up(user_message, identity, admission=follow_up_admission)
             
-            # Add current user message
-            messages.append({
-                "role": "user",
-                "content": user_message
-            })
+            self.background.submit(follow_up)
+            return crisis_reply(None), session_id
+        
+        try:
+            session_id, profile, current_session, messages, summary = self._prepare_turn(user_message, session_id)
             
             print(f"🧠 Sending to Mistral (User: {profile.name}): {user_message[:50]}...")
             
             # Call Mistral API
-            response = openai.ChatCompletion.create(
-                model="mistral-medium-latest",
-                messages=messages,
-                max_tokens=500,
-                temperature=0.7
-            )
+            try:
+                with span("llm"):
+                    ai_response = llm_client.complete(
+                        messages,
+                        max_tokens=500,
+                        temperature=0.7
+                    )
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(reason=_llm_error_reason(e))
+                raise
             
-            ai_response = response.choices[0].message.content.strip()
+            self._finish_turn(profile, current_session, user_message, ai_response, summary=summary)
             
-            # Update session with new conversation
-            memory_manager.update_session_data(current_session, user_message, ai_response)
+            metrics.REQUESTS.inc(endpoint="chat", outcome="success")
+            return ai_response, session_id
             
-            # Save session and profile
-            memory_manager.save_session(current_session)
-            memory_manager.save_user_profile(profile)
+        except Exception as e:
+            print(f"❌ Error calling Mistral API: {e}")
+            metrics.FALLBACKS.inc(reason="error")
+            metrics.REQUESTS.inc(endpoint="chat", outcome="fallback")
+            return FALLBACK_RESPONSE, session_id or "error_session"
+
+    def stream_response(self, user_message: str, session_id: str = None, admission: Admission = None):
+        """Stream AI response as (event, data) pairs while the model generates it
+        
+        Yields ("session", {...}) first, then ("token", {...}) for every delta and
+        finally ("done", {...}). The session is only persisted once the model has
+        finished, so an aborted stream leaves no half-written turn behind.
+        
+        Crisis turns stream the helplines first, before the user is resolved,
+        then the session and the model's follow-up. They are persisted even if
+        the client disconnects, and the stream doesn't end (or release
+        admission, whose session lock the follow-up takes) until they are.
+        """
+        started = time.perf_counter()
+        if crisis_detector.detect(user_message):
+            yield "token", {"token": CRISIS_RESPONSE + "\n\n"}
+            metrics.FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
             
-            print(f"✅ Mistral responded to {profile.name}: {ai_response[:50]}...")
-            print(f"💾 Session saved: {session_id}")
+            identity = self.resolve_identity(user_message, session_id)
+            session_id = identity.session_id
+            print(f"🆘 Crisis language detected, streamed helplines first (session {session_id})")
+            metrics.CRISIS_TURNS.inc(endpoint="chat_stream")
+            metrics.REQUESTS.inc(endpoint="chat_stream", outcome="crisis")
+            if admission:
+                admission.hold_session(session_id, blocking=False)
+            yield "session", {"session_id": session_id}
             
-            return ai_response, session_id
+            tokens = queue.Queue()
+            follow_up = self.background.submit(self._crisis_follow_up, user_message, identity, tokens.put, admission)
+            try:
+                for token in iter(tokens.get, None):
+                    yield "token", {"token": token}
+                yield "done", {"response": follow_up.result(), "session_id": session_id}
+            finally:
+                # A disconnected client lands here too: wait for the save
+                follow_up.result()
+            return
+        
+        try:
+            session_id, profile, current_session, messages, summary = self._prepare_turn(user_message, session_id)
+            yield "session", {"session_id": session_id}
+            
+            print(f"🧠 Streaming from Mistral (User: {profile.name}): {user_message[:50]}...")
+            
+            # Call Mistral API in streaming mode; the llm span counts time spent
+            # waiting on the model, not on the client reading each token
+            parts = []
+            llm_seconds = 0.0
+            tokens = llm_client.stream(messages, max_tokens=500, temperature=0.7)
+            try:
+                while True:
+                    waited = time.perf_counter()
+                    token = next(tokens, None)
+                    llm_seconds += time.perf_counter() - waited
+                    if token is None:
+                        break
+                    if not parts:
+                        metrics.FIRST_TOKEN_SECONDS.observe(time.perf_counter() - started)
+                    parts.append(token)
+                    yield "token", {"token": token}
+            except Exception as e:
+                metrics.LLM_ERRORS.inc(reason=_llm_error_reason(e))
+                raise
+            finally:
+                metrics.STAGE_SECONDS.observe(llm_seconds, stage="llm")
+            
+            ai_response = "".join(parts).strip()
+            
+            self._finish_turn(profile, current_session, user_message, ai_response, summary=summary)
+            
+            metrics.REQUESTS.inc(endpoint="chat_stream", outcome="success")
+            yield "done", {"response": ai_response, "session_id": session_id}
             
         except Exception as e:
-            print(f"❌ Error calling Mistral API: {e}")
-            error_response = "I apologize, but I'm experiencing technical difficulties right now. Please try again in a moment. If you're in crisis, please contact 988 immediately."
-            return error_response, session_id or "error_session"
+            print(f"❌ Error streaming from Mistral API: {e}")
+            metrics.FALLBACKS.inc(reason="error")
+            metrics.REQUESTS.inc(endpoint="chat_stream", outcome="fallback")
+            yield "error", {"response": FALLBACK_RESPONSE, "session_id": session_id or "error_session"}
 
 # Global API instance
 mental_health_api = MentalHealthAPI()
@@ -236,22 +492,45 @@ mental_health_api = MentalHealthAPI()
 @app.route('/chat', methods=['POST'])
 def chat():
     """Handle chat requests"""
+    started = time.perf_counter()
     try:
         data = request.get_json()
         
         if not data:
+            metrics.REQUESTS.inc(endpoint="chat", outcome="bad_request")
             return jsonify({"error": "No data provided", "status": "error"}), 400
         
         user_message = data.get('message', '').strip()
-        session_id = data.get('session_id')  # Optional session ID from frontend
+        # Optional session ID from frontend; anything that isn't one of ours starts a new session
+        session_id = data.get('session_id') if valid_session_id(data.get('session_id')) else None
         
         if not user_message:
+            metrics.REQUESTS.inc(endpoint="chat", outcome="bad_request")
             return jsonify({"error": "Message is required", "status": "error"}), 400
         
         print(f"👤 Message: {user_message}")
         
-        # Get AI response with memory
-        ai_response, returned_session_id = mental_health_api.get_response(user_message, session_id)
+        # Admission first: a copy waiting on its original holds a slot like any turn
+        granted, rejection = _admit("chat", user_message, session_id)
+        if rejection:
+            return rejection
+        
+        with granted:
+            turn, conflict = _begin_turn("chat", data, user_message, session_id)
+            if conflict:
+                return conflict
+            if turn.replayed:
+                return jsonify(dict(turn.result, status="success", replayed=True))
+            
+            try:
+                # Get AI response with memory
+                ai_response, returned_session_id = mental_health_api.get_response(user_message, session_id, granted)
+                
+                # Fallback replies aren't kept, so a retry gets a real answer
+                turn.complete({"response": ai_response, "session_id": returned_session_id},
+                              cacheable=ai_response != FALLBACK_RESPONSE)
+            finally:
+                turn.abandon()
         
         # Send response with session ID
         return jsonify({
@@ -262,7 +541,75 @@ def chat():
         
     except Exception as e:
         print(f"❌ Server error: {e}")
+        metrics.REQUESTS.inc(endpoint="chat", outcome="error")
         return jsonify({"error": "Internal server error", "status": "error"}), 500
+    finally:
+        metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat")
+
+@app.route('/chat/stream', methods=['POST'])
+def chat_stream():
+    """Handle chat requests, streaming tokens back as Server-Sent Events"""
+    started = time.perf_counter()
+    data = request.get_json(silent=True)
+    
+    if not data:
+        metrics.REQUESTS.inc(endpoint="chat_stream", outcome="bad_request")
+        return jsonify({"error": "No data provided", "status": "error"}), 400
+    
+    user_message = data.get('message', '').strip()
+    # Optional session ID from frontend; anything that isn't one of ours starts a new session
+    session_id = data.get('session_id') if valid_session_id(data.get('session_id')) else None
+    
+    if not user_message:
+        metrics.REQUESTS.inc(endpoint="chat_stream", outcome="bad_request")
+        return jsonify({"error": "Message is required", "status": "error"}), 400
+    
+    print(f"👤 Message (stream): {user_message}")
+    
+    # Admission first: a copy waiting on its original holds a slot like any turn
+    granted, rejection = _admit("chat_stream", user_message, session_id)
+    if rejection:
+        return rejection
+    
+    turn, conflict = _begin_turn("chat_stream", data, user_message, session_id)
+    if conflict:
+        granted.release()
+        return conflict
+    if turn.replayed:
+        granted.release()
+        
+        def replay():
+            # The whole reply as one token, so the page renders it like any other
+            yield _sse("session", {"session_id": turn.result["session_id"]})
+            yield _sse("token", {"token": turn.result["response"]})
+            yield _sse("done", dict(turn.result, replayed=True))
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat_stream")
+        return Response(replay(), mimetype='text/event-stream', headers={"Cache-Control": "no-cache"})
+    
+    def generate():
+        # The admission is held until the stream ends or the client disconnects
+        try:
+            for event, payload in mental_health_api.stream_response(user_message, session_id, granted):
+                if event == "done":
+                    turn.complete({"response": payload["response"], "session_id": payload["session_id"]})
+                yield _sse(event, payload)
+        finally:
+            turn.abandon()
+            granted.release()
+            metrics.REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint="chat_stream")
+    
+    def closed():
+        turn.abandon()
+        granted.release()
+    
+    response = Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+    # Also covers a client that disconnects before the stream starts
+    response.call_on_close(closed)
+    return response
 
 @app.route('/health', methods=['GET'])
 def health():
@@ -270,9 +617,74 @@ def health():
     return jsonify({
         "status": "healthy", 
         "service": "Mental Health API",
-        "ai": "Mistral"
+        "ai": "Mistral",
+        "context_cache": memory_manager.context_cache.stats(),
+        "session_cache": mental_health_api.current_sessions.stats(),
+        "identities": mental_health_api.identities.stats(),
+        "prompt": mental_health_api.context_builder.stats(),
+        "system_prompt": mental_health_api.prompts.stats(),
+        "write_behind": memory_manager.writer.stats() if memory_manager.writer else None,
+        "archive": memory_manager.archiver.stats() if memory_manager.archiver else None,
+        "upstream": llm_client.stats(),
+        "admission": admission.stats(),
+        "idempotency": idempotency.stats(),
+        "retrieval": memory_manager.retrieval.stats() if memory_manager.retrieval else None,
+        "indexer": memory_manager.indexer.stats() if memory_manager.indexer else None,
+        "timeline": memory_manager.timelines.stats() if memory_manager.timelines else None
     })
 
+@app.route('/users/<user_id>/timeline', methods=['GET'])
+def user_timeline(user_id):
+    """Mood and topic counts per day or week, with streaks and last-seen days"""
+    if not TIMELINE_API_TOKEN:
+        return jsonify({"error": "Timeline access is not configured", "status": "error"}), 403
+    supplied = request.headers.get("Authorization", "")
+    if not hmac.compare_digest(supplied.encode("utf-8"), f"Bearer {TIMELINE_API_TOKEN}".encode("utf-8")):
+        return jsonify({"error": "Unauthorized", "status": "error"}), 401
+    
+    granularity = request.args.get("granularity", "day")
+    try:
+        days = int(request.args.get("days", 90))
+    except ValueError:
+        days = 0
+    if not USER_ID_PATTERN.fullmatch(user_id) or granularity not in GRANULARITIES or days < 1:
+        return jsonify({"error": f"Expected a user ID, granularity in {list(GRANULARITIES)} and days >= 1",
+                        "status": "error"}), 400
+    
+    timeline = memory_manager.get_timeline(user_id, granularity, days)
+    if timeline is None:
+        return jsonify({"error": "Timelines are unavailable", "status": "error"}), 503
+    if not timeline["total_sessions"]:
+        # Users who predate timelines get one built in the background; ask again later
+        return jsonify({"error": "No sessions for this user (yet)", "status": "error"}), 404
+    return jsonify(dict(timeline, status="success"))
+
+@app.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    """Prometheus scrape endpoint: stage latency histograms, token and error counters"""
+    return Response(metrics.registry.render(), mimetype='text/plain; version=0.0.4')
+
+# Point-in-time gauges, read on every scrape
+metrics.registry.gauge(
+    "session_cache_sessions", "Live sessions held in memory",
+    lambda: mental_health_api.current_sessions.stats()["sessions"])
+metrics.registry.gauge(
+    "context_cache_entries", "User contexts held in the context cache",
+    lambda: memory_manager.context_cache.stats()["size"])
+metrics.registry.gauge(
+    "write_behind_pending", "Saves queued but not yet written",
+    lambda: memory_manager.writer.stats()["pending"] if memory_manager.writer else 0)
+metrics.registry.gauge(
+    "llm_circuit_state", "1 for the upstream circuit breaker's current state",
+    lambda: {state: int(llm_client.breaker.state == state) for state in ("closed", "open", "half_open")},
+    labelname="state")
+metrics.registry.gauge(
+    "chat_in_flight", "Chat turns currently admitted",
+    lambda: admission.stats()["in_flight"])
+metrics.registry.gauge(
+    "chat_queued", "Chat turns waiting for an in-flight slot",
+    lambda: admission.stats()["queued"])
+
 @app.route('/', methods=['GET'])
 def home():
     """Home endpoint"""
@@ -280,7 +692,10 @@ def home():
         "message": "Mental Health AI Chat API",
         "endpoints": {
             "chat": "/chat (POST)",
-            "health": "/health (GET)"
+            "chat_stream": "/chat/stream (POST, text/event-stream)",
+            "health": "/health (GET)",
+            "timeline": "/users/<user_id>/timeline (GET, bearer token)",
+            "metrics": "/metrics (GET, Prometheus text)"
         },
         "ai": "Mistral Medium"
     })
@@ -289,8 +704,11 @@ if __name__ == "__main__":
     port = int(os.environ.get('PORT', 8000))
     print(f"🚀 Mental Health API Server starting on port {port}")
     print(f"🔗 Endpoint: http://localhost:{port}/chat")
-    print(f"🧠 Powered by Mistral AI (mistral-medium-latest)")
+    print(f"🧠 Powered by Mistral AI ({llm_client.model})")
     print("💚 Ready to provide empathetic mental health support!")
     print("\n" + "="*60)
     
+    # Turn SIGTERM (Render shutdown) into a normal exit so queued writes are drained
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    
     app.run(host='0.0.0.0', port=port, debug=False)
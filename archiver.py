@@ -0,0 +1,457 @@
+#!/usr/bin/env python3
+"""
+Cold-session archival for the file storage backend
+
+Sessions nobody has touched for ARCHIVE_AFTER_DAYS are moved out of
+user_data/sessions/<user_id>/ into one pack file per user:
+
+    user_data/archive/<user_id>.pack   append-only; one zlib-compressed
+                                       session snapshot per record
+    user_data/archive/<user_id>.idx    JSON offset index: each archived
+                                       session's header, offset and length
+
+A record is a 12-byte header (magic, compressed length, CRC-32) followed by
+the compressed JSON of ChatSession.to_dict(), so a lost or stale index can be
+rebuilt by scanning the pack. Packs are read through mmap: loading an
+archived session is a slice, a checksum and a decompress, with no per-file
+open. Archiving a session again (it was resumed, then went cold) appends a
+new record that supersedes the old one.
+
+The storage backend lists archived sessions in the user's manifest and falls
+back to the archive in load_session, so MemoryManager reads them like any
+other session. A per-user cap (ARCHIVE_MAX_USER_MB) drops the oldest archived
+sessions once a user's live and archived sessions and search index together
+exceed it, removes their snippets from the search index, and packs are
+rewritten without dropped or superseded records. Recent sessions are never
+dropped.
+
+Usage (one pass, e.g. from cron; the server also runs one every ARCHIVE_INTERVAL):
+    python archiver.py
+    python archiver.py --data-dir user_data --older-than-days 30 --max-user-mb 50
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import threading
+import zlib
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from models import ChatSession
+
+PACK_MAGIC = b"MHS1"
+RECORD_HEADER = struct.Struct(">4sII")  # magic, compressed length, CRC-32 of the compressed bytes
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def _stat_stamp(path: str):
+    st = os.stat(path)
+    return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+
+def _fsync(path: str):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+class SessionArchive:
+    """Per-user compressed pack files with an offset index, read through mmap
+
+    Callers serialize writers for a user (FileStorageBackend holds the user's
+    file lock); reads may run concurrently with writes from any process.
+    """
+
+    def __init__(self, archive_dir: str, compression_level: int = 6, max_open_maps: int = 64):
+        self.archive_dir = archive_dir
+        self.compression_level = compression_level
+        self.max_open_maps = max_open_maps
+        self._indexes = {}  # user_id -> (index file stat stamp, index)
+        self._maps: "OrderedDict[str, Tuple[Any, mmap.mmap]]" = OrderedDict()  # user_id -> (pack stamp, map)
+        self._lock = threading.RLock()
+
+        self.reads = 0
+        self.archived = 0
+        self.dropped = 0
+        self.rewrites = 0
+
+        os.makedirs(archive_dir, exist_ok=True)
+
+    def _pack_path(self, user_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{user_id}.pack")
+
+    def _index_path(self, user_id: str) -> str:
+        return os.path.join(self.archive_dir, f"{user_id}.idx")
+
+    def users(self) -> List[str]:
+        return sorted(filename[:-5] for filename in os.listdir(self.archive_dir) if filename.endswith(".pack"))
+
+    # Index
+
+    def _index(self, user_id: str) -> Dict[str, Any]:
+        """The user's index, rebuilt from the pack if missing or not for this pack"""
+        with self._lock:
+            try:
+                pack = os.stat(self._pack_path(user_id))
+            except FileNotFoundError:
+                return {"pack_inode": None, "pack_size": 0, "sessions": {}}
+
+            index_path = self._index_path(user_id)
+            try:
+                stamp = _stat_stamp(index_path)
+            except FileNotFoundError:
+                return self._rebuild_index(user_id)
+
+            cached = self._indexes.get(user_id)
+            if cached and cached[0] == stamp:
+                index = cached[1]
+            else:
+                try:
+                    with open(index_path, 'r', encoding='utf-8') as f:
+                        index = json.load(f)
+                except ValueError:
+                    return self._rebuild_index(user_id)
+                self._indexes[user_id] = (stamp, index)
+
+            # Bytes past pack_size are an append in progress or a torn one, and
+            # don't affect the entries; a different inode means a crash between
+            # swapping in a rewritten pack and writing its index
+            if index.get("pack_inode") != pack.st_ino or index.get("pack_size", 0) > pack.st_size:
+                return self._rebuild_index(user_id)
+            return index
+
+    def _rebuild_index(self, user_id: str) -> Dict[str, Any]:
+        """Scan every record in the pack; later records for a session win"""
+        sessions = {}
+        offset = 0
+        with open(self._pack_path(user_id), 'rb') as f:
+            inode = os.fstat(f.fileno()).st_ino
+            data = f.read()
+        while offset + RECORD_HEADER.size <= len(data):
+            magic, length, crc = RECORD_HEADER.unpack_from(data, offset)
+            payload = data[offset + RECORD_HEADER.size:offset + RECORD_HEADER.size + length]
+            if magic != PACK_MAGIC or len(payload) != length or zlib.crc32(payload) != crc:
+                break  # torn append at the tail
+            record = json.loads(zlib.decompress(payload))
+            session = ChatSession.from_dict(record["session"])
+            sessions[session.session_id] = self._index_entry(session, record["updated_at"], offset, length, crc)
+            offset += RECORD_HEADER.size + length
+
+        if offset < len(data):
+            print(f"❌ Ignoring {len(data) - offset} unreadable bytes at the end of {user_id}'s archive")
+        index = {"pack_inode": inode, "pack_size": offset, "sessions": sessions}
+        self._write_index(user_id, index)
+        print(f"🗂️ Rebuilt archive index for {user_id} ({len(sessions)} sessions)")
+        return index
+
+    @staticmethod
+    def _index_entry(session: ChatSession, updated_at: str, offset: int, length: int, crc: int) -> Dict[str, Any]:
+        return dict(session.header(), updated_at=updated_at, offset=offset, length=length, crc=crc)
+
+    def _write_index(self, user_id: str, index: Dict[str, Any]):
+        index_path = self._index_path(user_id)
+        tmp_path = _tmp_path(index_path)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_dumps(index))
+        os.replace(tmp_path, index_path)
+        self._indexes[user_id] = (_stat_stamp(index_path), index)
+
+    def entries(self, user_id: str) -> List[Dict[str, Any]]:
+        """Headers of the user's archived sessions, most recently updated first"""
+        sessions = self._index(user_id)["sessions"].values()
+        return sorted(sessions, key=lambda entry: entry["updated_at"], reverse=True)
+
+    def contains(self, user_id: str, session_id: str) -> bool:
+        return session_id in self._index(user_id)["sessions"]
+
+    def version(self, user_id: str, session_id: str) -> Optional[Any]:
+        entry = self._index(user_id)["sessions"].get(session_id)
+        return ("archive", entry["offset"]) if entry else None
+
+    def size(self, user_id: str) -> Tuple[int, int]:
+        """(pack bytes on disk, bytes of records still in use)"""
+        index = self._index(user_id)
+        live = sum(RECORD_HEADER.size + entry["length"] for entry in index["sessions"].values())
+        return index["pack_size"], live
+
+    # Reads
+
+    def _map(self, user_id: str) -> Optional[mmap.mmap]:
+        """A read-only map of the user's pack, remapped when the pack changes"""
+        pack_path = self._pack_path(user_id)
+        try:
+            stamp = _stat_stamp(pack_path)
+        except FileNotFoundError:
+            return None
+        cached = self._maps.get(user_id)
+        if cached and cached[0] == stamp:
+            self._maps.move_to_end(user_id)
+            return cached[1]
+        if cached:
+            cached[1].close()
+        if stamp[1] == 0:
+            return None
+        with open(pack_path, 'rb') as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._maps[user_id] = (stamp, mapped)
+        self._maps.move_to_end(user_id)
+        while len(self._maps) > self.max_open_maps:
+            self._maps.popitem(last=False)[1][1].close()
+        return mapped
+
+    def _read_payload(self, user_id: str, entry: Dict[str, Any]) -> Optional[bytes]:
+        """The compressed record for an index entry, checked against its CRC"""
+        mapped = self._map(user_id)
+        start = entry["offset"] + RECORD_HEADER.size
+        if mapped is None or start + entry["length"] > len(mapped):
+            return None
+        payload = mapped[start:start + entry["length"]]
+        if zlib.crc32(payload) != entry["crc"]:
+            return None
+        return payload
+
+    def load(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        with self._lock:
+            entry = self._index(user_id)["sessions"].get(session_id)
+            if entry is None:
+                return None
+            payload = self._read_payload(user_id, entry)
+            if payload is None:
+                # The index is out of step with the pack; trust the pack
+                self._rebuild_index(user_id)
+                entry = self._index(user_id)["sessions"].get(session_id)
+                payload = self._read_payload(user_id, entry) if entry else None
+                if payload is None:
+                    raise ValueError(f"Archived session {session_id} is unreadable")
+            self.reads += 1
+        return ChatSession.from_dict(json.loads(zlib.decompress(payload))["session"])
+
+    # Writes
+
+    def _encode(self, session: ChatSession, updated_at: str) -> bytes:
+        record = {"session": session.to_dict(), "updated_at": updated_at}
+        return zlib.compress(_dumps(record).encode("utf-8"), self.compression_level)
+
+    def append(self, user_id: str, sessions: List[Tuple[ChatSession, str]]):
+        """Add (session, updated_at) pairs to the pack; durable before this returns"""
+        if not sessions:
+            return
+        with self._lock:
+            index = self._index(user_id)
+            pack_path = self._pack_path(user_id)
+            offset = index["pack_size"]
+            entries = {}
+            chunks = []
+            for session, updated_at in sessions:
+                payload = self._encode(session, updated_at)
+                crc = zlib.crc32(payload)
+                chunks.append(RECORD_HEADER.pack(PACK_MAGIC, len(payload), crc) + payload)
+                entries[session.session_id] = self._index_entry(session, updated_at, offset, len(payload), crc)
+                offset += len(chunks[-1])
+
+            with open(pack_path, 'ab') as f:
+                f.truncate(index["pack_size"])  # drop any torn tail left by a crash
+                f.write(b"".join(chunks))
+                f.flush()
+                os.fsync(f.fileno())
+                inode = os.fstat(f.fileno()).st_ino
+            sessions_index = dict(index["sessions"])
+            sessions_index.update(entries)
+            self._write_index(user_id, {"pack_inode": inode, "pack_size": offset, "sessions": sessions_index})
+            _fsync(self.archive_dir)
+            self.archived += len(entries)
+
+    def rewrite(self, user_id: str, drop: List[str] = ()) -> int:
+        """Rewrite the pack without the given sessions or superseded records; bytes reclaimed
+
+        Compressed records are copied across as they are.
+        """
+        with self._lock:
+            index = self._index(user_id)
+            pack_path = self._pack_path(user_id)
+            drop = set(drop) & set(index["sessions"])
+            kept = [entry for session_id, entry in index["sessions"].items() if session_id not in drop]
+            kept.sort(key=lambda entry: entry["offset"])
+
+            tmp_path = _tmp_path(pack_path)
+            sessions = {}
+            offset = 0
+            with open(tmp_path, 'wb') as f:
+                for entry in kept:
+                    payload = self._read_payload(user_id, entry)
+                    if payload is None:
+                        print(f"❌ Dropping unreadable archived session {entry['session_id']}")
+                        continue
+                    f.write(RECORD_HEADER.pack(PACK_MAGIC, len(payload), entry["crc"]) + payload)
+                    sessions[entry["session_id"]] = dict(entry, offset=offset)
+                    offset += RECORD_HEADER.size + len(payload)
+                f.flush()
+                os.fsync(f.fileno())
+                inode = os.fstat(f.fileno()).st_ino
+
+            os.replace(tmp_path, pack_path)
+            self._write_index(user_id, {"pack_inode": inode, "pack_size": offset, "sessions": sessions})
+            _fsync(self.archive_dir)
+            self.dropped += len(drop)
+            self.rewrites += 1
+            return index["pack_size"] - offset
+
+    def close(self):
+        with self._lock:
+            for _, mapped in self._maps.values():
+                mapped.close()
+            self._maps.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "reads": self.reads,
+                "archived": self.archived,
+                "dropped": self.dropped,
+                "rewrites": self.rewrites,
+                "open_maps": len(self._maps),
+            }
+
+
+class SessionArchiver:
+    """Background pass that archives cold sessions and enforces the per-user cap"""
+
+    # Rewrite a pack once this share of it is superseded or dropped records
+    GARBAGE_RATIO = 0.5
+
+    def __init__(self, backend, archive_after_days: float = 30.0, max_user_bytes: int = 0,
+                 interval: float = 3600.0, retrieval=None):
+        self.backend = backend
+        self.retrieval = retrieval  # RetrievalIndex to forget dropped sessions in, if any
+        self.archive_after_days = archive_after_days
+        self.max_user_bytes = max_user_bytes
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+        self.passes = 0
+        self.archived = 0
+        self.dropped = 0
+        self.reclaimed_bytes = 0
+        self.errors = 0
+        self.last_pass = ""
+
+    @classmethod
+    def from_env(cls, backend, retrieval=None) -> "SessionArchiver":
+        """Build an archiver from ARCHIVE_* environment settings"""
+        return cls(
+            backend,
+            archive_after_days=float(os.environ.get("ARCHIVE_AFTER_DAYS", 30)),
+            max_user_bytes=int(float(os.environ.get("ARCHIVE_MAX_USER_MB", 0)) * 1024 * 1024),
+            interval=float(os.environ.get("ARCHIVE_INTERVAL", 3600)),
+            retrieval=retrieval,
+        )
+
+    def start(self) -> "SessionArchiver":
+        if self.interval > 0 and self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="archiver", daemon=True)
+            self._thread.start()
+        return self
+
+    def _run(self):
+        # Server workers all run one of these; staggering keeps their passes apart
+        if self._stop.wait(random.uniform(0.1, 1.0) * self.interval):
+            return
+        while True:
+            self.run_once()
+            if self._stop.wait(self.interval):
+                return
+
+    def run_once(self) -> Dict[str, int]:
+        """Archive and trim every user once"""
+        cutoff = (datetime.now() - timedelta(days=self.archive_after_days)).isoformat()
+        archived = dropped = reclaimed = 0
+        for user_id in self.backend.list_users():
+            if self._stop.is_set():
+                break
+            try:
+                archived += self.backend.archive_sessions(user_id, cutoff)
+                index_bytes = None
+                if self.retrieval and self.max_user_bytes:
+                    index_bytes = self.retrieval.session_bytes(user_id)
+                expired, user_reclaimed = self.backend.trim_archive(
+                    user_id, self.max_user_bytes, self.GARBAGE_RATIO, index_bytes)
+                if expired and self.retrieval:
+                    self.retrieval.drop_sessions(user_id, expired)
+                dropped += len(expired)
+                reclaimed += user_reclaimed
+            except Exception as e:
+                self.errors += 1
+                print(f"❌ Error archiving sessions for {user_id}: {e}")
+
+        self.passes += 1
+        self.archived += archived
+        self.dropped += dropped
+        self.reclaimed_bytes += reclaimed
+        self.last_pass = datetime.now().isoformat()
+        if archived or dropped:
+            print(f"🗂️ Archived {archived} cold sessions, dropped {dropped} over the per-user cap")
+        return {"archived": archived, "dropped": dropped, "reclaimed_bytes": reclaimed}
+
+    def close(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=30)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "passes": self.passes,
+            "archived": self.archived,
+            "dropped": self.dropped,
+            "reclaimed_bytes": self.reclaimed_bytes,
+            "errors": self.errors,
+            "last_pass": self.last_pass,
+            "archive_after_days": self.archive_after_days,
+            "max_user_bytes": self.max_user_bytes,
+            "interval_seconds": self.interval,
+            "packs": self.backend.archive.stats(),
+        }
+
+
+def main():
+    from retrieval import RetrievalIndex
+    from storage import FileStorageBackend
+
+    parser = argparse.ArgumentParser(description="Archive cold sessions into per-user packs")
+    parser.add_argument("--data-dir", default="user_data", help="File storage directory")
+    parser.add_argument("--older-than-days", type=float, default=float(os.environ.get("ARCHIVE_AFTER_DAYS", 30)),
+                        help="Archive sessions not updated for this long")
+    parser.add_argument("--max-user-mb", type=float, default=float(os.environ.get("ARCHIVE_MAX_USER_MB", 0)),
+                        help="Per-user cap on session storage; 0 for none")
+    args = parser.parse_args()
+
+    backend = FileStorageBackend(args.data_dir)
+    retrieval = None
+    if os.path.isdir(os.path.join(args.data_dir, "index")):
+        retrieval = RetrievalIndex(os.path.join(args.data_dir, "index"))
+    archiver = SessionArchiver(backend, archive_after_days=args.older_than_days,
+                               max_user_bytes=int(args.max_user_mb * 1024 * 1024), interval=0,
+                               retrieval=retrieval)
+    print(f"🗂️ Archiving sessions older than {args.older_than_days} days in {args.data_dir}")
+    result = archiver.run_once()
+    backend.close()
+    print(f"✅ Archived {result['archived']} sessions, dropped {result['dropped']}, "
+          f"reclaimed {result['reclaimed_bytes']} bytes")
+
+
+if __name__ == "__main__":
+    main()
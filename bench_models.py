@@ -0,0 +1,229 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the profile and session models
+
+Compares the slotted models in models.py against the dataclasses they
+replaced (reproduced below): memory per object, and serialize/deserialize
+throughput for the codec each one is stored with. The dataclasses went
+through dataclasses.asdict and pretty-printed json.dump; the slotted models
+use to_dict/from_dict and compact JSON.
+
+ChatSession.from_dict converts messages on first access, so sessions are
+timed twice: deserialized (header only, as the manifest, archive and
+timeline paths use them) and deserialized with their messages read. Memory
+is always measured with the messages built.
+
+Usage:
+    python bench_models.py
+    python bench_models.py --sessions 500 --messages 40 --repeat 5
+"""
+
+import argparse
+import gc
+import json
+import time
+import tracemalloc
+from dataclasses import asdict, dataclass
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+from models import ChatSession, UserProfile
+
+
+@dataclass
+class DataclassUserProfile:
+    """UserProfile as it was before the slotted models"""
+    user_id: str
+    name: str = ""
+    age: Optional[int] = None
+    concerns: List[str] = None
+    preferences: Dict[str, Any] = None
+    emergency_contact: str = ""
+    created_at: str = ""
+    last_active: str = ""
+
+    def __post_init__(self):
+        if self.concerns is None:
+            self.concerns = []
+        if self.preferences is None:
+            self.preferences = {}
+        if not self.created_at:
+            self.created_at = datetime.now().isoformat()
+        self.last_active = datetime.now().isoformat()
+
+
+@dataclass
+class DataclassChatSession:
+    """ChatSession as it was before the slotted models, one dict per message"""
+    session_id: str
+    user_id: str
+    messages: List[Dict[str, str]] = None
+    topics_discussed: List[str] = None
+    mood_indicators: List[str] = None
+    advice_given: List[str] = None
+    follow_ups_needed: List[str] = None
+    risk_level: str = "low"
+    session_summary: str = ""
+    summarized_messages: int = 0
+    started_at: str = ""
+    ended_at: str = ""
+
+    def __post_init__(self):
+        if self.messages is None:
+            self.messages = []
+        for key in ("topics_discussed", "mood_indicators", "advice_given", "follow_ups_needed"):
+            if getattr(self, key) is None:
+                setattr(self, key, [])
+        if not self.started_at:
+            self.started_at = datetime.now().isoformat()
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def sample_session(index: int, messages: int) -> Dict[str, Any]:
+    started = datetime(2024, 1, 1).isoformat()
+    return {
+        "session_id": f"user{index}_20240101_120000",
+        "user_id": f"user{index}",
+        "messages": [
+            {
+                "role": "user" if i % 2 == 0 else "assistant",
+                "content": ("I have not been sleeping well because of work. " if i % 2 == 0
+                            else "That sounds exhausting. Let's look at your evenings. ") * 3,
+                "timestamp": started,
+            }
+            for i in range(messages)
+        ],
+        "topics_discussed": ["sleep", "work"],
+        "mood_indicators": ["tired"],
+        "advice_given": ["sleep hygiene"],
+        "follow_ups_needed": ["sleep"],
+        "risk_level": "low",
+        "session_summary": "",
+        "summarized_messages": 0,
+        "started_at": started,
+        "ended_at": "",
+    }
+
+
+def sample_profile(index: int) -> Dict[str, Any]:
+    return {
+        "user_id": f"user{index}",
+        "name": f"User {index}",
+        "age": 30,
+        "concerns": ["sleep", "work"],
+        "preferences": {"tone": "gentle"},
+        "emergency_contact": "",
+        "created_at": datetime(2024, 1, 1).isoformat(),
+        "last_active": datetime(2024, 1, 1).isoformat(),
+    }
+
+
+def measure_memory(build: Callable[[Dict[str, Any]], Any], data: List[Dict[str, Any]]) -> float:
+    """Bytes allocated per object built from data (the source dicts excluded)"""
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    objects = [build(item) for item in data]
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del objects
+    return (after - before) / len(data)
+
+
+def measure_rate(run: Callable[[Any], Any], items: List[Any], repeat: int) -> float:
+    """Best-of-repeat objects per second"""
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for item in items:
+            run(item)
+        best = min(best, time.perf_counter() - started)
+    return len(items) / best
+
+
+def bench(data: List[Dict[str, Any]], load: Callable[[Dict[str, Any]], Any],
+          dump: Callable[[Any], str], parse: Callable[[str], Any], repeat: int,
+          materialize: Callable[[Any], Any] = lambda obj: obj) -> Dict[str, float]:
+    """materialize finishes anything the model builds lazily (messages)"""
+    objects = [load(item) for item in data]
+    encoded = [dump(obj) for obj in objects]
+    return {
+        "bytes_per_object": round(measure_memory(lambda item: materialize(load(item)), data)),
+        "serialize_per_sec": round(measure_rate(dump, objects, repeat)),
+        "deserialize_per_sec": round(measure_rate(parse, encoded, repeat)),
+        "deserialize_full_per_sec": round(measure_rate(lambda text: materialize(parse(text)), encoded, repeat)),
+        "encoded_bytes": round(sum(len(text) for text in encoded) / len(encoded)),
+    }
+
+
+def with_messages(session: ChatSession) -> ChatSession:
+    session.messages
+    return session
+
+
+def run(args) -> Dict[str, Dict[str, Dict[str, float]]]:
+    sessions = [sample_session(i, args.messages) for i in range(args.sessions)]
+    profiles = [sample_profile(i) for i in range(args.sessions)]
+
+    def dataclass_session(data):
+        return DataclassChatSession(**dict(data, messages=[dict(msg) for msg in data["messages"]]))
+
+    return {
+        "session": {
+            "dataclass": bench(
+                sessions, dataclass_session,
+                lambda session: json.dumps(asdict(session), indent=2, ensure_ascii=False),
+                lambda text: DataclassChatSession(**json.loads(text)), args.repeat),
+            "slots": bench(
+                sessions, ChatSession.from_dict,
+                lambda session: _dumps(session.to_dict()),
+                lambda text: ChatSession.from_dict(json.loads(text)), args.repeat,
+                materialize=with_messages),
+        },
+        "profile": {
+            "dataclass": bench(
+                profiles, lambda data: DataclassUserProfile(**data),
+                lambda profile: json.dumps(asdict(profile), indent=2, ensure_ascii=False),
+                lambda text: DataclassUserProfile(**json.loads(text)), args.repeat),
+            "slots": bench(
+                profiles, UserProfile.from_dict,
+                lambda profile: _dumps(profile.to_dict()),
+                lambda text: UserProfile.from_dict(json.loads(text)), args.repeat),
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare slotted models against the old dataclasses")
+    parser.add_argument("--sessions", type=int, default=200, help="Objects of each kind")
+    parser.add_argument("--messages", type=int, default=20, help="Messages per session")
+    parser.add_argument("--repeat", type=int, default=3, help="Timing runs; the best is kept")
+    parser.add_argument("--output", help="Write the results JSON here")
+    args = parser.parse_args()
+
+    print(f"🏁 Benchmarking models: {args.sessions} objects, {args.messages} messages per session")
+    results = run(args)
+    for kind, rows in results.items():
+        print(f"\n📊 {kind}")
+        print(f"  {'':<10} {'bytes/obj':>10} {'ser/s':>10} {'deser/s':>10} {'full/s':>10} {'json bytes':>11}")
+        for name, row in rows.items():
+            print(f"  {name:<10} {row['bytes_per_object']:>10} {row['serialize_per_sec']:>10} "
+                  f"{row['deserialize_per_sec']:>10} {row['deserialize_full_per_sec']:>10} "
+                  f"{row['encoded_bytes']:>11}")
+        old, new = rows["dataclass"], rows["slots"]
+        print(f"  memory {new['bytes_per_object'] / old['bytes_per_object']:.2f}x, "
+              f"serialize {new['serialize_per_sec'] / old['serialize_per_sec']:.2f}x, "
+              f"deserialize {new['deserialize_per_sec'] / old['deserialize_per_sec']:.2f}x "
+              f"({new['deserialize_full_per_sec'] / old['deserialize_full_per_sec']:.2f}x with messages)")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"\n📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Load-testing benchmark for the /chat endpoint
+
+Starts the local stub Mistral API and the Flask app (in-process, threaded
+WSGI server, isolated temporary user_data), then drives /chat with multi-user,
+multi-turn conversations and reports throughput, latency percentiles and
+storage reads/writes per turn. Results are written as JSON so runs can be
+compared against a saved baseline.
+
+Usage:
+    python benchmark.py --users 50 --turns 6 --concurrency 20 --latency 0.3
+    python benchmark.py --output bench.json                     # save a baseline
+    python benchmark.py --baseline bench.json                   # compare against it
+"""
+
+import argparse
+import json
+import logging
+import math
+import os
+import platform
+import random
+import shutil
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List
+
+NAMES = ["Asha", "Ravi", "Meera", "Arjun", "Priya", "Kiran", "Neha", "Vikram", "Divya", "Rahul"]
+
+OPENERS = [
+    "Hi, my name is {name}. I haven't been sleeping well lately.",
+    "Hello, I'm {name}. Work has been really stressful this month.",
+    "My name is {name} and I keep feeling anxious before meetings.",
+    "Hi doctor, I feel low and tired most days.",
+    "I get angry in traffic every morning and it ruins my day.",
+]
+
+FOLLOW_UPS = [
+    "It has been going on for about three weeks now.",
+    "Mostly at night, I lie awake thinking about deadlines.",
+    "My boss keeps adding work and I can't say no.",
+    "I tried going for a walk but it didn't help much.",
+    "My family says I should rest more but I feel guilty.",
+    "Sometimes I feel hopeless about the whole thing.",
+    "That makes sense. What else could I try?",
+    "I had a slightly better day today, actually.",
+    "Can we continue this next time? I want to follow up.",
+    "I've been drinking a lot of coffee to stay awake at work.",
+]
+
+
+def percentile(sorted_values: List[float], pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def build_conversations(users: int, turns: int, seed: int) -> List[List[str]]:
+    """Deterministic conversation scripts: an opener followed by follow-ups"""
+    rng = random.Random(seed)
+    conversations = []
+    for index in range(users):
+        name = f"{NAMES[index % len(NAMES)]}{index}"
+        script = [rng.choice(OPENERS).format(name=name)]
+        script.extend(rng.choice(FOLLOW_UPS) for _ in range(turns - 1))
+        conversations.append(script)
+    return conversations
+
+
+def post_json(url: str, payload: Dict[str, Any], timeout: float) -> Dict[str, Any]:
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={"Content-Type": "application/json"}
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.loads(response.read())
+
+
+def run_conversation(url: str, script: List[str], timeout: float) -> List[Dict[str, Any]]:
+    """Send one conversation's turns in order; returns one record per turn"""
+    session_id = None
+    results = []
+    for message in script:
+        payload = {"message": message}
+        if session_id:
+            payload["session_id"] = session_id
+        started = time.perf_counter()
+        ok = True
+        try:
+            data = post_json(url, payload, timeout)
+            session_id = data.get("session_id", session_id)
+            ok = data.get("status") == "success" and "technical difficulties" not in data.get("response", "")
+        except (urllib.error.URLError, OSError, ValueError):
+            ok = False
+        results.append({"latency": time.perf_counter() - started, "ok": ok})
+    return results
+
+
+def run_benchmark(args) -> Dict[str, Any]:
+    from stub_mistral import StubMistralServer
+
+    stub = StubMistralServer(port=0, latency=args.latency, jitter=args.jitter,
+                             token_rate=args.token_rate, error_rate=args.error_rate,
+                             seed=args.seed).start()
+
+    # The app reads its configuration at import time, from inside the sandbox dir
+    workdir = tempfile.mkdtemp(prefix="mh_bench_")
+    original_cwd = os.getcwd()
+    os.environ["OPENAI_BASE_URL"] = stub.base_url
+    os.environ["MEMORY_BACKEND"] = args.backend
+    os.chdir(workdir)
+
+    import builtins
+    quiet = not args.verbose
+    real_print = builtins.print
+    if quiet:
+        builtins.print = lambda *a, **k: None
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+
+    try:
+        from werkzeug.serving import make_server
+        import api_server
+        from memory_system import memory_manager
+
+        server = make_server("127.0.0.1", 0, api_server.app, threaded=True)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_port}/chat"
+
+        conversations = build_conversations(args.users, args.turns, args.seed)
+        io_before = memory_manager.backend.io_stats()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+            futures = [pool.submit(run_conversation, url, script, args.timeout) for script in conversations]
+            turns = [record for future in futures for record in future.result()]
+        elapsed = time.perf_counter() - started
+
+        # Count deferred writes too, so write-behind runs compare fairly
+        memory_manager.flush()
+        io_after = memory_manager.backend.io_stats()
+        server.shutdown()
+    finally:
+        builtins.print = real_print
+        stub.stop()
+        os.chdir(original_cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    latencies = sorted(record["latency"] for record in turns)
+    errors = sum(1 for record in turns if not record["ok"])
+    total = len(turns)
+    reads = io_after["reads"] - io_before["reads"]
+    writes = io_after["writes"] - io_before["writes"]
+
+    return {
+        "config": {
+            "users": args.users,
+            "turns": args.turns,
+            "concurrency": args.concurrency,
+            "latency": args.latency,
+            "jitter": args.jitter,
+            "token_rate": args.token_rate,
+            "error_rate": args.error_rate,
+            "backend": args.backend,
+            "seed": args.seed,
+        },
+        "environment": {
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+        },
+        "results": {
+            "turns": total,
+            "errors": errors,
+            "elapsed_seconds": round(elapsed, 3),
+            "throughput_rps": round(total / elapsed, 2) if elapsed else 0.0,
+            "latency_ms": {
+                "mean": round(sum(latencies) / total * 1000, 2) if total else 0.0,
+                "p50": round(percentile(latencies, 50) * 1000, 2),
+                "p95": round(percentile(latencies, 95) * 1000, 2),
+                "p99": round(percentile(latencies, 99) * 1000, 2),
+                "max": round(latencies[-1] * 1000, 2) if latencies else 0.0,
+            },
+            "storage": {
+                "reads": reads,
+                "writes": writes,
+                "reads_per_turn": round(reads / total, 3) if total else 0.0,
+                "writes_per_turn": round(writes / total, 3) if total else 0.0,
+            },
+        },
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]):
+    """Print the change of each headline number against a baseline run"""
+    if current["config"] != baseline["config"]:
+        print("⚠️  Baseline was run with a different configuration; deltas may not be comparable")
+
+    rows = [
+        ("throughput_rps", lambda r: r["throughput_rps"], True),
+        ("p50 ms", lambda r: r["latency_ms"]["p50"], False),
+        ("p95 ms", lambda r: r["latency_ms"]["p95"], False),
+        ("p99 ms", lambda r: r["latency_ms"]["p99"], False),
+        ("reads/turn", lambda r: r["storage"]["reads_per_turn"], False),
+        ("writes/turn", lambda r: r["storage"]["writes_per_turn"], False),
+        ("errors", lambda r: r["errors"], False),
+    ]
+    print("\n📊 Against baseline:")
+    for label, get, higher_is_better in rows:
+        old, new = get(baseline["results"]), get(current["results"])
+        change = ((new - old) / old * 100) if old else 0.0
+        better = (change > 0) == higher_is_better if change else None
+        marker = "  " if better is None else ("✅" if better else "❌")
+        print(f"  {marker} {label:<15} {old:>10} -> {new:<10} ({change:+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark /chat against a local stub Mistral API")
+    parser.add_argument("--users", type=int, default=20, help="Concurrent conversations in the mix")
+    parser.add_argument("--turns", type=int, default=5, help="Turns per conversation")
+    parser.add_argument("--concurrency", type=int, default=10, help="Conversations in flight at once")
+    parser.add_argument("--latency", type=float, default=0.3, help="Stub time to first token (s)")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Stub latency jitter (s)")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Stub tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of stub calls that fail")
+    parser.add_argument("--backend", default="file", choices=["file", "sqlite"], help="Storage backend")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request client timeout (s)")
+    parser.add_argument("--seed", type=int, default=42, help="Seed for scripts and stub behaviour")
+    parser.add_argument("--output", help="Write the results JSON here")
+    parser.add_argument("--baseline", help="Compare against a previous results JSON")
+    parser.add_argument("--verbose", action="store_true", help="Keep the server's log output")
+    args = parser.parse_args()
+
+    print(f"🏁 Benchmarking /chat: {args.users} users x {args.turns} turns, "
+          f"concurrency {args.concurrency}, stub latency {args.latency}s, {args.backend} storage")
+    report = run_benchmark(args)
+    results = report["results"]
+
+    print(f"\n✅ {results['turns']} turns in {results['elapsed_seconds']}s "
+          f"({results['throughput_rps']} req/s, {results['errors']} errors)")
+    latency = results["latency_ms"]
+    print(f"⏱️  latency ms: p50 {latency['p50']}  p95 {latency['p95']}  p99 {latency['p99']}  max {latency['max']}")
+    storage = results["storage"]
+    print(f"💾 storage per turn: {storage['reads_per_turn']} reads, {storage['writes_per_turn']} writes")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            compare(report, json.load(f))
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"\n📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+"""
+Token-budgeted prompt assembly
+
+Fits the system prompt, rolling session summary, retrieved memories, recent
+history and the new user message into a fixed token budget. Turns that fall out of the history
+window are folded into ChatSession.session_summary instead of being dropped,
+so the model keeps a compact memory of the whole session while the prompt
+stays roughly the same size however long the conversation gets.
+
+build() doesn't touch the session: the folded summary comes back as a
+SummaryUpdate, which the caller applies when it commits the turn. Messages
+already in the summary never re-enter the history window, so nothing is
+shown to the model twice.
+
+Token counts are local estimates (no tokenizer download): about one token per
+word or punctuation mark, and one per four characters for long words.
+"""
+
+import re
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+from models import ChatSession
+
+_TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+# Chat formats spend a few tokens per message on role markers
+MESSAGE_OVERHEAD_TOKENS = 4
+
+
+def estimate_tokens(text: str) -> int:
+    """Approximate the number of model tokens in text"""
+    tokens = 0
+    for piece in _TOKEN_RE.findall(text):
+        tokens += 1 if len(piece) <= 6 else (len(piece) + 3) // 4
+    return tokens
+
+
+class SummaryUpdate(NamedTuple):
+    """A session's rolling summary after folding, and how many messages it covers"""
+    session_summary: str
+    summarized_messages: int
+
+    def apply(self, session: ChatSession):
+        """Store the summary on session, unless a later turn already folded further"""
+        if self.summarized_messages > session.summarized_messages:
+            session.session_summary = self.session_summary
+            session.summarized_messages = self.summarized_messages
+
+
+def _clip_words(text: str, max_words: int) -> str:
+    words = text.split()
+    if len(words) <= max_words:
+        return " ".join(words)
+    return " ".join(words[:max_words]) + "..."
+
+
+class ContextBuilder:
+    """Builds the chat message list for a turn within a token budget"""
+
+    SUMMARY_HEADER = "\n\nEARLIER IN THIS SESSION (summary):\n"
+    SPEAKERS = {"user": "Patient", "assistant": "Dr. Sharma"}
+
+    def __init__(self, max_prompt_tokens: int = 3000, max_history_messages: int = 10,
+                 summary_tokens: int = 300, summary_words_per_turn: int = 25):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.max_history_messages = max_history_messages
+        self.summary_tokens = summary_tokens
+        self.summary_words_per_turn = summary_words_per_turn
+
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.total_prompt_tokens = 0
+        self.max_seen_prompt_tokens = 0
+        self.over_budget = 0
+
+    def build(self, system_prompt: str, session: ChatSession, user_message: str,
+              memories: str = "") -> Tuple[List[Dict[str, str]], Dict[str, Any], Optional[SummaryUpdate]]:
+        """Return (messages, stats, summary) for the next model call
+
+        The system message is system_prompt, then the session summary, then
+        memories (see prompts.py for why in that order). summary is None
+        unless messages were folded this turn.
+        """
+        system_tokens = estimate_tokens(system_prompt + memories) + MESSAGE_OVERHEAD_TOKENS
+        user_tokens = estimate_tokens(user_message) + MESSAGE_OVERHEAD_TOKENS
+        history_budget = self.max_prompt_tokens - system_tokens - user_tokens - self.summary_tokens
+
+        # Newest messages first, while they fit, and never back into the summary
+        history = session.messages
+        window_start = len(history)
+        floor = min(session.summarized_messages, window_start)
+        history_tokens = 0
+        while window_start > floor and len(history) - window_start < self.max_history_messages:
+            cost = estimate_tokens(history[window_start - 1].content) + MESSAGE_OVERHEAD_TOKENS
+            if history_tokens + cost > history_budget:
+                break
+            history_tokens += cost
+            window_start -= 1
+
+        # Don't open the window on a reply whose question was cut off
+        if window_start < len(history) and history[window_start].role == "assistant":
+            history_tokens -= estimate_tokens(history[window_start].content) + MESSAGE_OVERHEAD_TOKENS
+            window_start += 1
+
+        summary = self._fold_into_summary(session, window_start)
+        folded = summary.summarized_messages - session.summarized_messages if summary else 0
+        session_summary = summary.session_summary if summary else session.session_summary
+
+        system_content = system_prompt
+        summary_tokens = 0
+        if session_summary:
+            system_content += self.SUMMARY_HEADER + session_summary
+            summary_tokens = estimate_tokens(self.SUMMARY_HEADER + session_summary)
+        system_content += memories
+
+        messages = [{"role": "system", "content": system_content}]
+        messages.extend({"role": msg.role, "content": msg.content} for msg in history[window_start:])
+        messages.append({"role": "user", "content": user_message})
+
+        prompt_tokens = system_tokens + summary_tokens + history_tokens + user_tokens
+        stats = {
+            "prompt_tokens": prompt_tokens,
+            "budget": self.max_prompt_tokens,
+            "system_tokens": system_tokens,
+            "summary_tokens": summary_tokens,
+            "history_tokens": history_tokens,
+            "user_tokens": user_tokens,
+            "history_messages": len(history) - window_start,
+            "folded_messages": folded,
+        }
+        self._record(stats)
+        return messages, stats, summary
+
+    def _fold_into_summary(self, session: ChatSession, window_start: int) -> Optional[SummaryUpdate]:
+        """The summary with one line appended per message that left the window, or None"""
+        start = session.summarized_messages
+        if start >= window_start:
+            return None
+
+        lines = session.session_summary.splitlines() if session.session_summary else []
+        for msg in session.messages[start:window_start]:
+            speaker = self.SPEAKERS.get(msg.role, msg.role)
+            lines.append(f"- {speaker}: {_clip_words(msg.content, self.summary_words_per_turn)}")
+
+        # Rolling: the oldest lines go once the summary outgrows its share of the budget
+        while len(lines) > 1 and estimate_tokens("\n".join(lines)) > self.summary_tokens:
+            lines.pop(0)
+
+        return SummaryUpdate("\n".join(lines), window_start)
+
+    def _record(self, stats: Dict[str, Any]):
+        with self._lock:
+            self.requests += 1
+            self.total_prompt_tokens += stats["prompt_tokens"]
+            self.max_seen_prompt_tokens = max(self.max_seen_prompt_tokens, stats["prompt_tokens"])
+            if stats["prompt_tokens"] > self.max_prompt_tokens:
+                self.over_budget += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "budget": self.max_prompt_tokens,
+                "requests": self.requests,
+                "total_prompt_tokens": self.total_prompt_tokens,
+                "mean_prompt_tokens": round(self.total_prompt_tokens / self.requests, 1) if self.requests else 0,
+                "max_prompt_tokens": self.max_seen_prompt_tokens,
+                "over_budget": self.over_budget,
+            }
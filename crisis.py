@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Crisis fast path
+
+A precompiled detector for messages that mention suicide, self-harm or being
+in danger. It runs before any storage or model work, so helpline resources
+reach the patient at once, even when the upstream model is slow or down. The
+model's own reply follows when it arrives.
+
+Phone keyboards type curly apostrophes ("don’t"), so apostrophe look-alikes are
+folded to a plain ' before matching and the terms only need the one spelling.
+"""
+
+from typing import Dict, List, Optional
+
+from keyword_matcher import KeywordMatcher
+
+# Same term syntax as the insight lexicons (see keyword_matcher)
+CRISIS_TERMS: Dict[str, List[str]] = {
+    "crisis:suicide": [
+        "suicid*", "kill myself", "killing myself", "end my life", "ending my life",
+        "take my life", "take my own life", "want to die", "wanna die", "wish i was dead",
+        "wish i were dead", "better off dead", "no reason to live", "nothing to live for",
+        "don't want to live", "dont want to live", "do not want to live",
+        "not worth living", "end it all",
+    ],
+    "crisis:self_harm": [
+        "self harm*", "self-harm*", "selfharm*", "hurt myself", "hurting myself",
+        "harm myself", "harming myself", "cut myself", "cutting myself", "hang myself",
+        "overdos*", "took too many pills", "take too many pills", "taking too many pills",
+        "took all my pills", "take all my pills", "swallowed all my pills",
+    ],
+    "crisis:danger": [
+        "i am in danger", "i'm in danger", "im in danger", "not safe at home", "going to hurt me",
+        "threatening to kill me",
+    ],
+}
+
+# Apostrophe look-alikes: right/left single quotes, modifier letter, prime,
+# acute accent, backtick and fullwidth apostrophe
+_APOSTROPHES = str.maketrans({char: "'" for char in "\u2019\u2018\u02bc\u2032\u00b4`\uff07"})
+
+
+def normalize_apostrophes(text: str) -> str:
+    return text.translate(_APOSTROPHES)
+
+
+HELPLINES = [
+    ("AASRA Helpline", "+91-98204 66726"),
+    ("Snehi Helpline", "+91-95822 17419"),
+    ("Tele-MANAS (24x7, toll-free)", "14416"),
+    ("Emergency services", "112"),
+]
+
+HELPLINE_TEXT = "\n".join(f"- {name}: {number}" for name, number in HELPLINES)
+
+CRISIS_RESPONSE = (
+    "I'm really glad you told me, and I'm concerned about your safety. You don't have to "
+    "go through this alone. Please reach out right now to people who can help:\n"
+    f"{HELPLINE_TEXT}\n"
+    "If you can, let a trusted family member or close friend know how you're feeling, "
+    "and stay with someone until you feel safer."
+)
+
+# Replaces the model's reply when the upstream call fails
+FALLBACK_RESPONSE = (
+    "I apologize, but I'm experiencing technical difficulties right now. Please try again "
+    "in a moment. If you're in crisis, please call AASRA (+91-98204 66726), Snehi "
+    "(+91-95822 17419) or Tele-MANAS (14416) immediately."
+)
+
+# Sent with a 429 when the server is too busy to take the turn
+BUSY_RESPONSE = (
+    "I'm getting a lot of messages right now, so I couldn't take that one. Please send it "
+    "again in a few seconds. If you're in crisis, please call AASRA (+91-98204 66726), Snehi "
+    "(+91-95822 17419) or Tele-MANAS (14416) immediately."
+)
+
+# Added to the system prompt for the model's follow-up on a crisis turn
+FOLLOW_UP_INSTRUCTION = (
+    "\n\nCRISIS TURN: The patient has just been shown the crisis helplines above. "
+    "Do not list them again. Respond with warmth, acknowledge what they shared, "
+    "gently check whether they are safe right now, and encourage them to call."
+)
+
+
+def crisis_reply(follow_up: Optional[str]) -> str:
+    """The full assistant turn: helplines first, then the model's follow-up if any"""
+    if follow_up:
+        return f"{CRISIS_RESPONSE}\n\n{follow_up}"
+    return CRISIS_RESPONSE
+
+
+class CrisisDetector:
+    """Flags messages that need the crisis fast path"""
+
+    def __init__(self, terms: Optional[Dict[str, List[str]]] = None):
+        terms = terms or CRISIS_TERMS
+        self.matcher = KeywordMatcher({
+            label: [normalize_apostrophes(term) for term in label_terms]
+            for label, label_terms in terms.items()
+        })
+
+    def detect(self, text: str) -> List[str]:
+        """Crisis labels found in text (empty if none)"""
+        return self.matcher.classify(normalize_apostrophes(text))
+
+
+# Global detector instance
+crisis_detector = CrisisDetector()
@@ -0,0 +1,63 @@
+#!/usr/bin/env python3
+"""
+Cross-process advisory file locks
+
+Worker processes that share user_data/ use these so they never interleave a
+read-modify-write of the same session or manifest. Locks are flock()-based:
+they also exclude other threads of the same process (each acquisition opens
+its own descriptor), and the kernel releases them if a worker dies holding
+one. Without fcntl (Windows) they fall back to in-process locks, which is
+enough for the single-process development server.
+"""
+
+import os
+import threading
+import zlib
+from contextlib import contextmanager
+
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
+
+_process_locks = {}
+_process_locks_guard = threading.Lock()
+
+
+@contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on path (created if missing) for the with-block"""
+    if fcntl is None:
+        with _process_locks_guard:
+            lock = _process_locks.setdefault(path, threading.Lock())
+        with lock:
+            yield
+        return
+
+    fd = os.open(path, os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX)
+        yield
+    finally:
+        os.close(fd)  # closing the descriptor releases the lock
+
+
+class StripedFileLocks:
+    """A fixed pool of lock files that keys are hashed onto
+
+    Keeps the number of lock files bounded however many sessions or users
+    there are; two keys sharing a stripe merely serialize with each other.
+    """
+
+    def __init__(self, lock_dir: str, prefix: str, stripes: int = 1024):
+        self.lock_dir = lock_dir
+        self.prefix = prefix
+        self.stripes = stripes
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def path(self, key: str) -> str:
+        stripe = zlib.crc32(key.encode("utf-8")) % self.stripes
+        return os.path.join(self.lock_dir, f"{self.prefix}-{stripe:04d}.lock")
+
+    def hold(self, key: str):
+        return file_lock(self.path(key))
@@ -0,0 +1,44 @@
+#!/usr/bin/env python3
+"""
+Gunicorn settings for the multi-process server (see wsgi.py)
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+One worker process per core by default (WEB_CONCURRENCY overrides), each with
+a pool of threads to overlap the time turns spend waiting on Mistral.
+"""
+
+import multiprocessing
+import os
+
+# Workers share live sessions through storage instead of process memory
+os.environ.setdefault("SHARED_SESSIONS", "1")
+
+# Cached user contexts and profiles aren't told about other workers' saves, so
+# reread them sooner than a single process would
+os.environ.setdefault("CONTEXT_CACHE_TTL", "30")
+os.environ.setdefault("IDENTITY_PROFILE_TTL", "30")
+
+bind = f"0.0.0.0:{os.environ.get('PORT', 8000)}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "gthread"
+threads = int(os.environ.get("GUNICORN_THREADS", 8))
+timeout = int(os.environ.get("GUNICORN_TIMEOUT", 120))
+
+# Admission limits are per worker and must fit inside its thread pool: turns in
+# flight plus turns queued leave at least one thread free to send 429s and
+# answer /health when the worker is saturated
+os.environ.setdefault("ADMISSION_MAX_IN_FLIGHT", str(max(1, threads * 3 // 4)))
+os.environ.setdefault("ADMISSION_MAX_QUEUE", str(max(0, threads - 1 - threads * 3 // 4)))
+graceful_timeout = 30
+keepalive = 5
+
+# Each worker imports the app after the fork, so its upstream client loop and
+# write-behind thread belong to that worker
+preload_app = False
+
+
+def worker_exit(server, worker):
+    """Drain queued writes before a worker goes away"""
+    from memory_system import memory_manager
+    memory_manager.close()
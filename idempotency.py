@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+"""
+Duplicate-submission coalescing for the chat endpoints
+
+A retried or double-clicked message must not cost a second model call or
+add a second turn to the session. Each chat request is given a key:
+
+- the client's idempotency key (`idempotency_key` in the body, or an
+  Idempotency-Key header) when it sends one, as the chat page does, scoped to
+  the session it continues (or, for a first message, the client address) so
+  one client's key can never pick up another's reply
+- otherwise the (session_id, message) pair, for requests continuing a session
+
+Each key remembers a hash of the message it was first used with. A key sent
+again with a different message is refused (HTTP 422) rather than answered
+with a reply to something else.
+
+While a request with a key is in flight, later requests with the same key
+wait for it and get its reply instead of running their own turn. Finished
+replies stay replayable for a while: IDEMPOTENCY_TTL for explicit keys, and
+only a short IDEMPOTENCY_DUPLICATE_WINDOW for derived ones, since a patient
+may well send the same words again on purpose ("yes", "thank you"). Failed
+turns (errors, fallbacks, 429s) are not kept, so a retry runs afresh.
+
+The chat endpoints admit a request (admission.py) before calling begin(), so
+a copy waiting here holds an in-flight slot like any other turn and retries
+can't tie up server threads beyond the admission limits.
+
+Coalescing is per process; under gunicorn, duplicates that land on different
+workers are each answered.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+MAX_KEY_LENGTH = 128
+CONFLICT_RETRY_AFTER = 5  # seconds; a turn's reply is usually well on its way by then
+
+
+class RequestInProgress(Exception):
+    """Raised when a duplicate waited too long for the original; maps to HTTP 409"""
+
+    def __init__(self, retry_after: float):
+        super().__init__(f"A request with this key is still in progress, retry after {retry_after:.0f}s")
+        self.retry_after = retry_after
+
+
+class KeyReused(Exception):
+    """Raised when a key comes back with a different message; maps to HTTP 422"""
+
+    def __init__(self):
+        super().__init__("This idempotency key was already used for a different message")
+
+
+def fingerprint(message: str) -> str:
+    """Hash of a message, so the cache doesn't hold message text"""
+    return hashlib.blake2b(message.encode("utf-8"), digest_size=16).hexdigest()
+
+
+class _Entry:
+    __slots__ = ("done", "result", "expires", "fingerprint")
+
+    def __init__(self, fingerprint: Optional[str] = None):
+        self.done = threading.Event()
+        self.fingerprint = fingerprint
+        self.result: Optional[Dict[str, Any]] = None
+        self.expires: Optional[float] = None  # None while in flight
+
+
+class Turn:
+    """One keyed request: either the one doing the work, or a replay of it
+
+    The leader calls complete() with its reply, or abandon() if it failed;
+    abandon() after complete() does nothing, so it can sit in a finally.
+    """
+
+    def __init__(self, cache: "IdempotencyCache", key: Optional[str], entry: Optional[_Entry],
+                 ttl: float, result: Optional[Dict[str, Any]] = None, source: Optional[str] = None):
+        self.cache = cache
+        self.key = key
+        self.entry = entry
+        self.ttl = ttl
+        self.result = result
+        self.source = source  # for replays: "in_flight" (waited for the original) or "cache"
+        self.replayed = source is not None
+        self._finished = entry is None
+
+    def complete(self, result: Dict[str, Any], cacheable: bool = True):
+        if self._finished:
+            return
+        self._finished = True
+        if cacheable:
+            self.cache._complete(self.key, self.entry, result, self.ttl)
+        else:
+            self.cache._abandon(self.key, self.entry)
+
+    def abandon(self):
+        if self._finished:
+            return
+        self._finished = True
+        self.cache._abandon(self.key, self.entry)
+
+
+class IdempotencyCache:
+    """Coalesces concurrent duplicates and replays recently finished ones"""
+
+    def __init__(self, ttl: float = 300.0, duplicate_window: float = 10.0, wait_timeout: float = 60.0,
+                 max_entries: int = 10000):
+        self.ttl = ttl
+        self.duplicate_window = duplicate_window
+        self.wait_timeout = wait_timeout
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.led = 0
+        self.coalesced = 0  # waited for an in-flight original
+        self.replayed = 0   # answered from a finished one
+        self.conflicts = 0
+        self.mismatches = 0
+
+    @classmethod
+    def from_env(cls) -> "IdempotencyCache":
+        """Build a cache from IDEMPOTENCY_* environment settings"""
+        return cls(
+            ttl=float(os.environ.get("IDEMPOTENCY_TTL", 300)),
+            duplicate_window=float(os.environ.get("IDEMPOTENCY_DUPLICATE_WINDOW", 10)),
+            wait_timeout=float(os.environ.get("IDEMPOTENCY_WAIT", 60)),
+            max_entries=int(os.environ.get("IDEMPOTENCY_MAX_ENTRIES", 10000)),
+        )
+
+    @staticmethod
+    def request_key(idempotency_key: Optional[str], session_id: Optional[str], message: str,
+                    client: Optional[str] = None) -> Optional[str]:
+        """Key for a chat request, or None if there is nothing safe to dedupe on
+
+        Explicit keys are scoped to the session, or to the client for a
+        request that doesn't continue one.
+        """
+        if idempotency_key:
+            scope = f"session:{session_id}" if session_id else f"client:{client or ''}"
+            return f"key:{scope}:{str(idempotency_key)[:MAX_KEY_LENGTH]}"
+        if session_id:
+            return f"turn:{session_id}:{fingerprint(message)}"
+        return None
+
+    def begin(self, key: Optional[str], message_hash: Optional[str] = None) -> Turn:
+        """Lead the request for key, or wait for the one in flight and replay its result
+
+        message_hash is the request's fingerprint(); a key already holding a
+        different one raises KeyReused. Raises RequestInProgress if the
+        original is still running after wait_timeout.
+        """
+        ttl = self.ttl if key and key.startswith("key:") else self.duplicate_window
+        if key is None:
+            return Turn(self, None, None, ttl)
+
+        deadline = time.monotonic() + self.wait_timeout
+        while True:
+            with self._lock:
+                entry = self._entries.get(key)
+                now = time.monotonic()
+                if entry is not None and entry.expires is not None and entry.expires <= now:
+                    del self._entries[key]
+                    entry = None
+                if entry is None:
+                    entry = self._entries[key] = _Entry(message_hash)
+                    self.led += 1
+                    return Turn(self, key, entry, ttl)
+                if entry.fingerprint != message_hash:
+                    self.mismatches += 1
+                    raise KeyReused()
+                if entry.expires is not None:
+                    self.replayed += 1
+                    return Turn(self, key, None, ttl, entry.result, "cache")
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not entry.done.wait(remaining):
+                with self._lock:
+                    self.conflicts += 1
+                raise RequestInProgress(CONFLICT_RETRY_AFTER)
+            if entry.expires is not None:
+                with self._lock:
+                    self.coalesced += 1
+                return Turn(self, key, None, ttl, entry.result, "in_flight")
+            # The original failed: look again, and lead if no other duplicate has
+
+    def _complete(self, key: str, entry: _Entry, result: Dict[str, Any], ttl: float):
+        with self._lock:
+            entry.result = result
+            entry.expires = time.monotonic() + ttl
+            if self._entries.get(key) is entry:
+                self._entries.move_to_end(key)
+            self._evict()
+        entry.done.set()
+
+    def _abandon(self, key: str, entry: _Entry):
+        with self._lock:
+            if self._entries.get(key) is entry:
+                del self._entries[key]
+        entry.done.set()
+
+    def _evict(self):
+        """Drop expired and, over capacity, the oldest finished entries (caller holds _lock)"""
+        now = time.monotonic()
+        over = len(self._entries) - self.max_entries
+        drop = []
+        for key, entry in self._entries.items():
+            if entry.expires is None:
+                continue  # in flight; finished entries behind it can still go
+            if entry.expires > now and over <= 0:
+                break
+            drop.append(key)
+            over -= 1
+        for key in drop:
+            del self._entries[key]
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if entry.expires is None)
+            return {
+                "entries": len(self._entries),
+                "in_flight": in_flight,
+                "led": self.led,
+                "coalesced": self.coalesced,
+                "replayed": self.replayed,
+                "conflicts": self.conflicts,
+                "mismatches": self.mismatches,
+                "ttl_seconds": self.ttl,
+                "duplicate_window_seconds": self.duplicate_window,
+            }
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Session-bound identity resolution
+
+Session IDs start with their owner's user ID ("<user_id>_<YYYYmmdd>_<HHMMSS>"),
+so the user behind a follow-up message is known from its session alone: no
+name scanning, hashing or profile read. IdentityMap keeps session owners and
+recently used profiles in bounded LRU maps so a turn on a known session
+resolves entirely in memory; a remembered profile is reread after a TTL, since
+another worker may have updated it since; sessions it has not seen (started on another
+worker, or before a restart) are resolved by parsing the ID. Session IDs come
+from clients, so a parsed ID is only accepted if it is well formed and names a
+session that exists; anything else starts a new session instead.
+
+People who never give a name each get their own guest identity, minted with
+their first session, instead of all sharing one "User" profile and session
+directory. Named profiles are keyed by the name alone, so a name is only taken
+from an explicit introduction ("my name is ...", "call me ...") and only if it
+looks like one: "I'm feeling low" must not file strangers under "Feeling".
+"""
+
+import re
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from models import UserProfile
+
+GUEST_PREFIX = "guest-"
+
+# User IDs end up in storage paths, so only these characters are accepted
+USER_ID_PATTERN = re.compile(r"[A-Za-z0-9_-]{1,64}")
+SESSION_ID_PATTERN = re.compile(r"([A-Za-z0-9_-]{1,64})_(\d{8})_(\d{6})")
+
+INTRODUCTIONS = ("my name is ", "my name's ", "call me ")
+
+# Words that follow an introduction without being a name ("call me crazy")
+NOT_NAMES = frozenset("""
+    a an the not no just so very really still also too now here back again anything nothing
+    nobody somebody someone whatever maybe later sorry fine ok okay good bad alright
+    feeling tired sad happy low down lonely lost confused scared afraid worried anxious
+    depressed stressed angry upset crazy stupid lazy weird broken useless hopeless
+    unknown anonymous user guest
+""".split())
+
+
+def new_guest_id() -> str:
+    return GUEST_PREFIX + secrets.token_hex(6)
+
+
+def is_guest(user_id: str) -> bool:
+    return user_id.startswith(GUEST_PREFIX)
+
+
+def looks_like_name(word: str) -> bool:
+    return 2 <= len(word) <= 30 and word.isalpha() and word.lower() not in NOT_NAMES
+
+
+def extract_name(message: str) -> Optional[str]:
+    """Name from an explicit introduction in message, or None"""
+    message_lower = message.lower()
+    for pattern in INTRODUCTIONS:
+        start = message_lower.find(pattern)
+        if start < 0:
+            continue
+        words = message[start + len(pattern):].split()
+        if words:
+            name = words[0].strip('.,!?').title()
+            if looks_like_name(name):
+                return name
+    return None
+
+
+def valid_session_id(session_id: Any) -> bool:
+    return isinstance(session_id, str) and SESSION_ID_PATTERN.fullmatch(session_id) is not None
+
+
+def session_owner(session_id: Any) -> Optional[str]:
+    """User ID encoded in a session ID, or None if it isn't one of ours"""
+    if not isinstance(session_id, str):
+        return None
+    match = SESSION_ID_PATTERN.fullmatch(session_id)
+    return match.group(1) if match else None
+
+
+@dataclass
+class Identity:
+    """Who a turn belongs to and which session it goes into"""
+    user_id: str
+    session_id: str
+    name: str = ""
+    new_session: bool = False
+    carried_from: Optional[str] = None  # guest session continued under a name given mid-chat
+
+
+class IdentityMap:
+    """Bounded session -> user and user -> profile maps"""
+
+    def __init__(self, max_sessions: int = 10000, max_profiles: int = 10000, profile_ttl: float = 300.0):
+        self.max_sessions = max_sessions
+        self.max_profiles = max_profiles
+        self.profile_ttl = profile_ttl
+        self._owners: "OrderedDict[str, str]" = OrderedDict()
+        self._profiles: "OrderedDict[str, Tuple[float, UserProfile]]" = OrderedDict()  # user_id -> (expires_at, profile)
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.parsed = 0
+        self.rejected = 0
+        self.profile_hits = 0
+        self.profile_misses = 0
+        self.profile_expired = 0
+
+    def owner(self, session_id: str, exists: Callable[[str, str], bool] = None) -> Optional[str]:
+        """User who owns session_id, from memory or else from the ID itself
+
+        exists(user_id, session_id), if given, must confirm a parsed ID before
+        it is trusted, so a client can't claim a user by forging the prefix.
+        """
+        user_id = session_owner(session_id)
+        if user_id is None:
+            return None
+        with self._lock:
+            known = self._owners.get(session_id)
+            if known is not None:
+                self._owners.move_to_end(session_id)
+                self.hits += 1
+                return known
+        if exists is not None and not exists(user_id, session_id):
+            with self._lock:
+                self.rejected += 1
+            return None
+        with self._lock:
+            self.parsed += 1
+        self.bind(session_id, user_id)
+        return user_id
+
+    def bind(self, session_id: str, user_id: str):
+        with self._lock:
+            self._owners[session_id] = user_id
+            self._owners.move_to_end(session_id)
+            while len(self._owners) > self.max_sessions:
+                self._owners.popitem(last=False)
+
+    def profile(self, user_id: str) -> Optional[UserProfile]:
+        with self._lock:
+            entry = self._profiles.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._profiles[user_id]
+                    self.profile_expired += 1
+                self.profile_misses += 1
+                return None
+            self._profiles.move_to_end(user_id)
+            self.profile_hits += 1
+            return entry[1]
+
+    def remember_profile(self, profile: UserProfile):
+        with self._lock:
+            self._profiles[profile.user_id] = (time.monotonic() + self.profile_ttl, profile)
+            self._profiles.move_to_end(profile.user_id)
+            while len(self._profiles) > self.max_profiles:
+                self._profiles.popitem(last=False)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._owners),
+                "profiles": len(self._profiles),
+                "session_hits": self.hits,
+                "session_parsed": self.parsed,
+                "session_rejected": self.rejected,
+                "profile_hits": self.profile_hits,
+                "profile_misses": self.profile_misses,
+                "profile_expired": self.profile_expired,
+            }
@@ -0,0 +1,138 @@
+#!/usr/bin/env python3
+"""
+Background upkeep of the derived indexes (retrieval and timelines)
+
+Indexing a saved session, and the one-off backfill of a user whose history
+predates an index, are work a turn doesn't need to wait for. MemoryManager
+hands them to one indexer thread instead:
+
+- tasks run in the order they were queued, so a user's backfill always runs
+  before the first update that would create their index
+- repeated updates of the same session between runs collapse into one; both
+  indexes only add what they haven't seen, so the latest snapshot is enough
+- backfills are queued once per user; the set of users already handled is a
+  bounded LRU, since the index files themselves are the durable marker
+
+flush() waits for everything queued so far, for tools and tests that read an
+index straight after a save. close() drains the queue on shutdown.
+"""
+
+import atexit
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable
+
+
+class BackgroundIndexer:
+    """Single-threaded, coalescing queue of index updates"""
+
+    def __init__(self, max_remembered: int = 10000):
+        self.max_remembered = max_remembered
+
+        self._pending: "OrderedDict[Hashable, Callable[[], Any]]" = OrderedDict()
+        self._once: "OrderedDict[Hashable, None]" = OrderedDict()
+        self._running = False
+        self._cond = threading.Condition()
+        self._thread = None
+        self._thread_pid = None
+        self._closed = False
+
+        self.queued = 0
+        self.coalesced = 0
+        self.ran = 0
+        self.failed = 0
+
+        atexit.register(self.close)
+
+    def submit(self, key: Hashable, task: Callable[[], Any]):
+        """Queue task, replacing one already queued under the same key"""
+        with self._cond:
+            closed = self._closed
+            if not closed:
+                self._ensure_thread()
+                self.queued += 1
+                if key in self._pending:
+                    self.coalesced += 1
+                    del self._pending[key]
+                self._pending[key] = task
+                self._cond.notify()
+        if closed:
+            # Shutting down: run it here rather than drop it
+            self._run_task(key, task)
+
+    def submit_once(self, key: Hashable, task: Callable[[], Any]):
+        """Queue task unless key was queued before (among the last max_remembered)"""
+        with self._cond:
+            if key in self._once:
+                self._once.move_to_end(key)
+                return
+            self._once[key] = None
+            while len(self._once) > self.max_remembered:
+                self._once.popitem(last=False)
+        self.submit(key, task)
+
+    def _ensure_thread(self):
+        """Start the indexer lazily, and again in a forked child"""
+        if self._thread is None or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="indexer", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                key, task = self._pending.popitem(last=False)
+                self._running = True
+            try:
+                self._run_task(key, task)
+            finally:
+                with self._cond:
+                    self._running = False
+                    self._cond.notify_all()
+
+    def _run_task(self, key: Hashable, task: Callable[[], Any]):
+        try:
+            task()
+            self.ran += 1
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Index update {key} failed: {e}")
+
+    def flush(self, timeout: float = 30.0) -> bool:
+        """Wait until everything queued so far has run; False on timeout"""
+        with self._cond:
+            if self._thread_pid != os.getpid():
+                return not self._pending
+            return self._cond.wait_for(lambda: not self._pending and not self._running, timeout)
+
+    def close(self):
+        """Drain the queue and stop the indexer"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread if self._thread_pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout=30)
+        # Whatever no thread of this process picked up (e.g. queued before a fork)
+        with self._cond:
+            pending, self._pending = self._pending, OrderedDict()
+        for key, task in pending.items():
+            self._run_task(key, task)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "queued": self.queued,
+                "coalesced": self.coalesced,
+                "ran": self.ran,
+                "failed": self.failed,
+                "backfills_remembered": len(self._once),
+            }
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+Single-pass keyword classifier for conversation insights
+
+Lexicons map a label (e.g. "topic:sleep") to the terms that signal it. All
+terms of all lexicons are compiled into one regular expression shaped like a
+trie, so shared prefixes are tested once and a message is scanned a single
+time however many terms there are. Matches respect word boundaries: "rest"
+does not fire on "interested" and "down" does not fire on "download".
+
+Term syntax:
+    "sleep"       whole word
+    "follow up"   phrase; any run of whitespace between the words
+    "stress*"     prefix; matches "stress", "stressed", "stressful", ...
+"""
+
+import re
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+_END = ""          # trie key marking the end of a term
+_WILDCARD = "*"    # trie key for a trailing prefix wildcard
+
+
+def _normalize(term: str) -> str:
+    return " ".join(term.lower().split())
+
+
+def _trie_pattern(node: Dict[str, dict]) -> str:
+    """Emit a regex for a trie node, sharing common prefixes between terms"""
+    branches = []
+    for key in sorted(k for k in node if k not in (_END, _WILDCARD)):
+        piece = r"\s+" if key == " " else re.escape(key)
+        branches.append(piece + _trie_pattern(node[key]))
+    if _WILDCARD in node:
+        branches.append(r"\w*")
+
+    if not branches:
+        return ""
+    pattern = branches[0] if len(branches) == 1 else "(?:" + "|".join(branches) + ")"
+    if _END in node:
+        # Greedy optional: the longest term at a position is tried first
+        pattern = "(?:" + pattern + ")?"
+    return pattern
+
+
+class KeywordMatcher:
+    """Word-boundary-aware matcher that classifies text against labelled lexicons"""
+
+    def __init__(self, lexicons: Dict[str, Iterable[str]]):
+        self.lexicons = {label: list(terms) for label, terms in lexicons.items()}
+        self._label_order = {label: index for index, label in enumerate(self.lexicons)}
+        self._exact: Dict[str, List[str]] = {}
+        self._prefixes: List[Tuple[str, List[str]]] = []
+
+        trie: Dict[str, dict] = {}
+        for label, terms in self.lexicons.items():
+            for term in terms:
+                term = _normalize(term)
+                if not term:
+                    continue
+                wildcard = term.endswith(_WILDCARD)
+                stem = term.rstrip(_WILDCARD)
+                node = trie
+                for char in stem:
+                    node = node.setdefault(char, {})
+                node[_WILDCARD if wildcard else _END] = {}
+
+                if wildcard:
+                    for known_stem, labels in self._prefixes:
+                        if known_stem == stem:
+                            labels.append(label)
+                            break
+                    else:
+                        self._prefixes.append((stem, [label]))
+                else:
+                    self._exact.setdefault(term, []).append(label)
+
+        body = _trie_pattern(trie) if trie else "(?!)"
+        self._pattern = re.compile(r"(?<!\w)(?:" + body + r")(?!\w)", re.IGNORECASE)
+
+    def _labels_for(self, matched: str) -> List[str]:
+        """Labels of every term (whole word or prefix) that the matched text satisfies"""
+        matched = _normalize(matched)
+        labels = list(self._exact.get(matched, ()))
+        for stem, prefix_labels in self._prefixes:
+            if matched.startswith(stem):
+                labels.extend(label for label in prefix_labels if label not in labels)
+        return labels
+
+    def matches(self, text: str) -> Dict[str, List[str]]:
+        """Map each label found in text to the terms that triggered it"""
+        found: Dict[str, List[str]] = {}
+        for match in self._pattern.finditer(text):
+            term = match.group(0)
+            for label in self._labels_for(term):
+                found.setdefault(label, []).append(term)
+        return found
+
+    def classify(self, text: str) -> List[str]:
+        """Labels present in text, in lexicon order"""
+        labels = set()
+        for match in self._pattern.finditer(text):
+            labels.update(self._labels_for(match.group(0)))
+        return sorted(labels, key=self._label_order.__getitem__)
+
+    def classify_batch(self, texts: Sequence[str]) -> List[List[str]]:
+        """classify() for many texts, e.g. when re-deriving insights from history"""
+        return [self.classify(text) for text in texts]
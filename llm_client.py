@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Async, connection-pooled client for the OpenAI-compatible chat completions API
+(Mistral by default). All upstream I/O runs on one background event loop that
+shares a keep-alive connection pool, so hundreds of in-flight calls don't need
+a thread each. Flask worker threads use the blocking `complete`/`stream` facade.
+Calls made with priority=True (crisis turns) jump the queue for a free slot.
+"""
+
+import asyncio
+import json
+import os
+import queue
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import aiohttp
+
+DEFAULT_MODEL = "mistral-medium-latest"
+
+
+class LLMError(Exception):
+    """Raised when the upstream completions API fails or returns an error"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class PrioritySemaphore:
+    """asyncio semaphore that hands freed slots to priority waiters first"""
+
+    def __init__(self, value: int):
+        self._value = value
+        self._waiters = {True: deque(), False: deque()}
+
+    def waiting(self) -> int:
+        return sum(1 for waiters in self._waiters.values() for fut in waiters if not fut.done())
+
+    async def acquire(self, priority: bool = False):
+        if self._value > 0 and not self.waiting():
+            self._value -= 1
+            return
+        fut = asyncio.get_running_loop().create_future()
+        self._waiters[priority].append(fut)
+        try:
+            await fut
+        except asyncio.CancelledError:
+            if fut.done() and not fut.cancelled():
+                # The slot was handed over just as we were cancelled; pass it on
+                self.release()
+            raise
+
+    def release(self):
+        for priority in (True, False):
+            waiters = self._waiters[priority]
+            while waiters:
+                fut = waiters.popleft()
+                if not fut.done():
+                    fut.set_result(None)
+                    return
+        self._value += 1
+
+    @asynccontextmanager
+    async def slot(self, priority: bool = False):
+        await self.acquire(priority)
+        try:
+            yield
+        finally:
+            self.release()
+
+
+class AsyncLLMClient:
+    """Shared-pool client for /chat/completions with concurrency limits and timeouts"""
+
+    def __init__(self,
+                 api_key: str,
+                 base_url: str,
+                 model: str = DEFAULT_MODEL,
+                 max_concurrency: int = 200,
+                 pool_size: int = 200,
+                 timeout: float = 60.0,
+                 connect_timeout: float = 5.0,
+                 read_timeout: float = 30.0,
+                 keepalive_timeout: float = 30.0):
+        self.api_key = api_key
+        self.base_url = base_url.rstrip("/")
+        self.model = model
+        self.max_concurrency = max_concurrency
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.keepalive_timeout = keepalive_timeout
+
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._semaphore: Optional[PrioritySemaphore] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread: Optional[threading.Thread] = None
+        self._loop_pid: Optional[int] = None
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> "AsyncLLMClient":
+        """Build a client from OPENAI_* and LLM_* environment variables"""
+        return cls(
+            api_key=os.environ.get("OPENAI_API_KEY", ""),
+            base_url=os.environ.get("OPENAI_BASE_URL", "https://api.mistral.ai/v1"),
+            model=os.environ.get("LLM_MODEL", DEFAULT_MODEL),
+            max_concurrency=int(os.environ.get("LLM_MAX_CONCURRENCY", 200)),
+            pool_size=int(os.environ.get("LLM_POOL_SIZE", 200)),
+            timeout=float(os.environ.get("LLM_TIMEOUT", 60)),
+            connect_timeout=float(os.environ.get("LLM_CONNECT_TIMEOUT", 5)),
+            read_timeout=float(os.environ.get("LLM_READ_TIMEOUT", 30)),
+            keepalive_timeout=float(os.environ.get("LLM_KEEPALIVE_TIMEOUT", 30)),
+        )
+
+    # ------------------------------------------------------------------
+    # Coroutine API (must run on the client's loop, or any loop when used
+    # directly from async code)
+    # ------------------------------------------------------------------
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.pool_size,
+                keepalive_timeout=self.keepalive_timeout,
+            )
+            self._session = aiohttp.ClientSession(
+                connector=connector,
+                headers={
+                    "Authorization": f"Bearer {self.api_key}",
+                    "Content-Type": "application/json",
+                },
+            )
+            self._semaphore = PrioritySemaphore(self.max_concurrency)
+        return self._session
+
+    def _payload(self, messages: List[Dict[str, str]], model: Optional[str],
+                 max_tokens: int, temperature: float, stream: bool) -> Dict[str, Any]:
+        return {
+            "model": model or self.model,
+            "messages": messages,
+            "max_tokens": max_tokens,
+            "temperature": temperature,
+            "stream": stream,
+        }
+
+    async def chat_completion(self,
+                              messages: List[Dict[str, str]],
+                              model: Optional[str] = None,
+                              max_tokens: int = 500,
+                              temperature: float = 0.7,
+                              priority: bool = False) -> str:
+        """Return the assistant message content for a non-streaming completion"""
+        session = await self._get_session()
+        timeout = aiohttp.ClientTimeout(total=self.timeout, connect=self.connect_timeout)
+        payload = self._payload(messages, model, max_tokens, temperature, stream=False)
+
+        async with self._semaphore.slot(priority):
+            try:
+                async with session.post(f"{self.base_url}/chat/completions",
+                                        json=payload, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        body = await resp.text()
+                        raise LLMError(f"Upstream returned {resp.status}: {body[:200]}", resp.status)
+                    data = await resp.json()
+            except asyncio.TimeoutError as e:
+                raise LLMError("Upstream request timed out") from e
+            except aiohttp.ClientError as e:
+                raise LLMError(f"Upstream connection failed: {e}") from e
+
+        try:
+            return data["choices"][0]["message"]["content"].strip()
+        except (KeyError, IndexError, TypeError, AttributeError) as e:
+            raise LLMError(f"Malformed completion response: {str(data)[:200]}") from e
+
+    async def stream_chat_completion(self,
+                                     messages: List[Dict[str, str]],
+                                     model: Optional[str] = None,
+                                     max_tokens: int = 500,
+                                     temperature: float = 0.7,
+                                     priority: bool = False) -> AsyncIterator[str]:
+        """Yield content deltas as the upstream produces them"""
+        session = await self._get_session()
+        # No total deadline for streams; a stalled socket is caught by sock_read
+        timeout = aiohttp.ClientTimeout(total=None, connect=self.connect_timeout,
+                                        sock_read=self.read_timeout)
+        payload = self._payload(messages, model, max_tokens, temperature, stream=True)
+
+        async with self._semaphore.slot(priority):
+            try:
+                async with session.post(f"{self.base_url}/chat/completions",
+                                        json=payload, timeout=timeout) as resp:
+                    if resp.status != 200:
+                        body = await resp.text()
+                        raise LLMError(f"Upstream returned {resp.status}: {body[:200]}", resp.status)
+
+                    async for raw_line in resp.content:
+                        line = raw_line.decode("utf-8").strip()
+                        if not line.startswith("data:"):
+                            continue
+                        data = line[5:].strip()
+                        if data == "[DONE]":
+                            break
+                        try:
+                            chunk = json.loads(data)
+                            token = chunk["choices"][0]["delta"].get("content")
+                        except (ValueError, KeyError, IndexError, TypeError):
+                            continue
+                        if token:
+                            yield token
+            except asyncio.TimeoutError as e:
+                raise LLMError("Upstream stream timed out") from e
+            except aiohttp.ClientError as e:
+                raise LLMError(f"Upstream connection failed: {e}") from e
+
+    async def aclose(self):
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
+
+    # ------------------------------------------------------------------
+    # Blocking facade for WSGI threads
+    # ------------------------------------------------------------------
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        """Start the background loop lazily (and again after a fork)"""
+        with self._lock:
+            if self._loop is None or self._loop_pid != os.getpid():
+                self._loop = asyncio.new_event_loop()
+                self._session = None
+                self._loop_thread = threading.Thread(
+                    target=self._loop.run_forever, name="llm-client-loop", daemon=True
+                )
+                self._loop_thread.start()
+                self._loop_pid = os.getpid()
+            return self._loop
+
+    def run(self, coro) -> Any:
+        """Run a coroutine on the client's loop and block for its result"""
+        loop = self._ensure_loop()
+        return asyncio.run_coroutine_threadsafe(coro, loop).result()
+
+    def iterate(self, make_iterator: Callable[[], AsyncIterator[Any]]) -> Iterator[Any]:
+        """Drive an async iterator on the client's loop, yielding its items to this thread"""
+        loop = self._ensure_loop()
+        tokens: "queue.Queue" = queue.Queue()
+        done = object()
+
+        async def pump():
+            try:
+                async for token in make_iterator():
+                    tokens.put(token)
+            except BaseException as e:
+                tokens.put(e)
+                if isinstance(e, asyncio.CancelledError):
+                    raise
+            finally:
+                tokens.put(done)
+
+        future = asyncio.run_coroutine_threadsafe(pump(), loop)
+        try:
+            while True:
+                item = tokens.get()
+                if item is done:
+                    break
+                if isinstance(item, BaseException):
+                    raise item
+                yield item
+        finally:
+            # Consumer went away (client disconnected): stop the upstream read
+            if not future.done():
+                future.cancel()
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        """Blocking wrapper around chat_completion for use from request threads"""
+        return self.run(self.chat_completion(messages, **kwargs))
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        """Blocking iterator over streamed tokens for use from request threads"""
+        return self.iterate(lambda: self.stream_chat_completion(messages, **kwargs))
+
+    def close(self):
+        """Close the shared pool and stop the background loop"""
+        with self._lock:
+            loop = self._loop
+            if loop is None or self._loop_pid != os.getpid():
+                return
+            asyncio.run_coroutine_threadsafe(self.aclose(), loop).result(timeout=5)
+            loop.call_soon_threadsafe(loop.stop)
+            self._loop_thread.join(timeout=5)
+            self._loop = None
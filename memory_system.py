@@ -3,76 +3,175 @@
 Memory system for persistent chat sessions and user information
 """
 
-import json
 import os
+import threading
+import time
+from collections import Counter, OrderedDict
 from datetime import datetime
-from typing import Dict, List, Any, Optional
-from dataclasses import dataclass, asdict
+from typing import Callable, Dict, List, Any, Optional
 import hashlib
 
-@dataclass
-class UserProfile:
-    """User profile with persistent information"""
-    user_id: str
-    name: str = ""
-    age: Optional[int] = None
-    concerns: List[str] = None
-    preferences: Dict[str, Any] = None
-    emergency_contact: str = ""
-    created_at: str = ""
-    last_active: str = ""
-    
-    def __post_init__(self):
-        if self.concerns is None:
-            self.concerns = []
-        if self.preferences is None:
-            self.preferences = {}
-        if not self.created_at:
-            self.created_at = datetime.now().isoformat()
-        self.last_active = datetime.now().isoformat()
+from archiver import SessionArchiver
+from identity import is_guest, looks_like_name
+from indexer import BackgroundIndexer
+from keyword_matcher import KeywordMatcher
+from models import Message, UserProfile, ChatSession
+from retrieval import RetrievalIndex
+from storage import FileStorageBackend, StorageBackend, create_backend
+from timeline import TimelineStore
+from write_behind import WriteBehindQueue, snapshot_session
+
+# Lexicons for insight extraction (see keyword_matcher for term syntax)
+TOPIC_KEYWORDS = {
+    "sleep": ["sleep", "sleeping", "insomnia", "tired", "sleepy", "awake", "rest", "resting"],
+    "anxiety": ["anxious", "anxiety", "worried", "worrying", "panic", "stress*"],
+    "depression": ["sad", "depressed", "depression", "hopeless", "down", "empty"],
+    "work": ["work", "working", "job", "jobs", "boss", "colleague", "colleagues", "office", "career"],
+    "relationships": ["friend", "friends", "family", "partner", "relationship*", "social"],
+    "health": ["health", "medication*", "doctor", "physical", "body"]
+}
+
+MOOD_KEYWORDS = {
+    "positive": ["good", "happy", "better", "great", "fine", "okay"],
+    "negative": ["bad", "terrible", "awful", "horrible", "worse"],
+    "anxious": ["anxious", "worried", "nervous", "stressed"],
+    "sad": ["sad", "down", "depressed", "hopeless", "empty"],
+    "tired": ["tired", "exhausted", "sleepy", "fatigue*"]
+}
+
+ADVICE_PATTERNS = [
+    "try", "trying", "consider", "might help", "suggestion*", "suggest", "recommend*",
+    "could", "maybe", "perhaps", "what if", "how about"
+]
+
+FOLLOW_UP_PATTERNS = ["follow up", "follow-up", "next time", "again", "continue"]
 
-@dataclass
-class ChatSession:
-    """Individual chat session data"""
-    session_id: str
-    user_id: str
-    messages: List[Dict[str, str]] = None
-    topics_discussed: List[str] = None
-    mood_indicators: List[str] = None
-    advice_given: List[str] = None
-    follow_ups_needed: List[str] = None
-    risk_level: str = "low"
-    session_summary: str = ""
-    started_at: str = ""
-    ended_at: str = ""
+def build_insight_lexicons(topics: Dict[str, List[str]] = None,
+                           moods: Dict[str, List[str]] = None,
+                           advice: List[str] = None,
+                           follow_ups: List[str] = None) -> Dict[str, List[str]]:
+    """Combine topic, mood, advice and follow-up lexicons into matcher labels"""
+    lexicons = {f"topic:{name}": terms for name, terms in (topics or TOPIC_KEYWORDS).items()}
+    lexicons.update({f"mood:{name}": terms for name, terms in (moods or MOOD_KEYWORDS).items()})
+    lexicons["advice"] = advice or ADVICE_PATTERNS
+    lexicons["follow_up"] = follow_ups or FOLLOW_UP_PATTERNS
+    return lexicons
+
+def most_common(items: List[str], limit: int) -> List[str]:
+    """Most frequent items first; ties keep first-seen (most recent session) order"""
+    return [item for item, _ in Counter(items).most_common(limit)]
+
+class ContextCache:
+    """Bounded LRU cache of computed user contexts with a time-to-live"""
+    
+    def __init__(self, max_size: int = 1024, ttl: float = 300.0):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries = OrderedDict()  # user_id -> (expires_at, context)
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+    
+    def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None or entry[0] < time.monotonic():
+                if entry is not None:
+                    del self._entries[user_id]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(user_id)
+            self.hits += 1
+            return entry[1]
     
-    def __post_init__(self):
-        if self.messages is None:
-            self.messages = []
-        if self.topics_discussed is None:
-            self.topics_discussed = []
-        if self.mood_indicators is None:
-            self.mood_indicators = []
-        if self.advice_given is None:
-            self.advice_given = []
-        if self.follow_ups_needed is None:
-            self.follow_ups_needed = []
-        if not self.started_at:
-            self.started_at = datetime.now().isoformat()
+    def put(self, user_id: str, context: Dict[str, Any]):
+        with self._lock:
+            self._entries[user_id] = (time.monotonic() + self.ttl, context)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+    
+    def update(self, user_id: str, apply: Callable[[Dict[str, Any]], None]):
+        """Apply an in-place change to a cached context, if there is one"""
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                apply(entry[1])
+    
+    def invalidate(self, user_id: str):
+        with self._lock:
+            if self._entries.pop(user_id, None) is not None:
+                self.invalidations += 1
+    
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
 
 class MemoryManager:
     """Manages persistent user memory and chat sessions"""
     
-    def __init__(self, data_dir: str = "user_data"):
+    # Number of recent sessions summarized into the user context
+    CONTEXT_SESSIONS = 3
+    
+    def __init__(self, data_dir: str = "user_data", backend: Optional[StorageBackend] = None,
+                 lexicons: Optional[Dict[str, List[str]]] = None):
         self.data_dir = data_dir
-        self.profiles_dir = os.path.join(data_dir, "profiles")
-        self.sessions_dir = os.path.join(data_dir, "sessions")
+        self.insight_matcher = KeywordMatcher(lexicons or build_insight_lexicons())
+        self.backend = backend or create_backend(os.environ.get("MEMORY_BACKEND", "file"), data_dir)
+        self.context_cache = ContextCache(
+            max_size=int(os.environ.get("CONTEXT_CACHE_SIZE", 1024)),
+            ttl=float(os.environ.get("CONTEXT_CACHE_TTL", 300))
+        )
+        
+        # Saves go through a background writer unless MEMORY_WRITE_BEHIND=0
+        self.writer = None
+        if os.environ.get("MEMORY_WRITE_BEHIND", "1") != "0":
+            self.writer = WriteBehindQueue(
+                self.backend,
+                flush_interval=float(os.environ.get("MEMORY_FLUSH_INTERVAL", 0.5)),
+                batch_size=int(os.environ.get("MEMORY_FLUSH_BATCH", 64)),
+                durability=os.environ.get("MEMORY_DURABILITY", "batch")
+            )
         
-        # Create directories if they don't exist
-        os.makedirs(self.profiles_dir, exist_ok=True)
-        os.makedirs(self.sessions_dir, exist_ok=True)
+        # Similarity search over all past exchanges unless MEMORY_RETRIEVAL=0
+        self.retrieval = None
+        if os.environ.get("MEMORY_RETRIEVAL", "1") != "0":
+            self.retrieval = RetrievalIndex(
+                os.path.join(data_dir, "index"),
+                top_k=int(os.environ.get("RETRIEVAL_TOP_K", 3)),
+                min_score=float(os.environ.get("RETRIEVAL_MIN_SCORE", 0.15))
+            )
         
-        print(f"📁 Memory system initialized: {data_dir}")
+        # Per-user mood and topic timelines unless MEMORY_TIMELINE=0
+        self.timelines = None
+        if os.environ.get("MEMORY_TIMELINE", "1") != "0":
+            self.timelines = TimelineStore(os.path.join(data_dir, "timeline"))
+        
+        # Both indexes are updated (and backfilled) off the request path
+        self.indexer = None
+        if self.retrieval or self.timelines:
+            self.indexer = BackgroundIndexer(max_remembered=int(os.environ.get("INDEX_BACKFILL_MEMORY", 10000)))
+        
+        # Cold sessions move into per-user archive packs (file storage only);
+        # ARCHIVE_INTERVAL=0 leaves that to archiver.py
+        self.archiver = None
+        if isinstance(self.backend, FileStorageBackend):
+            self.archiver = SessionArchiver.from_env(self.backend, self.retrieval).start()
+        
+        print(f"📁 Memory system initialized: {data_dir} ({self.backend.name} storage)")
     
     def generate_user_id(self, identifier: str) -> str:
         """Generate a consistent user ID from an identifier (like name)"""
@@ -84,79 +183,141 @@ class MemoryManager:
         return f"{user_id}_{timestamp}"
     
     def load_user_profile(self, user_id: str) -> Optional[UserProfile]:
-        """Load user profile from disk"""
-        profile_path = os.path.join(self.profiles_dir, f"{user_id}.json")
-        
-        if os.path.exists(profile_path):
-            try:
-                with open(profile_path, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    return UserProfile(**data)
-            except Exception as e:
-                print(f"❌ Error loading profile {user_id}: {e}")
-                return None
-        return None
+        """Load user profile from storage"""
+        if self.writer:
+            pending = self.writer.pending_profile(user_id)
+            if pending:
+                return pending
+        try:
+            return self.backend.load_profile(user_id)
+        except Exception as e:
+            print(f"❌ Error loading profile {user_id}: {e}")
+            return None
     
     def save_user_profile(self, profile: UserProfile) -> bool:
-        """Save user profile to disk"""
-        profile_path = os.path.join(self.profiles_dir, f"{profile.user_id}.json")
-        
+        """Save user profile to storage"""
         try:
             profile.last_active = datetime.now().isoformat()
-            with open(profile_path, 'w', encoding='utf-8') as f:
-                json.dump(asdict(profile), f, indent=2, ensure_ascii=False)
+            if self.writer:
+                self.writer.enqueue_profile(profile)
+            else:
+                self.backend.save_profile(profile)
+            profile_data = profile.to_dict()
+            self.context_cache.update(profile.user_id, lambda context: context.update(profile=profile_data))
             return True
         except Exception as e:
             print(f"❌ Error saving profile {profile.user_id}: {e}")
             return False
     
     def load_user_sessions(self, user_id: str, limit: int = 5) -> List[ChatSession]:
-        """Load recent sessions for a user"""
-        sessions = []
-        user_sessions_dir = os.path.join(self.sessions_dir, user_id)
-        
-        if not os.path.exists(user_sessions_dir):
-            return sessions
-        
+        """Load recent sessions for a user; their messages are read only if accessed"""
         try:
-            # Get session files sorted by modification time (newest first)
-            session_files = []
-            for filename in os.listdir(user_sessions_dir):
-                if filename.endswith('.json'):
-                    filepath = os.path.join(user_sessions_dir, filename)
-                    mtime = os.path.getmtime(filepath)
-                    session_files.append((mtime, filepath))
-            
-            session_files.sort(reverse=True)  # Newest first
-            
-            # Load the most recent sessions
-            for _, filepath in session_files[:limit]:
-                with open(filepath, 'r', encoding='utf-8') as f:
-                    data = json.load(f)
-                    sessions.append(ChatSession(**data))
-                    
+            sessions = self.backend.load_recent_sessions(user_id, limit)
         except Exception as e:
             print(f"❌ Error loading sessions for {user_id}: {e}")
+            sessions = []
         
+        if self.writer:
+            # Sessions saved but not yet written are the most recent ones
+            pending = self.writer.pending_sessions_for(user_id)
+            if pending:
+                pending_ids = {session.session_id for session in pending}
+                sessions = pending + [s for s in sessions if s.session_id not in pending_ids]
+                sessions = sessions[:limit]
         return sessions
     
-    def save_session(self, session: ChatSession) -> bool:
-        """Save chat session to disk"""
-        user_sessions_dir = os.path.join(self.sessions_dir, session.user_id)
-        os.makedirs(user_sessions_dir, exist_ok=True)
-        
-        session_path = os.path.join(user_sessions_dir, f"{session.session_id}.json")
+    def load_session(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        """Load one session by ID"""
+        if self.writer:
+            pending = self.writer.pending_session(session_id)
+            if pending:
+                return pending
+        try:
+            return self.backend.load_session(user_id, session_id)
+        except Exception as e:
+            print(f"❌ Error loading session {session_id}: {e}")
+            return None
+    
+    def session_version(self, user_id: str, session_id: str):
+        """Stamp of the stored session, or None; changes whenever any process saves it"""
+        try:
+            return self.backend.session_version(user_id, session_id)
+        except Exception as e:
+            print(f"❌ Error checking session {session_id}: {e}")
+            return None
+    
+    def save_session(self, session: ChatSession, write_through: bool = False) -> bool:
+        """Save chat session to storage
         
+        write_through skips the background writer, for callers that release a
+        lock to other processes as soon as this returns.
+        """
         try:
-            with open(session_path, 'w', encoding='utf-8') as f:
-                json.dump(asdict(session), f, indent=2, ensure_ascii=False)
-            return True
+            if self.writer and not write_through:
+                self.writer.enqueue_session(session)
+            else:
+                self.backend.save_session(session)
+            self._refresh_cached_session(session)
         except Exception as e:
             print(f"❌ Error saving session {session.session_id}: {e}")
+            self.context_cache.invalidate(session.user_id)
             return False
+        
+        if self.indexer:
+            self._queue_indexing(session)
+        return True
+    
+    def _queue_indexing(self, session: ChatSession):
+        """Hand a saved session to the indexer, after its user's backfills"""
+        user_id = session.user_id
+        if self.retrieval:
+            self.indexer.submit_once(("backfill_index", user_id), lambda: self._backfill_index(user_id))
+        if self.timelines:
+            self.indexer.submit_once(("backfill_timeline", user_id), lambda: self._backfill_timeline(user_id))
+        snapshot = snapshot_session(session)
+        self.indexer.submit(("session", session.session_id), lambda: self._index_session(snapshot))
+    
+    def _index_session(self, session: ChatSession):
+        if self.retrieval and self._retrievable(session.user_id):
+            try:
+                self.retrieval.add_session(session)
+            except Exception as e:
+                print(f"❌ Error indexing session {session.session_id}: {e}")
+        
+        if self.timelines:
+            try:
+                self.timelines.add_session(session.header())
+            except Exception as e:
+                print(f"❌ Error updating timeline for {session.user_id}: {e}")
+    
+    def flush(self):
+        """Write out any saves still queued in the background writer, then the index updates"""
+        if self.writer:
+            self.writer.flush()
+        if self.indexer:
+            self.indexer.flush()
+    
+    def close(self):
+        """Drain pending writes and release storage"""
+        if self.indexer:
+            self.indexer.close()
+        if self.archiver:
+            self.archiver.close()
+        if self.writer:
+            self.writer.close()
+        self.backend.close()
     
     def get_user_context(self, user_id: str) -> Dict[str, Any]:
-        """Get comprehensive user context for AI"""
+        """Get comprehensive user context for AI
+        
+        Contexts are memoized per user and kept current by save_session and
+        save_user_profile, so a turn normally costs no storage reads here.
+        Treat the returned dict as read-only.
+        """
+        context = self.context_cache.get(user_id)
+        if context is not None:
+            return context
+        
         context = {
             "profile": None,
             "recent_sessions": [],
@@ -170,11 +331,93 @@ class MemoryManager:
         # Load profile
         profile = self.load_user_profile(user_id)
         if profile:
-            context["profile"] = asdict(profile)
+            context["profile"] = profile.to_dict()
         
         # Load recent sessions
-        sessions = self.load_user_sessions(user_id, limit=3)
-        context["recent_sessions"] = [asdict(session) for session in sessions]
+        sessions = self.load_user_sessions(user_id, limit=self.CONTEXT_SESSIONS)
+        # Headers only: building context never reads a transcript
+        context["recent_sessions"] = [session.header() for session in sessions]
+        
+        self._extract_context_patterns(context)
+        self.context_cache.put(user_id, context)
+        return context
+    
+    def recall(self, user_id: str, query: str, exclude_session_id: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Past exchanges most similar to query, from any earlier session
+        
+        A user whose sessions predate the index has them indexed in the
+        background; until then, recall finds what is already indexed.
+        """
+        if not self.retrieval or not self._retrievable(user_id):
+            return []
+        try:
+            self.indexer.submit_once(("backfill_index", user_id), lambda: self._backfill_index(user_id))
+            return self.retrieval.search(user_id, query, exclude_session=exclude_session_id)
+        except Exception as e:
+            print(f"❌ Error searching memories for {user_id}: {e}")
+            return []
+    
+    def _retrievable(self, user_id: str) -> bool:
+        """Whether user_id's past exchanges may be indexed and recalled
+        
+        Guests are one person each, and so are names given in an explicit
+        introduction. Profiles from before names had to look like one (e.g.
+        "Feeling", from "I'm feeling low") are shared by strangers, and one
+        stranger's words must never reach another's prompt.
+        """
+        if is_guest(user_id):
+            return True
+        profile = self.get_user_context(user_id)["profile"]
+        return profile is None or looks_like_name(profile["name"])
+    
+    def _backfill_index(self, user_id: str):
+        """Index sessions stored before retrieval existed (runs on the indexer)"""
+        if self.retrieval.exists(user_id) or not self._retrievable(user_id):
+            return
+        added = 0
+        for session_id in self.backend.list_sessions(user_id):
+            session = self.load_session(user_id, session_id)
+            if session:
+                added += self.retrieval.add_session(session)
+        if added:
+            print(f"🗂️ Indexed {added} past exchanges for {user_id}")
+    
+    def get_timeline(self, user_id: str, granularity: str = "day", days: int = 90) -> Optional[Dict[str, Any]]:
+        """Mood and topic counts over time, or None if timelines are off or unavailable
+        
+        A user with no timeline yet gets an empty one, and a backfill from
+        their stored sessions is queued on the indexer: the ID may be anyone's,
+        so the request never waits on a storage scan.
+        """
+        if not self.timelines:
+            return None
+        try:
+            if not self.timelines.exists(user_id):
+                self.indexer.submit_once(("backfill_timeline", user_id), lambda: self._backfill_timeline(user_id))
+            return self.timelines.timeline(user_id, granularity, days)
+        except Exception as e:
+            print(f"❌ Error building timeline for {user_id}: {e}")
+            return None
+    
+    def _backfill_timeline(self, user_id: str):
+        """Build a timeline from stored sessions for users who predate timelines"""
+        if self.timelines.exists(user_id):
+            return
+        
+        def load_headers():
+            # Every session, including any still queued in the writer
+            limit = len(self.backend.list_sessions(user_id))
+            if self.writer:
+                limit += len(self.writer.pending_sessions_for(user_id))
+            return [session.header() for session in self.load_user_sessions(user_id, limit=limit)]
+        
+        added = self.timelines.rebuild(user_id, load_headers)
+        if added:
+            print(f"📊 Built timeline for {user_id} from {added} past sessions")
+    
+    def _extract_context_patterns(self, context: Dict[str, Any]):
+        """Fill key topics, advice, follow-ups and moods from context["recent_sessions"]"""
+        sessions = context["recent_sessions"]
         
         # Extract patterns from sessions
         if sessions:
@@ -184,77 +427,60 @@ class MemoryManager:
             all_moods = []
             
             for session in sessions:
-                all_topics.extend(session.topics_discussed)
-                all_advice.extend(session.advice_given)
-                all_follow_ups.extend(session.follow_ups_needed)
-                all_moods.extend(session.mood_indicators)
+                all_topics.extend(session["topics_discussed"])
+                all_advice.extend(session["advice_given"])
+                all_follow_ups.extend(session["follow_ups_needed"])
+                all_moods.extend(session["mood_indicators"])
             
-            # Get unique items with frequency
-            context["key_topics"] = list(set(all_topics))[:5]
-            context["previous_advice"] = list(set(all_advice))[:3]
-            context["follow_ups"] = list(set(all_follow_ups))[:3]
-            context["mood_patterns"] = list(set(all_moods))[:5]
+            # Unique items, most frequent first
+            context["key_topics"] = most_common(all_topics, 5)
+            context["previous_advice"] = most_common(all_advice, 3)
+            context["follow_ups"] = most_common(all_follow_ups, 3)
+            context["mood_patterns"] = most_common(all_moods, 5)
+    
+    def _refresh_cached_session(self, session: ChatSession):
+        """Write-through: fold a just-saved session into its user's cached context"""
+        session_data = session.header()
         
-        return context
+        def apply(context):
+            others = [s for s in context["recent_sessions"] if s["session_id"] != session.session_id]
+            context["recent_sessions"] = [session_data] + others[:self.CONTEXT_SESSIONS - 1]
+            self._extract_context_patterns(context)
+        
+        self.context_cache.update(session.user_id, apply)
     
     def update_session_data(self, session: ChatSession, user_message: str, ai_response: str):
         """Update session with new message and extract insights"""
         # Add messages
-        session.messages.append({"role": "user", "content": user_message, "timestamp": datetime.now().isoformat()})
-        session.messages.append({"role": "assistant", "content": ai_response, "timestamp": datetime.now().isoformat()})
+        session.messages.append(Message("user", user_message, datetime.now().isoformat()))
+        session.messages.append(Message("assistant", ai_response, datetime.now().isoformat()))
         
         # Extract topics and insights
         self._extract_session_insights(session, user_message, ai_response)
     
     def _extract_session_insights(self, session: ChatSession, user_message: str, ai_response: str):
         """Extract topics, mood, and advice from conversation"""
-        user_lower = user_message.lower()
-        
-        # Extract topics
-        topic_keywords = {
-            "sleep": ["sleep", "insomnia", "tired", "sleepy", "awake", "rest"],
-            "anxiety": ["anxious", "anxiety", "worried", "panic", "stress"],
-            "depression": ["sad", "depressed", "hopeless", "down", "empty"],
-            "work": ["work", "job", "boss", "colleague", "office", "career"],
-            "relationships": ["friend", "family", "partner", "relationship", "social"],
-            "health": ["health", "medication", "doctor", "physical", "body"]
-        }
+        user_labels = self.insight_matcher.classify(user_message)
         
-        for topic, keywords in topic_keywords.items():
-            if any(keyword in user_lower for keyword in keywords):
-                if topic not in session.topics_discussed:
-                    session.topics_discussed.append(topic)
-        
-        # Extract mood indicators
-        mood_keywords = {
-            "positive": ["good", "happy", "better", "great", "fine", "okay"],
-            "negative": ["bad", "terrible", "awful", "horrible", "worse"],
-            "anxious": ["anxious", "worried", "nervous", "stressed"],
-            "sad": ["sad", "down", "depressed", "hopeless", "empty"],
-            "tired": ["tired", "exhausted", "sleepy", "fatigue"]
-        }
-        
-        for mood, keywords in mood_keywords.items():
-            if any(keyword in user_lower for keyword in keywords):
-                if mood not in session.mood_indicators:
-                    session.mood_indicators.append(mood)
+        for label in user_labels:
+            kind, _, name = label.partition(":")
+            if kind == "topic" and name not in session.topics_discussed:
+                session.topics_discussed.append(name)
+            elif kind == "mood" and name not in session.mood_indicators:
+                session.mood_indicators.append(name)
         
         # Extract advice given (simple heuristic)
-        ai_lower = ai_response.lower()
-        advice_patterns = [
-            "try", "consider", "might help", "suggestion", "recommend", 
-            "could", "maybe", "perhaps", "what if", "how about"
-        ]
-        
-        if any(pattern in ai_lower for pattern in advice_patterns):
+        if "advice" in self.insight_matcher.classify(ai_response):
             # Simple extraction - in a real system, this would be more sophisticated
             advice_snippet = ai_response[:100] + "..." if len(ai_response) > 100 else ai_response
             if advice_snippet not in session.advice_given:
                 session.advice_given.append(advice_snippet)
         
         # Check for follow-ups needed
-        if any(word in user_lower for word in ["follow up", "next time", "again", "continue"]):
-            session.follow_ups_needed.append("User expressed interest in continuing conversation")
+        if "follow_up" in user_labels:
+            follow_up = "User expressed interest in continuing conversation"
+            if follow_up not in session.follow_ups_needed:
+                session.follow_ups_needed.append(follow_up)
 
 # Global memory manager instance
 memory_manager = MemoryManager()
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+In-process metrics exposed in Prometheus text format on /metrics
+
+Counters and histograms are kept per label set; `span(stage)` times a block of
+code into chat_stage_seconds so tail latency can be attributed to storage,
+prompt building or the upstream model. Gauges are read from callbacks at
+scrape time (cache occupancy, queue depth, ...).
+
+Values live in the process that recorded them. Under gunicorn each worker
+keeps its own, and a scrape of /metrics reports whichever worker answered it,
+not the sum across workers.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, List, Tuple
+
+# Seconds; spans from sub-millisecond cache hits to multi-second model calls
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labels: Iterable[Tuple[str, str]]) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in labels]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Counter:
+    """Monotonically increasing value per label set"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            return self._values.get(key, 0.0)
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(zip(self.labelnames, key))} {_format_value(value)}"
+                for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        self._series: Dict[Tuple[str, ...], List[float]] = {}  # key -> bucket counts + [sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(series)) for key, series in self._series.items())
+        lines = []
+        for key, series in items:
+            labels = list(zip(self.labelnames, key))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', _format_value(bound))])} "
+                             f"{_format_value(count)}")
+            lines.append(f"{self.name}_bucket{_format_labels(labels + [('le', '+Inf')])} "
+                         f"{_format_value(series[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(labels)} {_format_value(series[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(labels)} {_format_value(series[-1])}")
+        return lines
+
+
+class Gauge:
+    """Value read from a callback at scrape time; the callback may return a
+    number or a {label value: number} dict for a single label"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], object], labelname: str = None):
+        self.name = name
+        self.help = help_text
+        self.read = read
+        self.labelname = labelname
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if isinstance(value, dict):
+            return [f"{self.name}{_format_labels([(self.labelname, label)])} {_format_value(v)}"
+                    for label, v in sorted(value.items())]
+        return [f"{self.name} {_format_value(value)}"]
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for Prometheus"""
+
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric):
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, help_text, labelnames, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], object], labelname: str = None) -> Gauge:
+        with self._lock:
+            gauge = Gauge(name, help_text, read, labelname)
+            self._metrics[name] = gauge  # re-registering replaces the callback
+            return gauge
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+# Global registry and the metrics the chat pipeline reports
+registry = MetricsRegistry()
+
+STAGE_SECONDS = registry.histogram(
+    "chat_stage_seconds", "Time spent in each stage of a chat turn", ("stage",))
+REQUEST_SECONDS = registry.histogram(
+    "chat_request_seconds", "End-to-end chat request latency", ("endpoint",))
+FIRST_TOKEN_SECONDS = registry.histogram(
+    "chat_first_token_seconds", "Time from request start to the first streamed token")
+REQUESTS = registry.counter(
+    "chat_requests_total", "Chat requests handled", ("endpoint", "outcome"))
+LLM_TOKENS = registry.counter(
+    "llm_tokens_total", "Estimated tokens sent to and received from the model", ("kind",))
+LLM_ERRORS = registry.counter(
+    "llm_errors_total", "Failed upstream model calls", ("reason",))
+FALLBACKS = registry.counter(
+    "chat_fallbacks_total", "Turns answered with a canned fallback instead of the model", ("reason",))
+CRISIS_TURNS = registry.counter(
+    "chat_crisis_total", "Turns answered through the crisis fast path", ("endpoint",))
+LLM_ATTEMPTS = registry.counter(
+    "llm_attempts_total", "Upstream attempts by role (primary or hedge) and outcome", ("role", "outcome"))
+LLM_ATTEMPT_SECONDS = registry.histogram(
+    "llm_attempt_seconds", "Latency of successful upstream attempts (first token for streams)", ("role",))
+LLM_RETRIES = registry.counter(
+    "llm_retries_total", "Upstream calls retried after a retryable failure")
+HEDGES = registry.counter(
+    "llm_hedges_total", "Hedge requests sent because the primary passed the latency threshold")
+HEDGE_WINS = registry.counter(
+    "llm_hedge_wins_total", "Which attempt answered first once a hedge had been sent", ("winner",))
+CIRCUIT_REJECTIONS = registry.counter(
+    "llm_circuit_rejections_total", "Calls failed fast because the upstream circuit was open")
+ADMISSION_WAIT_SECONDS = registry.histogram(
+    "chat_admission_wait_seconds", "Time a turn waited for its session and an in-flight slot")
+ADMISSION_REJECTIONS = registry.counter(
+    "chat_admission_rejections_total", "Turns rejected with 429 by admission control", ("endpoint", "reason"))
+DUPLICATE_TURNS = registry.counter(
+    "chat_duplicate_turns_total", "Duplicate submissions answered without running a turn", ("endpoint", "source"))
+PROMPT_BUILD_SECONDS = registry.histogram(
+    "prompt_build_seconds", "Time to assemble the system prompt",
+    buckets=(0.00001, 0.000025, 0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.01))
+PROMPT_BYTES = registry.histogram(
+    "prompt_system_bytes", "Size of the assembled system prompt in bytes",
+    buckets=(2048, 3072, 4096, 5120, 6144, 8192, 12288, 16384))
+
+
+@contextmanager
+def span(stage: str):
+    """Time a block of code into chat_stage_seconds{stage=...}"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        STAGE_SECONDS.observe(time.perf_counter() - started, stage=stage)
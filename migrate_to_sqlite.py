@@ -0,0 +1,73 @@
+#!/usr/bin/env python3
+"""
+One-shot migration of the JSON user_data tree into the SQLite memory store
+
+Usage:
+    python migrate_to_sqlite.py                      # user_data/ -> user_data/memory.db
+    python migrate_to_sqlite.py --data-dir user_data --db /path/to/memory.db
+
+Safe to re-run: profiles and sessions are upserted and only missing messages
+are inserted.
+"""
+
+import argparse
+import os
+import sys
+
+from storage import FileStorageBackend, SQLiteStorageBackend
+
+
+def migrate(data_dir: str, db_path: str) -> dict:
+    """Copy every profile and session from the file tree into SQLite"""
+    source = FileStorageBackend(data_dir)
+    target = SQLiteStorageBackend(db_path)
+    stats = {"profiles": 0, "sessions": 0, "messages": 0, "errors": 0}
+
+    for user_id in source.list_users():
+        try:
+            profile = source.load_profile(user_id)
+            if profile:
+                target.save_profile(profile)
+                stats["profiles"] += 1
+        except Exception as e:
+            print(f"❌ Error migrating profile {user_id}: {e}")
+            stats["errors"] += 1
+
+        # Oldest first: SQLite stamps updated_at on save and lists by it
+        for session_id in reversed(source.list_sessions(user_id)):
+            try:
+                session = source.load_session(user_id, session_id)
+                if session:
+                    target.save_session(session)
+                    stats["sessions"] += 1
+                    stats["messages"] += len(session.messages)
+            except Exception as e:
+                print(f"❌ Error migrating session {session_id}: {e}")
+                stats["errors"] += 1
+
+    target.close()
+    return stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migrate user_data JSON files into SQLite")
+    parser.add_argument("--data-dir", default="user_data", help="Existing JSON data directory")
+    parser.add_argument("--db", default=None, help="SQLite database path (default: <data-dir>/memory.db)")
+    args = parser.parse_args()
+
+    if not os.path.isdir(args.data_dir):
+        print(f"❌ Data directory not found: {args.data_dir}")
+        sys.exit(1)
+
+    db_path = args.db or os.path.join(args.data_dir, "memory.db")
+    print(f"🚚 Migrating {args.data_dir} -> {db_path}")
+    stats = migrate(args.data_dir, db_path)
+    print(f"✅ Migrated {stats['profiles']} profiles, {stats['sessions']} sessions, "
+          f"{stats['messages']} messages ({stats['errors']} errors)")
+    print("💡 Start the server with MEMORY_BACKEND=sqlite to use the new store")
+    if stats["errors"]:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Data models for user profiles and chat sessions
+
+The models use __slots__ (no per-instance __dict__), messages are compact
+Message records instead of one dict each, and to_dict/from_dict are written
+out by hand rather than going through dataclasses.asdict's recursive deep
+copy. Sessions read with from_dict keep their raw message dicts and build the
+Message records on first access to .messages, so deserializing a session
+costs no more than the JSON parse for callers that only need its header.
+bench_models.py measures the difference.
+"""
+
+import threading
+from datetime import datetime
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional
+
+# ChatSession fields that only ever grow, and fields that are overwritten
+SESSION_LIST_FIELDS = ("topics_discussed", "mood_indicators", "advice_given", "follow_ups_needed")
+SESSION_SCALAR_FIELDS = ("risk_level", "session_summary", "summarized_messages", "ended_at")
+
+# Taken only to publish lazily loaded messages, never while loading them
+_LOAD_LOCK = threading.Lock()
+
+
+class Message:
+    """One chat message"""
+    __slots__ = ("role", "content", "timestamp")
+    
+    def __init__(self, role: str, content: str, timestamp: str = ""):
+        self.role = role
+        self.content = content
+        self.timestamp = timestamp
+    
+    def to_dict(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content, "timestamp": self.timestamp}
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "Message":
+        return cls(data["role"], data["content"], data.get("timestamp", ""))
+    
+    def __eq__(self, other) -> bool:
+        if not isinstance(other, Message):
+            return NotImplemented
+        return (self.role, self.content, self.timestamp) == (other.role, other.content, other.timestamp)
+    
+    def __repr__(self) -> str:
+        return f"Message(role={self.role!r}, content={self.content[:40]!r}, timestamp={self.timestamp!r})"
+
+
+def messages_from_dicts(messages: List[Dict[str, Any]]) -> List[Message]:
+    """Message records for a list of message dicts (Message.from_dict, inlined)"""
+    return [Message(msg["role"], msg["content"], msg.get("timestamp", "")) for msg in messages]
+
+
+class UserProfile:
+    """User profile with persistent information"""
+    __slots__ = ("user_id", "name", "age", "concerns", "preferences", "emergency_contact",
+                 "created_at", "last_active")
+    
+    def __init__(self, user_id: str, name: str = "", age: Optional[int] = None,
+                 concerns: Optional[List[str]] = None, preferences: Optional[Dict[str, Any]] = None,
+                 emergency_contact: str = "", created_at: str = "", last_active: str = ""):
+        self.user_id = user_id
+        self.name = name
+        self.age = age
+        self.concerns = concerns if concerns is not None else []
+        self.preferences = preferences if preferences is not None else {}
+        self.emergency_contact = emergency_contact
+        self.created_at = created_at or datetime.now().isoformat()
+        # Loading a profile counts as activity, so last_active is always now
+        self.last_active = datetime.now().isoformat()
+    
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "user_id": self.user_id,
+            "name": self.name,
+            "age": self.age,
+            "concerns": list(self.concerns),
+            "preferences": dict(self.preferences),
+            "emergency_contact": self.emergency_contact,
+            "created_at": self.created_at,
+            "last_active": self.last_active,
+        }
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "UserProfile":
+        return cls(
+            data["user_id"],
+            data.get("name", ""),
+            data.get("age"),
+            data.get("concerns"),
+            data.get("preferences"),
+            data.get("emergency_contact", ""),
+            data.get("created_at", ""),
+        )
+    
+    def __repr__(self) -> str:
+        return f"UserProfile(user_id={self.user_id!r}, name={self.name!r})"
+
+
+class ChatSession:
+    """Individual chat session data
+    
+    A session built by from_header() or from_dict() builds its messages only
+    when .messages is first accessed, so code that needs just the header
+    never reads or converts them.
+    """
+    __slots__ = ("session_id", "user_id", "topics_discussed", "mood_indicators", "advice_given",
+                 "follow_ups_needed", "risk_level", "session_summary", "summarized_messages",
+                 "started_at", "ended_at", "_messages", "_load_messages", "_message_count")
+    
+    def __init__(self, session_id: str, user_id: str, messages: Optional[List[Message]] = None,
+                 topics_discussed: Optional[List[str]] = None, mood_indicators: Optional[List[str]] = None,
+                 advice_given: Optional[List[str]] = None, follow_ups_needed: Optional[List[str]] = None,
+                 risk_level: str = "low", session_summary: str = "",
+                 summarized_messages: int = 0,  # messages already folded into session_summary
+                 started_at: str = "", ended_at: str = ""):
+        self.session_id = session_id
+        self.user_id = user_id
+        self.topics_discussed = topics_discussed if topics_discussed is not None else []
+        self.mood_indicators = mood_indicators if mood_indicators is not None else []
+        self.advice_given = advice_given if advice_given is not None else []
+        self.follow_ups_needed = follow_ups_needed if follow_ups_needed is not None else []
+        self.risk_level = risk_level
+        self.session_summary = session_summary
+        self.summarized_messages = summarized_messages
+        self.started_at = started_at or datetime.now().isoformat()
+        self.ended_at = ended_at
+        self._messages = messages if messages is not None else []
+        self._load_messages = None
+        self._message_count = 0
+    
+    @property
+    def messages(self) -> List[Message]:
+        if self._messages is None:
+            loaded = self._load_messages()
+            # Two threads may both load; the first to publish wins, so an
+            # append to the published list is never lost
+            with _LOAD_LOCK:
+                if self._messages is None:
+                    self._messages = loaded
+        return self._messages
+    
+    @messages.setter
+    def messages(self, messages: List[Message]):
+        self._messages = messages
+    
+    @property
+    def message_count(self) -> int:
+        return len(self._messages) if self._messages is not None else self._message_count
+    
+    @classmethod
+    def from_header(cls, header: Dict[str, Any],
+                    load_messages: Callable[[], List[Message]]) -> "ChatSession":
+        """Session from a stored header whose messages come from load_messages() on first access"""
+        session = cls.from_dict(header)
+        session._messages = None
+        session._load_messages = load_messages
+        session._message_count = header.get("message_count", 0)
+        return session
+    
+    @classmethod
+    def from_dict(cls, data: Dict[str, Any]) -> "ChatSession":
+        """Session from a stored dict; its message dicts are converted on first access"""
+        messages = data.get("messages")
+        session = cls(
+            data["session_id"],
+            data["user_id"],
+            None,
+            # Copied: headers may come from a cached manifest
+            list(data.get("topics_discussed") or ()),
+            list(data.get("mood_indicators") or ()),
+            list(data.get("advice_given") or ()),
+            list(data.get("follow_ups_needed") or ()),
+            data.get("risk_level", "low"),
+            data.get("session_summary", ""),
+            data.get("summarized_messages", 0),
+            data.get("started_at", ""),
+            data.get("ended_at", ""),
+        )
+        if messages:
+            session._messages = None
+            session._load_messages = partial(messages_from_dicts, messages)
+            session._message_count = len(messages)
+        return session
+    
+    def header(self) -> Dict[str, Any]:
+        """Copy of everything but the messages, plus their count; never loads messages"""
+        return {
+            "session_id": self.session_id,
+            "user_id": self.user_id,
+            "started_at": self.started_at,
+            "topics_discussed": list(self.topics_discussed),
+            "mood_indicators": list(self.mood_indicators),
+            "advice_given": list(self.advice_given),
+            "follow_ups_needed": list(self.follow_ups_needed),
+            "risk_level": self.risk_level,
+            "session_summary": self.session_summary,
+            "summarized_messages": self.summarized_messages,
+            "ended_at": self.ended_at,
+            "message_count": self.message_count,
+        }
+    
+    def to_dict(self) -> Dict[str, Any]:
+        data = self.header()
+        del data["message_count"]
+        data["messages"] = [msg.to_dict() for msg in self.messages]
+        return data
+    
+    def __repr__(self) -> str:
+        return f"ChatSession(session_id={self.session_id!r}, messages={self.message_count})"
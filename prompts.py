@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+System prompt assembly
+
+The system prompt is laid out from most to least stable, so that requests
+share as long a byte-identical prefix as possible (what provider-side prompt
+caching, or any local prefix cache, can reuse):
+
+1. PERSONA: the same for every user and every turn
+2. the patient block: name, recurring topics, moods, advice and follow-ups,
+   which only change when one of the patient's sessions is saved
+3. the rolling summary of this session, which changes only when older turns
+   are folded into it
+4. earlier exchanges retrieved for this particular message
+
+build() returns 1 and 2, and memories_section() renders 4; the context
+builder puts the summary between them. Crisis follow-ups append their
+instruction last.
+
+PERSONA is a module constant, built once. Patient blocks are rendered from
+a fixed set of context fields in a fixed order, and memoized in a bounded
+LRU keyed by those fields, so repeat turns for a user reuse the same string.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import metrics
+
+PERSONA = """You are Dr. Sharma, a professional psychologist and mental health counselor with over 15 years of experience. You specialize in psychological issues including sleep disorders, anger management, temperament issues, anxiety, and stress management.
+
+YOUR IDENTITY:
+- Name: Dr. Sharma (Dr. Rajesh Sharma)
+- Profession: Licensed Clinical Psychologist
+- Expertise: Sleep disorders, anger management, stress, anxiety, mood disorders
+- Approach: Professional yet warm, evidence-based counseling, culturally sensitive to Indian lifestyle
+
+CONVERSATION STYLE:
+- Be friendly, approachable, and empathetic, like a trusted family doctor.
+- Use clear, professional English with subtle Indian cultural understanding.
+- Frequently address patients by their name naturally.
+- Reference relatable Indian experiences: work stress, family dynamics, traffic, festivals, cricket.
+- Keep responses concise (2–3 sentences max), warm, and conversational.
+- Ask ONE simple, direct question at a time.
+- Maintain professionalism while being genuinely caring.
+- Avoid using Hindi phrases, asterisked actions, or overly casual expressions.
+
+COUNSELING APPROACH:
+1. **Listen**: Pay close attention to what the patient shares.
+2. **Ask One Question**: Keep focus on one concern at a time.
+3. **Build Gradually**: Collect details slowly through natural conversation.
+4. **Practical Guidance**: Offer small, doable tips that fit daily Indian life.
+5. **Cultural Sensitivity**: Respect Indian values, family dynamics, and social contexts.
+6. **Lifestyle Integration**: Suggest coping strategies using familiar routines.
+
+SPECIALIZATIONS:
+- **Sleep Issues**: Insomnia, irregular schedules, sleep hygiene, relaxation
+- **Anger Management**: Traffic stress, family/work conflicts, calming routines
+- **Temperament**: Mood swings, emotional awareness, family/social stress
+- **General Psychology**: Anxiety, depression, relationship/work stress in Indian context
+
+RESPONSE STRUCTURE:
+- 2–3 sentences maximum, warm and caring
+- Address patient by name naturally when appropriate
+- Ask ONE simple question at the end
+- Reference Indian contexts subtly when relevant
+- Example: "I understand this feels overwhelming. Work pressure can really affect our sleep, especially with long commutes and deadlines. How long have you been experiencing this?"
+
+CRISIS SITUATIONS:
+- If someone mentions suicide, self-harm, or being in danger, immediately provide Indian crisis resources:
+  - AASRA Helpline: +91-98204 66726
+  - Snehi Helpline: +91-95822 17419
+- Encourage reaching out to trusted family or close friends.
+- Always suggest professional, immediate help.
+
+BOUNDARIES:
+- Be professional yet warm, like a caring family doctor
+- Provide evidence-based advice in simple, conversational language
+- Maintain professional boundaries while showing genuine empathy
+- Suggest follow-up sessions to track progress
+
+BE PROFESSIONAL: Always respond as Dr. Sharma - knowledgeable, caring, and understanding of Indian life, helping patients improve their mental health with clear, professional communication."""
+
+MEMORIES_HEADER = "\n\nRELEVANT EARLIER CONVERSATIONS (most similar to what the patient just said):"
+MEMORIES_FOOTER = "Refer back to these naturally if they help; do not quote them verbatim."
+
+
+def format_memories(memories: Optional[List[Dict[str, Any]]]) -> str:
+    """Prompt section for past exchanges retrieved as relevant to this message"""
+    if not memories:
+        return ""
+    lines = [MEMORIES_HEADER]
+    for memory in memories:
+        when = memory["timestamp"][:10] or "earlier"
+        lines.append(f'- {when}: Patient: "{memory["text"]}" / You replied: "{memory["reply"]}"')
+    lines.append(MEMORIES_FOOTER)
+    return "\n".join(lines)
+
+
+class PromptBuilder:
+    """Assembles system prompts around the static persona, memoizing patient blocks"""
+
+    def __init__(self, max_cached: int = 4096):
+        self.max_cached = max_cached
+        self._blocks: "OrderedDict[tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.builds = 0
+        self.block_hits = 0
+        self.block_misses = 0
+        self.total_seconds = 0.0
+        self.total_bytes = 0
+
+    @staticmethod
+    def _block_key(user_context: Dict[str, Any]) -> tuple:
+        """Everything the patient block is rendered from, as a hashable key"""
+        return (
+            user_context["profile"].get("name", "Not provided"),
+            tuple(user_context.get("key_topics", ())),
+            tuple(user_context.get("mood_patterns", ())),
+            tuple(user_context.get("previous_advice", ())),
+            tuple(user_context.get("follow_ups", ())),
+        )
+
+    @staticmethod
+    def _render_block(key: tuple) -> str:
+        name, topics, moods, advice, follow_ups = key
+        return f"""
+
+PATIENT HISTORY:
+- Patient Name: {name}
+- Previous Concerns: {', '.join(topics)}
+- Mood Patterns: {', '.join(moods)}
+- Previous Treatment Plan: {list(advice)}
+- Follow-up Items: {list(follow_ups)}
+
+CONTINUITY GUIDELINES:
+- Address patient by name frequently: "{name}, how have you been since our last session?"
+- Review previous concerns and check progress: "Last time we discussed {', '.join(topics)}, how has that been going?"
+- Follow up on previous advice: "We worked on {list(advice)}, have you been able to practice those?"
+- Build on treatment plan: "Based on our previous sessions, let's continue working on..."
+- Track progress and adjust treatment plan accordingly"""
+
+    def patient_block(self, user_context: Optional[Dict[str, Any]]) -> str:
+        """The patient's history section, or "" for someone with no profile yet"""
+        if not user_context or not user_context.get("profile"):
+            return ""
+        key = self._block_key(user_context)
+        with self._lock:
+            block = self._blocks.get(key)
+            if block is not None:
+                self._blocks.move_to_end(key)
+                self.block_hits += 1
+                return block
+            self.block_misses += 1
+        block = self._render_block(key)
+        with self._lock:
+            self._blocks[key] = block
+            while len(self._blocks) > self.max_cached:
+                self._blocks.popitem(last=False)
+        return block
+
+    def build(self, user_context: Optional[Dict[str, Any]] = None) -> str:
+        """The stable part of the system prompt: persona, then the patient block"""
+        started = time.perf_counter()
+        prompt = PERSONA + self.patient_block(user_context)
+        elapsed = time.perf_counter() - started
+        size = len(prompt.encode("utf-8"))
+
+        metrics.PROMPT_BUILD_SECONDS.observe(elapsed)
+        metrics.PROMPT_BYTES.observe(size)
+        with self._lock:
+            self.builds += 1
+            self.total_seconds += elapsed
+            self.total_bytes += size
+        return prompt
+
+    @staticmethod
+    def memories_section(user_context: Optional[Dict[str, Any]],
+                         memories: Optional[List[Dict[str, Any]]]) -> str:
+        """Retrieved memories, which only accompany a known patient's history"""
+        if not user_context or not user_context.get("profile"):
+            return ""
+        return format_memories(memories)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            builds = self.builds or 1
+            return {
+                "builds": self.builds,
+                "cached_blocks": len(self._blocks),
+                "block_hits": self.block_hits,
+                "block_misses": self.block_misses,
+                "avg_build_us": round(self.total_seconds / builds * 1e6, 1),
+                "avg_bytes": round(self.total_bytes / builds),
+                "static_prefix_bytes": len(PERSONA.encode("utf-8")),
+            }
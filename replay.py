@@ -0,0 +1,264 @@
+#!/usr/bin/env python3
+"""
+Offline replay of recorded conversations through the chat pipeline
+
+Feeds conversation scripts through MentalHealthAPI.get_response, the same
+identity, context, prompt, retrieval and insight code the server runs, without
+HTTP. Conversations are spread over a process pool, each in a fresh
+temporary user_data directory, so results don't depend on which worker ran
+what, and a large corpus takes as long as the cores allow rather than the sum
+of its model latencies.
+
+Input is JSONL, one conversation per line:
+    {"id": "c1", "sessions": [["Hi, my name is Asha", "I can't sleep"], ["I'm back"]],
+     "responses": ["...", "...", "..."]}
+Each inner list is one session, started without a session id as the "New
+Session" button does, so a returning patient is recognised the way the app
+recognises them: by introducing themselves. "messages": [...] may stand in
+for a single session. "responses" is
+only needed for the recorded backend: model replies in call order (a crisis
+turn's follow-up takes one too).
+
+Backends:
+    stub      a local stub Mistral API per worker (stub_mistral.py)
+    recorded  the script's own "responses", returned in order
+    live      whatever OPENAI_BASE_URL / OPENAI_API_KEY point at
+
+Results are written as JSONL as conversations finish: every turn's reply,
+session and timing, each session's extracted insights, and the user context
+the conversation leaves behind.
+
+Usage:
+    python replay.py conversations.jsonl --output results.jsonl
+    python replay.py conversations.jsonl --output results.jsonl --backend recorded --workers 8
+"""
+
+import argparse
+import builtins
+import json
+import os
+import shutil
+import tempfile
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Any, Dict, Iterator, List
+
+BACKENDS = ("stub", "recorded", "live")
+
+# Per-worker state, set up by _init_worker
+_worker: Dict[str, Any] = {}
+
+
+class RecordedLLMClient:
+    """Stands in for the upstream client, answering from a list of recorded replies"""
+
+    model = "recorded"
+
+    def __init__(self):
+        self.replies: List[str] = []
+
+    def load(self, replies: List[str]):
+        self.replies = list(reversed(replies))
+
+    def _next(self) -> str:
+        from llm_client import LLMError
+        if not self.replies:
+            raise LLMError("No recorded response left for this call")
+        return self.replies.pop()
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self._next()
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        yield self._next()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"recorded_left": len(self.replies)}
+
+
+class InlineExecutor:
+    """Runs crisis follow-ups on the calling thread, so turns replay in order"""
+
+    def submit(self, fn, *args, **kwargs) -> Future:
+        future = Future()
+        try:
+            future.set_result(fn(*args, **kwargs))
+        except BaseException as e:
+            future.set_exception(e)
+        return future
+
+    def shutdown(self, wait: bool = True):
+        pass
+
+
+def read_scripts(path: str) -> Iterator[Dict[str, Any]]:
+    with open(path, 'r', encoding='utf-8') as f:
+        for number, line in enumerate(f, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            script = json.loads(line)
+            script.setdefault("id", f"line-{number}")
+            if "sessions" not in script:
+                script["sessions"] = [script.get("messages", [])]
+            yield script
+
+
+def _init_worker(root: str, backend: str, latency: float, memory_backend: str, verbose: bool):
+    """Process pool initializer: silence the app, pick the model backend, import the app"""
+    if not verbose:
+        builtins.print = lambda *a, **k: None
+
+    root = tempfile.mkdtemp(prefix=f"worker{os.getpid()}_", dir=root)
+    os.environ["MEMORY_BACKEND"] = memory_backend
+    # Deterministic and self-contained: synchronous saves, no shared-session locking
+    os.environ["MEMORY_WRITE_BEHIND"] = "0"
+    os.environ["SHARED_SESSIONS"] = "0"
+    os.environ["ARCHIVE_INTERVAL"] = "0"
+
+    stub = None
+    if backend == "stub":
+        from stub_mistral import StubMistralServer
+        stub = StubMistralServer(port=0, latency=latency, seed=os.getpid()).start()
+        os.environ["OPENAI_BASE_URL"] = stub.base_url
+
+    # The app builds its default MemoryManager at import time, relative to the cwd
+    os.chdir(root)
+    import api_server
+
+    if backend == "recorded":
+        api_server.llm_client = RecordedLLMClient()
+    _worker.update(root=root, stub=stub, api_server=api_server, backend=backend)
+
+
+def replay_conversation(script: Dict[str, Any], keep_data: bool = False) -> Dict[str, Any]:
+    """Run one conversation in its own user_data directory and report what happened"""
+    from memory_system import MemoryManager
+    from crisis import FALLBACK_RESPONSE
+
+    api_server = _worker["api_server"]
+    data_dir = tempfile.mkdtemp(prefix="conv_", dir=_worker["root"])
+    # Fresh storage and a fresh API instance per conversation; the app's
+    # functions look up memory_manager as a module global
+    memory = MemoryManager(data_dir=data_dir)
+    api_server.memory_manager = memory
+    api = api_server.MentalHealthAPI()
+    api.background.shutdown(wait=False)
+    api.background = InlineExecutor()
+    if _worker["backend"] == "recorded":
+        api_server.llm_client.load(script.get("responses", []))
+
+    result = {"id": script["id"], "worker": os.getpid(), "turns": [], "sessions": [], "error": None}
+    started = time.perf_counter()
+    user_ids = []
+    try:
+        for session_index, messages in enumerate(script["sessions"]):
+            session_id = None
+            for message in messages:
+                turn_started = time.perf_counter()
+                response, session_id = api.get_response(message, session_id)
+                # Index this turn before the next one recalls from it, as a live
+                # chat's pace would allow
+                memory.flush()
+                user_id = api.identities.owner(session_id) or ""
+                result["turns"].append({
+                    "session": session_index,
+                    "message": message,
+                    "response": response,
+                    "session_id": session_id,
+                    "user_id": user_id,
+                    "fallback": response == FALLBACK_RESPONSE,
+                    "seconds": round(time.perf_counter() - turn_started, 4),
+                })
+            if session_id:
+                session = memory.load_session(api.identities.owner(session_id) or "", session_id)
+                if session:
+                    user_ids.append(session.user_id)
+                    result["sessions"].append(session.header())
+
+        # What the next conversation with each user would start from
+        result["contexts"] = {
+            user_id: {key: context[key] for key in ("key_topics", "mood_patterns", "previous_advice", "follow_ups")}
+            for user_id in dict.fromkeys(user_ids)
+            for context in [memory.get_user_context(user_id)]
+        }
+    except Exception as e:
+        result["error"] = f"{type(e).__name__}: {e}"
+    finally:
+        memory.close()
+        if not keep_data:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    result["seconds"] = round(time.perf_counter() - started, 4)
+    return result
+
+
+def run(args) -> Dict[str, Any]:
+    workers = args.workers or os.cpu_count() or 1
+    scripts = read_scripts(args.input)
+    summary = {"conversations": 0, "turns": 0, "fallbacks": 0, "errors": 0, "conversation_seconds": 0.0}
+
+    # Workers keep their data under one directory, removed at the end
+    root = tempfile.mkdtemp(prefix="mh_replay_")
+    started = time.perf_counter()
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(root, args.backend, args.latency, args.memory_backend, args.verbose)) as pool, \
+                open(args.output, 'w', encoding='utf-8') as out:
+            pending = set()
+            exhausted = False
+            while pending or not exhausted:
+                # Keep a bounded number of conversations queued, so the corpus is streamed
+                while not exhausted and len(pending) < workers * 4:
+                    script = next(scripts, None)
+                    if script is None:
+                        exhausted = True
+                    else:
+                        pending.add(pool.submit(replay_conversation, script, args.keep_data))
+                if not pending:
+                    break
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    result = future.result()
+                    out.write(json.dumps(result, ensure_ascii=False) + "\n")
+                    summary["conversations"] += 1
+                    summary["turns"] += len(result["turns"])
+                    summary["fallbacks"] += sum(turn["fallback"] for turn in result["turns"])
+                    summary["errors"] += result["error"] is not None
+                    summary["conversation_seconds"] += result["seconds"]
+                out.flush()
+    finally:
+        if args.keep_data:
+            print(f"📁 Conversation data kept in {root}")
+        else:
+            shutil.rmtree(root, ignore_errors=True)
+
+    summary["elapsed_seconds"] = round(time.perf_counter() - started, 3)
+    summary["conversation_seconds"] = round(summary["conversation_seconds"], 3)
+    summary["workers"] = workers
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay recorded conversations through the chat pipeline")
+    parser.add_argument("input", help="Conversation scripts (JSONL)")
+    parser.add_argument("--output", required=True, help="Results file (JSONL), written as conversations finish")
+    parser.add_argument("--backend", default="stub", choices=BACKENDS, help="Where model replies come from")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: one per core)")
+    parser.add_argument("--latency", type=float, default=0.0, help="Stub time to first token (s)")
+    parser.add_argument("--memory-backend", default="file", choices=["file", "sqlite"], help="Storage backend")
+    parser.add_argument("--keep-data", action="store_true", help="Keep each conversation's user_data")
+    parser.add_argument("--verbose", action="store_true", help="Keep the app's log output")
+    args = parser.parse_args()
+
+    print(f"🔁 Replaying {args.input} with the {args.backend} backend")
+    summary = run(args)
+    print(f"✅ {summary['conversations']} conversations ({summary['turns']} turns) in "
+          f"{summary['elapsed_seconds']}s on {summary['workers']} workers; "
+          f"{summary['conversation_seconds']}s if run one at a time")
+    if summary["fallbacks"] or summary["errors"]:
+        print(f"⚠️  {summary['fallbacks']} fallback replies, {summary['errors']} conversations failed")
+    print(f"📝 Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
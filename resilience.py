@@ -0,0 +1,327 @@
+#!/usr/bin/env python3
+"""
+Upstream resilience for the Mistral call
+
+ResilientLLMClient wraps AsyncLLMClient with the same blocking
+`complete`/`stream` interface and adds:
+
+- per-attempt deadlines (time to the full reply, or to the first token of a
+  stream) and an overall deadline per call, so p99 latency stays bounded
+- retries with full-jitter exponential backoff for timeouts, connection
+  errors, 429 and 5xx responses
+- hedging: once an attempt has run longer than the recent p95, a second
+  request goes out (to LLM_HEDGE_MODEL if set, else the same model) and the
+  first to answer wins; the other is cancelled
+- a circuit breaker that fails fast while the provider keeps failing and
+  lets a single probe through after a cool-down
+
+Streams are retried and hedged only until their first token arrives.
+"""
+
+import asyncio
+import math
+import os
+import random
+import threading
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional
+
+import metrics
+from llm_client import AsyncLLMClient, LLMError
+
+RETRYABLE_STATUSES = (408, 425, 429, 500, 502, 503, 504)
+
+
+class CircuitOpenError(LLMError):
+    """Raised without calling upstream while the circuit breaker is open"""
+
+
+class CircuitBreaker:
+    """Opens after consecutive failures; half-opens after reset_timeout"""
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened = 0
+        self._opened_at = 0.0
+        self._probe_started: Optional[float] = None
+        self._lock = threading.Lock()
+
+    def allow(self) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self.state == "open":
+                if now - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = "half_open"
+            if self.state == "half_open":
+                # One probe at a time; a probe that never reports back expires
+                if self._probe_started is not None and now - self._probe_started < self.reset_timeout:
+                    return False
+                self._probe_started = now
+            return True
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probe_started = None
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                if self.state != "open":
+                    self.opened += 1
+                self.state = "open"
+                self._opened_at = time.monotonic()
+                self._probe_started = None
+
+
+class LatencyTracker:
+    """Rolling latency window used to pick the hedge delay"""
+
+    def __init__(self, window: int = 200, percentile: float = 95.0, min_samples: int = 20,
+                 initial_delay: float = 3.0, min_delay: float = 0.25):
+        self.percentile = percentile
+        self.min_samples = min_samples
+        self.initial_delay = initial_delay
+        self.min_delay = min_delay
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def threshold(self) -> float:
+        """Seconds after which an attempt is slower than usual and worth hedging"""
+        with self._lock:
+            if len(self._samples) < self.min_samples:
+                return self.initial_delay
+            ordered = sorted(self._samples)
+        rank = max(1, math.ceil(self.percentile / 100.0 * len(ordered)))
+        return max(self.min_delay, ordered[rank - 1])
+
+
+class ResilientLLMClient:
+    """Deadlines, retries, hedging and a circuit breaker around AsyncLLMClient"""
+
+    def __init__(self, client: AsyncLLMClient, attempt_timeout: float = 20.0, deadline: float = 45.0,
+                 max_retries: int = 2, retry_base: float = 0.25, retry_max: float = 2.0,
+                 hedge: bool = True, hedge_model: Optional[str] = None,
+                 breaker: Optional[CircuitBreaker] = None,
+                 complete_latency: Optional[LatencyTracker] = None,
+                 first_token_latency: Optional[LatencyTracker] = None):
+        self.client = client
+        self.attempt_timeout = attempt_timeout
+        self.deadline = deadline
+        self.max_retries = max_retries
+        self.retry_base = retry_base
+        self.retry_max = retry_max
+        self.hedge = hedge
+        self.hedge_model = hedge_model
+        self.breaker = breaker or CircuitBreaker()
+        self.complete_latency = complete_latency or LatencyTracker()
+        self.first_token_latency = first_token_latency or LatencyTracker(initial_delay=1.5)
+
+    @classmethod
+    def from_env(cls, client: AsyncLLMClient) -> "ResilientLLMClient":
+        """Wrap client using LLM_* resilience settings from the environment"""
+        percentile = float(os.environ.get("LLM_HEDGE_PERCENTILE", 95))
+        return cls(
+            client,
+            attempt_timeout=float(os.environ.get("LLM_ATTEMPT_TIMEOUT", 20)),
+            deadline=float(os.environ.get("LLM_DEADLINE", 45)),
+            max_retries=int(os.environ.get("LLM_MAX_RETRIES", 2)),
+            retry_base=float(os.environ.get("LLM_RETRY_BASE", 0.25)),
+            retry_max=float(os.environ.get("LLM_RETRY_MAX", 2)),
+            hedge=os.environ.get("LLM_HEDGE", "1") != "0",
+            hedge_model=os.environ.get("LLM_HEDGE_MODEL") or None,
+            breaker=CircuitBreaker(
+                failure_threshold=int(os.environ.get("LLM_BREAKER_FAILURES", 5)),
+                reset_timeout=float(os.environ.get("LLM_BREAKER_RESET", 30))
+            ),
+            complete_latency=LatencyTracker(percentile=percentile),
+            first_token_latency=LatencyTracker(percentile=percentile, initial_delay=1.5),
+        )
+
+    @property
+    def model(self) -> str:
+        return self.client.model
+
+    # Blocking facade, same as AsyncLLMClient
+
+    def complete(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        return self.client.run(self.chat_completion(messages, **kwargs))
+
+    def stream(self, messages: List[Dict[str, str]], **kwargs) -> Iterator[str]:
+        return self.client.iterate(lambda: self.stream_chat_completion(messages, **kwargs))
+
+    def close(self):
+        self.client.close()
+
+    # Coroutine API
+
+    async def chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> str:
+        async def attempt(model: Optional[str]) -> str:
+            call = self.client.chat_completion(messages, **dict(kwargs, model=model or kwargs.get("model")))
+            try:
+                return await asyncio.wait_for(call, self.attempt_timeout)
+            except asyncio.TimeoutError as e:
+                raise LLMError(f"Upstream attempt exceeded {self.attempt_timeout}s") from e
+
+        return await self._call(attempt, self.complete_latency)
+
+    async def stream_chat_completion(self, messages: List[Dict[str, str]], **kwargs) -> AsyncIterator[str]:
+        async def attempt(model: Optional[str]):
+            tokens = self.client.stream_chat_completion(
+                messages, **dict(kwargs, model=model or kwargs.get("model"))
+            ).__aiter__()
+            try:
+                first = await asyncio.wait_for(tokens.__anext__(), self.attempt_timeout)
+            except StopAsyncIteration:
+                first = None
+            except asyncio.TimeoutError as e:
+                await tokens.aclose()
+                raise LLMError(f"No first token within {self.attempt_timeout}s") from e
+            except BaseException:
+                await tokens.aclose()
+                raise
+            return first, tokens
+
+        def discard(result):
+            # A second stream that also got going; stop reading it
+            asyncio.ensure_future(result[1].aclose())
+
+        first, tokens = await self._call(attempt, self.first_token_latency, discard)
+        try:
+            if first is None:
+                return
+            yield first
+            async for token in tokens:
+                yield token
+        finally:
+            await tokens.aclose()
+
+    # Internals
+
+    @staticmethod
+    def _retryable(error: LLMError) -> bool:
+        if isinstance(error, CircuitOpenError):
+            return False
+        return error.status is None or error.status in RETRYABLE_STATUSES
+
+    async def _call(self, attempt: Callable[[Optional[str]], Any], latency: LatencyTracker,
+                    discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """Retry hedged attempts until one succeeds, the error is final or time runs out"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.deadline
+        for retry in range(self.max_retries + 1):
+            if not self.breaker.allow():
+                metrics.CIRCUIT_REJECTIONS.inc()
+                raise CircuitOpenError("Upstream circuit is open; failing fast")
+            try:
+                return await asyncio.wait_for(self._hedged(attempt, latency, discard),
+                                              max(0.0, deadline - loop.time()))
+            except asyncio.TimeoutError as e:
+                raise LLMError(f"Upstream call exceeded its {self.deadline}s deadline") from e
+            except LLMError as e:
+                if retry == self.max_retries or not self._retryable(e):
+                    raise
+                delay = random.uniform(0, min(self.retry_max, self.retry_base * (2 ** retry)))
+                if loop.time() + delay >= deadline:
+                    raise
+                metrics.LLM_RETRIES.inc()
+                print(f"🔁 Retrying upstream call in {delay:.2f}s: {e}")
+                await asyncio.sleep(delay)
+
+    async def _hedged(self, attempt: Callable[[Optional[str]], Any], latency: LatencyTracker,
+                      discard: Optional[Callable[[Any], None]]) -> Any:
+        """One attempt, plus a hedge if it runs past the latency threshold; first success wins"""
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        hedge_after = latency.threshold()
+        tasks = {asyncio.ensure_future(self._tracked(attempt, "primary", latency)): "primary"}
+        hedged = False
+        winner = None
+        error = None
+        try:
+            while tasks:
+                timeout = None
+                if self.hedge and not hedged:
+                    timeout = max(0.0, hedge_after - (loop.time() - started))
+                done, _ = await asyncio.wait(tasks, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    # The primary is slower than usual: race a second request against it
+                    if not self.breaker.allow():
+                        hedged = True
+                        continue
+                    hedged = True
+                    metrics.HEDGES.inc()
+                    tasks[asyncio.ensure_future(self._tracked(attempt, "hedge", latency))] = "hedge"
+                    continue
+                for task in done:
+                    role = tasks.pop(task)
+                    if task.exception() is not None:
+                        error = task.exception()
+                    elif winner is None:
+                        winner = (role, task.result())
+                    elif discard:
+                        discard(task.result())
+                if winner is not None:
+                    if hedged:
+                        metrics.HEDGE_WINS.inc(winner=winner[0])
+                    return winner[1]
+                if not hedged:
+                    # The primary failed before a hedge was due; let the retry loop decide
+                    break
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+            if tasks:
+                await asyncio.gather(*tasks, return_exceptions=True)
+
+    async def _tracked(self, attempt: Callable[[Optional[str]], Any], role: str, latency: LatencyTracker) -> Any:
+        """Run one attempt, feeding the breaker, latency window and metrics"""
+        model = self.hedge_model if role == "hedge" else None
+        started = time.perf_counter()
+        try:
+            result = await attempt(model)
+        except asyncio.CancelledError:
+            metrics.LLM_ATTEMPTS.inc(role=role, outcome="cancelled")
+            if role == "primary":
+                # At least this slow; keeps the p95 honest when slow primaries lose to hedges
+                latency.record(time.perf_counter() - started)
+            raise
+        except Exception as e:
+            metrics.LLM_ATTEMPTS.inc(role=role, outcome="error")
+            self.breaker.record_failure()
+            if not isinstance(e, LLMError):
+                raise LLMError(f"Upstream attempt failed: {e}") from e
+            raise
+        elapsed = time.perf_counter() - started
+        metrics.LLM_ATTEMPTS.inc(role=role, outcome="success")
+        metrics.LLM_ATTEMPT_SECONDS.observe(elapsed, role=role)
+        self.breaker.record_success()
+        if role == "primary":
+            latency.record(elapsed)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "circuit": self.breaker.state,
+            "consecutive_failures": self.breaker.failures,
+            "circuit_opened": self.breaker.opened,
+            "hedge": self.hedge,
+            "hedge_model": self.hedge_model or self.client.model,
+            "hedge_after_seconds": round(self.complete_latency.threshold(), 3),
+            "hedge_first_token_after_seconds": round(self.first_token_latency.threshold(), 3),
+            "attempt_timeout_seconds": self.attempt_timeout,
+            "deadline_seconds": self.deadline,
+            "max_retries": self.max_retries,
+        }
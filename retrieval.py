@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+"""
+Per-user retrieval over past conversations
+
+Every patient message is embedded when its session is saved, together with
+the reply it got, and appended to that user's index. Each turn, the current
+message is matched against the index and only the few most similar
+exchanges from earlier sessions go into the system prompt. So the prompt
+stays the same size however long a patient's history gets, and nothing is
+forgotten just because it is older than the last few sessions.
+
+Embeddings are local and need no model download: words and character
+trigrams are hashed into a fixed-size signed vector (the "hashing trick"),
+sublinearly scaled and L2-normalized, so a dot product is cosine similarity.
+Top-k search over one user's index is a single matrix-vector product.
+
+On disk, each user has two append-only files under user_data/index/:
+    <user_id>.f32    float32 rows, one per snippet
+    <user_id>.jsonl  one metadata line per row (session, message, text)
+Appends happen under a per-user file lock. Readers pick up rows appended by
+other worker processes by reading whatever has grown since the last look.
+drop_sessions() (the archive's per-user cap) rewrites both files and swaps
+them in; readers notice the new file and reload it.
+"""
+
+import json
+import os
+import re
+import threading
+import zlib
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional
+
+import numpy as np
+
+from file_lock import StripedFileLocks
+from models import ChatSession
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# Too common in chat to say anything about what a message is about
+STOPWORDS = frozenset("""
+a about am an and are as at be been but by can could did do does doing don't for from
+had has have having he her him his how i i'm i've if in into is it it's its just me my
+myself no not of on or our so some than that the their them then there these they this
+to too very was we were what when where which who why will with would you your
+""".split())
+
+SUFFIXES = ("ing", "ed", "es", "s", "ly")
+
+
+def _stem(word: str) -> str:
+    """Crude suffix stripping so "sleeping" and "sleep" share a word feature"""
+    for suffix in SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            return word[:-len(suffix)]
+    return word
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _replace_file(path: str, data: bytes):
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(data)
+    os.replace(tmp, path)
+
+
+def _clip(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars].rstrip() + "..."
+
+
+class HashedEmbedder:
+    """Maps text to a fixed-size unit vector of hashed word and trigram features"""
+
+    def __init__(self, dim: int = 1024, word_weight: float = 1.0, trigram_weight: float = 0.5):
+        self.dim = dim
+        self.word_weight = word_weight
+        self.trigram_weight = trigram_weight
+
+    def _features(self, text: str) -> Iterable[tuple]:
+        for word in _WORD_RE.findall(text.lower()):
+            if word in STOPWORDS:
+                continue
+            word = _stem(word)
+            yield word, self.word_weight
+            padded = f"<{word}>"
+            for i in range(len(padded) - 2):
+                yield padded[i:i + 3], self.trigram_weight
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        """(len(texts), dim) float32 matrix; rows with no features stay zero"""
+        rows, cols, values = [], [], []
+        for row, text in enumerate(texts):
+            for feature, weight in self._features(text):
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                rows.append(row)
+                cols.append(h % self.dim)
+                values.append(weight if h & 0x80000000 else -weight)
+
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        np.add.at(matrix, (np.asarray(rows, dtype=np.intp), np.asarray(cols, dtype=np.intp)),
+                  np.asarray(values, dtype=np.float32))
+        np.copysign(np.log1p(np.abs(matrix)), matrix, out=matrix)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        np.divide(matrix, norms, out=matrix, where=norms > 0)
+        return matrix
+
+
+class UserIndex:
+    """One user's snippet vectors and metadata, mirrored from their index files"""
+
+    def __init__(self, vectors_path: str, meta_path: str, dim: int):
+        self.vectors_path = vectors_path
+        self.meta_path = meta_path
+        self.dim = dim
+        self.row_bytes = dim * 4
+        self.lock = threading.Lock()
+        self._file_id = None  # inode of the metadata file the rows were read from
+        self._reset()
+
+    def _reset(self):
+        self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+        self.meta: List[Dict[str, Any]] = []
+        self.session_codes = np.zeros(0, dtype=np.int32)
+        self.codes: Dict[str, int] = {}
+        self.indexed: Dict[str, int] = {}  # session_id -> messages already indexed
+        self._meta_bytes = 0
+
+    def refresh(self):
+        """Read rows appended since the last refresh, by this or another process"""
+        try:
+            with open(self.meta_path, "rb") as f:
+                file_id = os.fstat(f.fileno()).st_ino
+                if file_id != self._file_id:
+                    if self._file_id is not None:
+                        self._reset()  # rewritten by drop_sessions: start over
+                    self._file_id = file_id
+                f.seek(self._meta_bytes)
+                tail = f.read()
+        except FileNotFoundError:
+            return
+        # Only whole lines: a writer may be midway through one
+        complete = tail[:tail.rfind(b"\n") + 1]
+        if not complete:
+            return
+        records = [json.loads(line) for line in complete.decode("utf-8").splitlines() if line]
+
+        # Vectors are written before their metadata, so these rows are complete
+        start = len(self.meta)
+        with open(self.vectors_path, "rb") as f:
+            f.seek(start * self.row_bytes)
+            rows = np.frombuffer(f.read(len(records) * self.row_bytes), dtype=np.float32)
+        rows = rows.reshape(-1, self.dim)
+        if len(rows) < len(records):
+            return  # index damaged by a crash mid-append; retried on the next append
+
+        self._meta_bytes += len(complete)
+        self._add(records, rows)
+
+    def _add(self, records: List[Dict[str, Any]], rows: np.ndarray):
+        codes = []
+        for record in records:
+            session_id = record["session_id"]
+            codes.append(self.codes.setdefault(session_id, len(self.codes)))
+            self.indexed[session_id] = max(self.indexed.get(session_id, 0), record["message"] + 2)
+        self.meta.extend(records)
+        self.vectors = np.concatenate([self.vectors, rows]) if len(self.vectors) else rows.copy()
+        self.session_codes = np.concatenate([self.session_codes, np.asarray(codes, dtype=np.int32)])
+
+    def append(self, records: List[Dict[str, Any]], rows: np.ndarray):
+        """Persist and load new rows (caller holds the user's file lock, after refresh())"""
+        # Cut anything past what refresh() accepted: leftovers of a crashed append
+        expected = len(self.meta) * self.row_bytes
+        with open(self.vectors_path, "ab") as f:
+            if f.tell() != expected:
+                f.truncate(expected)
+            f.write(rows.astype(np.float32).tobytes())
+        payload = "".join(_dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self.meta_path, "ab") as f:
+            if f.tell() != self._meta_bytes:
+                f.truncate(self._meta_bytes)
+            f.write(payload)
+        self._meta_bytes += len(payload)
+        self._add(records, rows)
+
+    def rewrite(self, keep: List[int]):
+        """Replace both files with only the rows in keep (caller holds the user's file lock, after refresh())"""
+        records = [self.meta[row] for row in keep]
+        rows = self.vectors[keep]
+        payload = "".join(_dumps(record) + "\n" for record in records).encode("utf-8")
+        # Vectors first: a reader only starts over once the metadata file changes
+        _replace_file(self.vectors_path, rows.astype(np.float32).tobytes())
+        _replace_file(self.meta_path, payload)
+        self._reset()
+        self._file_id = os.stat(self.meta_path).st_ino
+        self._meta_bytes = len(payload)
+        if records:
+            self._add(records, rows)
+
+    def search(self, query: np.ndarray, k: int, exclude_session: Optional[str] = None) -> List[tuple]:
+        """(score, row) pairs for the k most similar rows, best first"""
+        if not len(self.meta):
+            return []
+        scores = self.vectors @ query
+        if exclude_session in self.codes:
+            scores[self.session_codes == self.codes[exclude_session]] = -1.0
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        return [(float(scores[row]), int(row)) for row in top]
+
+
+class RetrievalIndex:
+    """Per-user similarity search over past exchanges, kept current by save_session"""
+
+    def __init__(self, index_dir: str, dim: int = 1024, top_k: int = 3, min_score: float = 0.15,
+                 max_cached_users: int = 256, snippet_chars: int = 240):
+        self.index_dir = index_dir
+        self.embedder = HashedEmbedder(dim)
+        self.top_k = top_k
+        self.min_score = min_score
+        self.max_cached_users = max_cached_users
+        self.snippet_chars = snippet_chars
+        os.makedirs(index_dir, exist_ok=True)
+        self._locks = StripedFileLocks(os.path.join(os.path.dirname(index_dir), "locks"), "index")
+        self._users: "OrderedDict[str, UserIndex]" = OrderedDict()
+        self._users_lock = threading.Lock()
+
+        self.indexed_snippets = 0
+        self.searches = 0
+
+    def _paths(self, user_id: str):
+        base = os.path.join(self.index_dir, user_id)
+        return f"{base}.f32", f"{base}.jsonl"
+
+    def exists(self, user_id: str) -> bool:
+        return os.path.exists(self._paths(user_id)[1])
+
+    def _user(self, user_id: str) -> UserIndex:
+        with self._users_lock:
+            index = self._users.get(user_id)
+            if index is None:
+                index = self._users[user_id] = UserIndex(*self._paths(user_id), self.embedder.dim)
+                while len(self._users) > self.max_cached_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            return index
+
+    def add_session(self, session: ChatSession) -> int:
+        """Index the session's exchanges not indexed yet; returns how many were added"""
+        index = self._user(session.user_id)
+        with self._locks.hold(session.user_id), index.lock:
+            index.refresh()
+            messages = session.messages
+            records = []
+            for position in range(index.indexed.get(session.session_id, 0), len(messages)):
+                message = messages[position]
+                if message.role != "user" or not message.content.strip():
+                    continue
+                reply = messages[position + 1] if position + 1 < len(messages) else None
+                if reply is None or reply.role != "assistant":
+                    continue  # index the exchange once its reply is in
+                records.append({
+                    "session_id": session.session_id,
+                    "message": position,
+                    "timestamp": message.timestamp,
+                    "text": _clip(message.content, self.snippet_chars),
+                    "reply": _clip(reply.content, self.snippet_chars),
+                })
+            if records:
+                index.append(records, self.embedder.embed([record["text"] for record in records]))
+                self.indexed_snippets += len(records)
+            return len(records)
+
+    def drop_sessions(self, user_id: str, session_ids: Iterable[str]) -> int:
+        """Forget every snippet of the given sessions; returns how many were removed"""
+        if not self.exists(user_id):
+            return 0
+        drop = set(session_ids)
+        index = self._user(user_id)
+        with self._locks.hold(user_id), index.lock:
+            index.refresh()
+            keep = [row for row, record in enumerate(index.meta) if record["session_id"] not in drop]
+            removed = len(index.meta) - len(keep)
+            if removed:
+                index.rewrite(keep)
+        return removed
+
+    def session_bytes(self, user_id: str) -> Dict[str, int]:
+        """Bytes each session takes up in the user's index files, read from disk"""
+        sizes: Dict[str, int] = {}
+        row_bytes = self.embedder.dim * 4
+        try:
+            with open(self._paths(user_id)[1], "rb") as f:
+                for line in f:
+                    if line.endswith(b"\n"):
+                        session_id = json.loads(line)["session_id"]
+                        sizes[session_id] = sizes.get(session_id, 0) + len(line) + row_bytes
+        except FileNotFoundError:
+            pass
+        return sizes
+
+    def search(self, user_id: str, query: str, exclude_session: Optional[str] = None,
+               k: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Most similar past exchanges for query, skipping the current session"""
+        k = k or self.top_k
+        query_vector = self.embedder.embed([query])[0]
+        if not query_vector.any():
+            return []
+        index = self._user(user_id)
+        with index.lock:
+            index.refresh()
+            # Over-fetch a little so repeated messages can be dropped
+            hits = index.search(query_vector, k * 2, exclude_session)
+            results, seen = [], set()
+            for score, row in hits:
+                record = index.meta[row]
+                if score < self.min_score or record["text"] in seen:
+                    continue
+                seen.add(record["text"])
+                results.append(dict(record, score=round(score, 4)))
+                if len(results) == k:
+                    break
+        self.searches += 1
+        return results
+
+    def stats(self) -> Dict[str, Any]:
+        with self._users_lock:
+            users = list(self._users.values())
+        return {
+            "cached_users": len(users),
+            "cached_snippets": sum(len(index.meta) for index in users),
+            "indexed_snippets": self.indexed_snippets,
+            "searches": self.searches,
+            "dim": self.embedder.dim,
+            "top_k": self.top_k,
+            "min_score": self.min_score,
+        }
@@ -0,0 +1,246 @@
+#!/usr/bin/env python3
+"""
+Bounded in-memory store for live chat sessions
+
+Keeps recently used ChatSessions in memory for the server, evicting the least
+recently used ones once a session, message or byte cap is reached, and any that
+have sat idle past a TTL. Every turn is persisted by MemoryManager, so an
+evicted session is simply reloaded from storage on its next message.
+
+SharedSessionCache is the variant for several worker processes serving the
+same sessions: cached copies are revalidated against storage and every turn
+is committed under a per-session file lock.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional
+
+from file_lock import StripedFileLocks
+from models import ChatSession
+
+
+class SessionCache:
+    """LRU + idle-TTL cache of ChatSessions with a memory cap"""
+
+    def __init__(self, memory, max_sessions: int = 1000, max_messages: int = 50000,
+                 max_bytes: int = 64 * 1024 * 1024, idle_ttl: float = 1800.0):
+        self.memory = memory
+        self.max_sessions = max_sessions
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.idle_ttl = idle_ttl
+
+        # session_id -> [session, last_access, counted_messages, counted_bytes]
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._messages = 0
+        self._bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.reloads = 0
+        self.evictions = {"lru": 0, "idle": 0}
+
+    def __contains__(self, session_id: str) -> bool:
+        with self._lock:
+            return session_id in self._entries
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
+
+    def get(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        """Return a live session, reloading it from storage on a miss"""
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                entry[1] = time.monotonic()
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[0]
+            self.misses += 1
+
+        session = self.memory.load_session(user_id, session_id)
+        if session is None:
+            return None
+
+        with self._lock:
+            self.reloads += 1
+            # Another thread may have reloaded it meanwhile; keep a single copy
+            entry = self._entries.get(session_id)
+            if entry is not None:
+                return entry[0]
+        self.put(session)
+        return session
+
+    def put(self, session: ChatSession):
+        """Add or refresh a session and evict whatever no longer fits"""
+        with self._lock:
+            entry = self._entries.get(session.session_id)
+            if entry is None:
+                entry = [session, time.monotonic(), 0, 0]
+                self._entries[session.session_id] = entry
+            else:
+                entry[0] = session
+                entry[1] = time.monotonic()
+                self._entries.move_to_end(session.session_id)
+            self._recount(entry)
+            self._evict()
+
+    def touch(self, session: ChatSession):
+        """Account for messages added to a cached session"""
+        self.put(session)
+
+    def commit(self, session: ChatSession, apply: Callable[[ChatSession], None]) -> ChatSession:
+        """Apply a turn's changes to a live session and persist it; returns the session saved"""
+        apply(session)
+        self.touch(session)
+        self.memory.save_session(session)
+        return session
+
+    def discard(self, session_id: str):
+        with self._lock:
+            entry = self._entries.pop(session_id, None)
+            if entry is not None:
+                self._messages -= entry[2]
+                self._bytes -= entry[3]
+
+    def _recount(self, entry):
+        """Update occupancy for messages appended since the entry was last counted"""
+        messages = entry[0].messages
+        if len(messages) < entry[2]:
+            # Transcript was replaced rather than appended to; count it afresh
+            self._messages -= entry[2]
+            self._bytes -= entry[3]
+            entry[2], entry[3] = 0, 0
+        new_bytes = sum(len(msg.content) for msg in messages[entry[2]:])
+        self._messages += len(messages) - entry[2]
+        self._bytes += new_bytes
+        entry[2] = len(messages)
+        entry[3] += new_bytes
+
+    def _evict(self):
+        # Idle sessions first: the LRU end holds the least recently touched ones
+        cutoff = time.monotonic() - self.idle_ttl
+        while self._entries:
+            session_id, entry = next(iter(self._entries.items()))
+            if entry[1] >= cutoff:
+                break
+            self._drop(session_id, "idle")
+
+        # Then LRU order until we are back under every cap; the newest entry stays
+        while len(self._entries) > 1 and (
+                len(self._entries) > self.max_sessions
+                or self._messages > self.max_messages
+                or self._bytes > self.max_bytes):
+            self._drop(next(iter(self._entries)), "lru")
+
+    def _drop(self, session_id: str, reason: str):
+        entry = self._entries.pop(session_id)
+        self._messages -= entry[2]
+        self._bytes -= entry[3]
+        self.evictions[reason] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "sessions": len(self._entries),
+                "messages": self._messages,
+                "bytes": self._bytes,
+                "max_sessions": self.max_sessions,
+                "max_messages": self.max_messages,
+                "max_bytes": self.max_bytes,
+                "idle_ttl_seconds": self.idle_ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "reloads": self.reloads,
+                "evictions": dict(self.evictions),
+            }
+
+
+class SharedSessionCache(SessionCache):
+    """SessionCache for worker processes that share one session store
+
+    A cached copy is only used while the stored session is unchanged, which is
+    checked with the backend's version stamp (a stat, or one indexed lookup);
+    otherwise the session is reloaded. Turns are committed under a per-session
+    file lock: if another worker saved the session since this one loaded it,
+    the turn is applied to the fresh copy, so no worker ever writes over
+    messages it hasn't seen. Sessions are written through rather than queued,
+    so they are on disk before the lock passes to the next worker.
+    """
+
+    def __init__(self, memory, lock_dir: str, lock_stripes: int = 1024, **limits):
+        super().__init__(memory, **limits)
+        self.locks = StripedFileLocks(lock_dir, "session", lock_stripes)
+        self._versions = {}  # session_id -> stored version the cached copy matches
+        self.stale = 0
+        self.conflicts = 0
+
+    def get(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        version = self.memory.session_version(user_id, session_id)
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and self._versions.get(session_id) == version:
+                entry[1] = time.monotonic()
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self.stale += 1
+            self.misses += 1
+
+        # Stamp taken before the read: if a write lands in between, the copy
+        # is newer than its stamp and merely gets reloaded once more
+        session = self.memory.load_session(user_id, session_id)
+        if session is None:
+            self.discard(session_id)
+            return None
+        with self._lock:
+            self.reloads += 1
+        self._store(session, version)
+        return session
+
+    def commit(self, session: ChatSession, apply: Callable[[ChatSession], None]) -> ChatSession:
+        with self.locks.hold(session.session_id):
+            version = self.memory.session_version(session.user_id, session.session_id)
+            with self._lock:
+                # The stamp describes the cached copy; if another thread has
+                # replaced that copy meanwhile, ours is of unknown age
+                entry = self._entries.get(session.session_id)
+                known = self._versions.get(session.session_id) if entry and entry[0] is session else None
+            if version is not None and version != known:
+                # Another worker (or thread) saved this session since we loaded it
+                latest = self.memory.load_session(session.user_id, session.session_id)
+                if latest is not None:
+                    with self._lock:
+                        self.conflicts += 1
+                    session = latest
+            apply(session)
+            self.memory.save_session(session, write_through=True)
+            version = self.memory.session_version(session.user_id, session.session_id)
+        self._store(session, version)
+        return session
+
+    def _store(self, session: ChatSession, version):
+        self.put(session)
+        with self._lock:
+            # put() never evicts the entry it just added
+            self._versions[session.session_id] = version
+
+    def discard(self, session_id: str):
+        super().discard(session_id)
+        with self._lock:
+            self._versions.pop(session_id, None)
+
+    def _drop(self, session_id: str, reason: str):
+        super()._drop(session_id, reason)
+        self._versions.pop(session_id, None)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = super().stats()
+        with self._lock:
+            stats.update(shared=True, stale=self.stale, conflicts=self.conflicts)
+        return stats
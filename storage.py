@@ -0,0 +1,763 @@
+#!/usr/bin/env python3
+"""
+Storage backends for MemoryManager
+
+- FileStorageBackend: JSON profiles and append-only JSONL session logs under user_data/,
+  with cold sessions moved into per-user archive packs (see archiver.py)
+- SQLiteStorageBackend: a single WAL-mode database with indexed session lookups
+
+Both are safe to share between several server processes on one host.
+
+Select one with MEMORY_BACKEND=file|sqlite (see create_backend).
+"""
+
+import json
+import os
+import sqlite3
+import threading
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from archiver import RECORD_HEADER, SessionArchive
+from file_lock import StripedFileLocks
+from models import Message, UserProfile, ChatSession, SESSION_LIST_FIELDS, SESSION_SCALAR_FIELDS
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _tmp_path(path: str) -> str:
+    """Scratch file for an atomic replace of path, unique per process and thread"""
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+class StorageBackend:
+    """Interface every MemoryManager storage engine implements
+
+    Methods raise on I/O errors; MemoryManager reports and swallows them.
+    """
+
+    name = "base"
+
+    # Storage operations since startup, for benchmarks; bumped from any thread
+    reads = 0
+    writes = 0
+    _io_lock = threading.Lock()
+    
+    def _count(self, reads: int = 0, writes: int = 0):
+        with self._io_lock:
+            self.reads += reads
+            self.writes += writes
+    
+    def io_stats(self) -> Dict[str, int]:
+        with self._io_lock:
+            return {"reads": self.reads, "writes": self.writes}
+
+    def load_profile(self, user_id: str) -> Optional[UserProfile]:
+        raise NotImplementedError
+
+    def save_profile(self, profile: UserProfile):
+        raise NotImplementedError
+
+    def load_recent_sessions(self, user_id: str, limit: int) -> List[ChatSession]:
+        """Most recent sessions for a user, newest first
+        
+        Only the session headers are read; each session's messages are loaded
+        if and when its .messages is accessed.
+        """
+        raise NotImplementedError
+
+    def load_session(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        raise NotImplementedError
+
+    def save_session(self, session: ChatSession):
+        raise NotImplementedError
+
+    def session_version(self, user_id: str, session_id: str) -> Optional[Any]:
+        """Cheap stamp that changes whenever the stored session does; None if it isn't stored"""
+        raise NotImplementedError
+
+    def list_users(self) -> List[str]:
+        raise NotImplementedError
+
+    def list_sessions(self, user_id: str) -> List[str]:
+        raise NotImplementedError
+
+    def sync(self):
+        """Force everything written so far onto stable storage"""
+        pass
+
+    def close(self):
+        pass
+
+
+class FileStorageBackend(StorageBackend):
+    """Profiles as JSON files, sessions as append-only JSONL logs
+
+    Only messages and insights added since the last save are appended, so the
+    cost of a turn doesn't grow with the length of the conversation. A log is
+    rewritten as a compact snapshot once `compact_every` records have been
+    appended to it.
+
+    Each user also has a manifest, sessions/<user_id>.manifest.json, listing
+    their sessions newest-first with summary fields. It lives next to (not in)
+    the user's session directory and records that directory's mtime, so a file
+    added or removed behind our back is noticed with a single stat and the
+    manifest is rebuilt from a scan. Manifest updates hold a per-user file lock
+    (user_data/locks/) so server processes sharing the directory don't lose
+    each other's entries.
+
+    Sessions moved into the user's archive pack (user_data/archive/) keep
+    their manifest entries, marked "archived", and are loaded from the pack.
+    Saving one again brings it back as a live log.
+    """
+
+    name = "file"
+
+    # Sessions whose on-disk log position is remembered between saves
+    LOG_STATE_LIMIT = 10000
+
+    def __init__(self, data_dir: str, compact_every: int = 200):
+        self.data_dir = data_dir
+        self.profiles_dir = os.path.join(data_dir, "profiles")
+        self.sessions_dir = os.path.join(data_dir, "sessions")
+        self.compact_every = compact_every
+        self._log_state = OrderedDict()  # session_id -> counts of what is already in the log
+        self._manifests = {}  # user_id -> (manifest file stat stamp, manifest)
+        self._dirty_paths = set()  # written since the last sync()
+        # Guards the three fields above; held only for the update, never across file I/O
+        self._state_lock = threading.Lock()
+        # One user's reads and writes, across threads and processes; users
+        # never wait on each other (beyond sharing a lock stripe)
+        self._user_locks = StripedFileLocks(os.path.join(data_dir, "locks"), "user")
+        self.archive = SessionArchive(os.path.join(data_dir, "archive"))
+
+        # Create directories if they don't exist
+        os.makedirs(self.profiles_dir, exist_ok=True)
+        os.makedirs(self.sessions_dir, exist_ok=True)
+
+    # Profiles
+
+    def load_profile(self, user_id: str) -> Optional[UserProfile]:
+        profile_path = os.path.join(self.profiles_dir, f"{user_id}.json")
+        if not os.path.exists(profile_path):
+            return None
+        self._count(reads=1)
+        with open(profile_path, 'r', encoding='utf-8') as f:
+            return UserProfile.from_dict(json.load(f))
+
+    def save_profile(self, profile: UserProfile):
+        profile_path = os.path.join(self.profiles_dir, f"{profile.user_id}.json")
+        tmp_path = _tmp_path(profile_path)
+        self._count(writes=1)
+        # Write then rename, so a reader in another process never sees half a file
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_dumps(profile.to_dict()))
+        os.replace(tmp_path, profile_path)
+        self._mark_dirty(profile_path, self.profiles_dir)
+
+    def list_users(self) -> List[str]:
+        users = {filename[:-5] for filename in os.listdir(self.profiles_dir) if filename.endswith('.json')}
+        users.update(name for name in os.listdir(self.sessions_dir)
+                     if os.path.isdir(os.path.join(self.sessions_dir, name)))
+        users.update(self.archive.users())
+        return sorted(users)
+
+    # Sessions
+
+    def _session_log_path(self, user_id: str, session_id: str) -> str:
+        return os.path.join(self.sessions_dir, user_id, f"{session_id}.jsonl")
+
+    def list_sessions(self, user_id: str) -> List[str]:
+        with self._user_locks.hold(user_id):
+            return [entry["session_id"] for entry in self.load_manifest(user_id)["sessions"]]
+
+    def load_recent_sessions(self, user_id: str, limit: int) -> List[ChatSession]:
+        # Manifest entries are the headers; session logs are read only for messages
+        with self._user_locks.hold(user_id):
+            entries = self.load_manifest(user_id)["sessions"][:limit]
+        return [ChatSession.from_header(dict(entry, user_id=user_id),
+                                        lambda session_id=entry["session_id"]: self._load_messages(user_id, session_id))
+                for entry in entries]
+    
+    def _load_messages(self, user_id: str, session_id: str) -> List[Message]:
+        session = self.load_session(user_id, session_id)
+        return session.messages if session else []
+
+    # Manifest
+
+    def _manifest_path(self, user_id: str) -> str:
+        return os.path.join(self.sessions_dir, f"{user_id}.manifest.json")
+
+    def _dir_mtime_ns(self, user_id: str) -> Optional[int]:
+        try:
+            return os.stat(os.path.join(self.sessions_dir, user_id)).st_mtime_ns
+        except FileNotFoundError:
+            return None
+
+    def load_manifest(self, user_id: str) -> Dict[str, Any]:
+        """The user's manifest, rebuilt if missing or out of sync with the directory"""
+        dir_mtime = self._dir_mtime_ns(user_id)
+        if dir_mtime is None:
+            return {"dir_mtime_ns": None, "sessions": []}
+
+        manifest_path = self._manifest_path(user_id)
+        try:
+            manifest_stamp = self._stat_stamp(manifest_path)
+        except FileNotFoundError:
+            return self.rebuild_manifest(user_id)
+
+        with self._state_lock:
+            cached = self._manifests.get(user_id)
+        if cached and cached[0] == manifest_stamp:
+            manifest = cached[1]
+        else:
+            try:
+                self._count(reads=1)
+                with open(manifest_path, 'r', encoding='utf-8') as f:
+                    manifest = json.load(f)
+            except ValueError:
+                return self.rebuild_manifest(user_id)
+            with self._state_lock:
+                self._manifests[user_id] = (manifest_stamp, manifest)
+
+        if manifest.get("dir_mtime_ns") != dir_mtime:
+            return self.rebuild_manifest(user_id)
+        return manifest
+
+    def rebuild_manifest(self, user_id: str) -> Dict[str, Any]:
+        """Scan the user's session directory and write a fresh manifest"""
+        user_sessions_dir = os.path.join(self.sessions_dir, user_id)
+        if not os.path.exists(user_sessions_dir):
+            return {"dir_mtime_ns": None, "sessions": []}
+
+        # Get session files sorted by modification time (newest first)
+        session_files = []
+        for filename in os.listdir(user_sessions_dir):
+            if filename.endswith('.jsonl') or filename.endswith('.json'):
+                filepath = os.path.join(user_sessions_dir, filename)
+                mtime = os.path.getmtime(filepath)
+                session_files.append((mtime, filepath))
+        session_files.sort(reverse=True)  # Newest first
+
+        entries = []
+        for mtime, filepath in session_files:
+            try:
+                session = self._read_session_file(filepath)
+            except Exception as e:
+                print(f"❌ Skipping unreadable session file {filepath}: {e}")
+                continue
+            updated_at = datetime.fromtimestamp(mtime).isoformat()
+            entries.append(self._manifest_entry(session, os.path.basename(filepath), updated_at))
+
+        live = {entry["session_id"] for entry in entries}
+        entries.extend(self._archived_entry(entry) for entry in self.archive.entries(user_id)
+                       if entry["session_id"] not in live)
+        entries.sort(key=lambda entry: entry["updated_at"], reverse=True)
+
+        manifest = {"dir_mtime_ns": self._dir_mtime_ns(user_id), "sessions": entries}
+        self._write_manifest(user_id, manifest)
+        print(f"🗂️ Rebuilt session manifest for {user_id} ({len(entries)} sessions)")
+        return manifest
+
+    def _manifest_entry(self, session: ChatSession, filename: str, updated_at: str) -> Dict[str, Any]:
+        return dict(session.header(), file=filename, updated_at=updated_at)
+
+    @staticmethod
+    def _archived_entry(archive_entry: Dict[str, Any]) -> Dict[str, Any]:
+        entry = {key: value for key, value in archive_entry.items() if key not in ("offset", "length", "crc")}
+        return dict(entry, file=None, archived=True)
+
+    @staticmethod
+    def _stat_stamp(path: str):
+        """Identifies one version of a file; mtime alone is too coarse when
+        another process rewrites it within the same clock tick"""
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime_ns)
+
+    def _write_manifest(self, user_id: str, manifest: Dict[str, Any]):
+        manifest_path = self._manifest_path(user_id)
+        tmp_path = _tmp_path(manifest_path)
+        self._count(writes=1)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(_dumps(manifest))
+        os.replace(tmp_path, manifest_path)
+        self._mark_dirty(manifest_path, self.sessions_dir)
+        manifest_stamp = self._stat_stamp(manifest_path)
+        with self._state_lock:
+            self._manifests[user_id] = (manifest_stamp, manifest)
+
+    def _update_manifest(self, session: ChatSession, manifest: Dict[str, Any]):
+        """Move the just-saved session to the front of its user's manifest"""
+        filename = f"{session.session_id}.jsonl"
+        entries = [entry for entry in manifest["sessions"] if entry["session_id"] != session.session_id]
+        entries.insert(0, self._manifest_entry(session, filename, datetime.now().isoformat()))
+        self._write_manifest(session.user_id, {
+            "dir_mtime_ns": self._dir_mtime_ns(session.user_id),
+            "sessions": entries,
+        })
+
+    def load_session(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        # Under the user's lock, so the log position remembered by the read
+        # can't be older than one a concurrent save just remembered
+        with self._user_locks.hold(user_id):
+            for filepath in (self._session_log_path(user_id, session_id),
+                             os.path.join(self.sessions_dir, user_id, f"{session_id}.json")):
+                if os.path.exists(filepath):
+                    return self._read_session_file(filepath)
+            return self.archive.load(user_id, session_id)
+
+    def session_version(self, user_id: str, session_id: str) -> Optional[Any]:
+        # Appends change the size, compaction swaps in a new inode
+        for filepath in (self._session_log_path(user_id, session_id),
+                         os.path.join(self.sessions_dir, user_id, f"{session_id}.json")):
+            try:
+                return self._stat_stamp(filepath)
+            except FileNotFoundError:
+                continue
+        return self.archive.version(user_id, session_id)
+
+    def _read_session_file(self, filepath: str) -> ChatSession:
+        """Rebuild a session from an append-only log (or a legacy .json snapshot)"""
+        self._count(reads=1)
+        if filepath.endswith('.json'):
+            with open(filepath, 'r', encoding='utf-8') as f:
+                return ChatSession.from_dict(json.load(f))
+
+        fields = {}
+        messages = []
+        snapshot_messages = 0
+        appended = 0  # records written after the last snapshot
+        with open(filepath, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Torn write at the tail of the log; everything before it is intact
+                    break
+                record_type = record.pop("type", None)
+                if record_type == "session":
+                    snapshot_messages = record.pop("message_count", 0)
+                    fields = record
+                    appended = 0
+                    continue
+                appended += 1
+                if record_type == "message":
+                    messages.append(Message.from_dict(record))
+                elif record_type == "insights":
+                    for key in SESSION_LIST_FIELDS:
+                        fields.setdefault(key, []).extend(record.get(key, []))
+                elif record_type == "update":
+                    fields.update(record)
+
+        session = ChatSession.from_dict(fields)
+        session.messages = messages
+        self._remember_log_state(session, max(appended - snapshot_messages, 0))
+        return session
+
+    def _remember_log_state(self, session: ChatSession, appended: int):
+        """Record what is already on disk so the next save only appends the difference"""
+        state = {key: len(getattr(session, key)) for key in SESSION_LIST_FIELDS}
+        state.update({key: getattr(session, key) for key in SESSION_SCALAR_FIELDS})
+        state["messages"] = len(session.messages)
+        state["appended"] = appended
+        with self._state_lock:
+            self._log_state[session.session_id] = state
+            self._log_state.move_to_end(session.session_id)
+            # Forgetting a session's state only costs one snapshot rewrite on its next save
+            while len(self._log_state) > self.LOG_STATE_LIMIT:
+                self._log_state.popitem(last=False)
+
+    def _mark_dirty(self, *paths: str):
+        with self._state_lock:
+            self._dirty_paths.update(paths)
+
+    def save_session(self, session: ChatSession):
+        # A lazily loaded session reads its messages now, before the user's
+        # lock is taken (load_session takes it too)
+        session.messages
+        # Bring the manifest up to date first, so a session file created by this
+        # save isn't mistaken for an out-of-band change
+        with self._user_locks.hold(session.user_id):
+            manifest = self.load_manifest(session.user_id)
+            self._write_session_log(session)
+            self._update_manifest(session, manifest)
+
+    def _write_session_log(self, session: ChatSession):
+        session_path = self._session_log_path(session.user_id, session.session_id)
+
+        with self._state_lock:
+            state = self._log_state.get(session.session_id)
+        if state is None or not os.path.exists(session_path):
+            self.compact_session(session)
+            return
+
+        records = self._session_delta(session, state)
+        if records is None:
+            # Lists were rewritten rather than appended to; start from a fresh snapshot
+            self.compact_session(session)
+            return
+
+        appended = state["appended"] + len(records)
+        if records:
+            self._append_records(session_path, records)
+            self._remember_log_state(session, appended)
+
+        if appended >= self.compact_every:
+            self.compact_session(session)
+
+    def _session_delta(self, session: ChatSession, state: Dict[str, Any]) -> Optional[List[Dict[str, Any]]]:
+        """Build the log records for everything that changed since the last save"""
+        if len(session.messages) < state["messages"]:
+            return None
+
+        records = [dict(msg.to_dict(), type="message") for msg in session.messages[state["messages"]:]]
+
+        insights = {}
+        for key in SESSION_LIST_FIELDS:
+            values = getattr(session, key)
+            if len(values) < state[key]:
+                return None
+            if len(values) > state[key]:
+                insights[key] = values[state[key]:]
+        if insights:
+            records.append(dict(insights, type="insights"))
+
+        updates = {key: getattr(session, key) for key in SESSION_SCALAR_FIELDS
+                   if getattr(session, key) != state[key]}
+        if updates:
+            records.append(dict(updates, type="update"))
+
+        return records
+
+    def _append_records(self, path: str, records: List[Dict[str, Any]]):
+        self._count(writes=1)
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write("".join(_dumps(record) + "\n" for record in records))
+        self._mark_dirty(path)
+
+    def compact_session(self, session: ChatSession):
+        """Rewrite a session log as a single snapshot record followed by its messages"""
+        user_sessions_dir = os.path.join(self.sessions_dir, session.user_id)
+        os.makedirs(user_sessions_dir, exist_ok=True)
+
+        session_path = self._session_log_path(session.user_id, session.session_id)
+        tmp_path = _tmp_path(session_path)
+
+        records = [dict(session.header(), type="session")]
+        records.extend(dict(msg.to_dict(), type="message") for msg in session.messages)
+
+        self._count(writes=1)
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("".join(_dumps(record) + "\n" for record in records))
+        os.replace(tmp_path, session_path)
+        self._mark_dirty(session_path, user_sessions_dir)
+        self._remember_log_state(session, 0)
+
+        # Drop the pretty-printed snapshot once the session lives in a log
+        legacy_path = os.path.join(user_sessions_dir, f"{session.session_id}.json")
+        if os.path.exists(legacy_path):
+            os.remove(legacy_path)
+
+    # Archive
+
+    def archive_sessions(self, user_id: str, cutoff: str) -> int:
+        """Move the user's sessions last updated before cutoff (ISO time) into their archive pack"""
+        with self._user_locks.hold(user_id):
+            manifest = self.load_manifest(user_id)
+            cold = [entry for entry in manifest["sessions"]
+                    if not entry.get("archived") and entry["updated_at"] < cutoff]
+            if not cold:
+                return 0
+
+            user_sessions_dir = os.path.join(self.sessions_dir, user_id)
+            batch = []
+            for entry in cold:
+                filepath = os.path.join(user_sessions_dir, entry["file"])
+                try:
+                    batch.append((self._read_session_file(filepath), entry["updated_at"], filepath))
+                except Exception as e:
+                    print(f"❌ Not archiving unreadable session file {filepath}: {e}")
+
+            # The pack is on disk before any session file goes
+            self.archive.append(user_id, [(session, updated_at) for session, updated_at, _ in batch])
+            archived = set()
+            for session, _, filepath in batch:
+                os.remove(filepath)
+                with self._state_lock:
+                    self._log_state.pop(session.session_id, None)
+                archived.add(session.session_id)
+            self._mark_dirty(user_sessions_dir)
+
+            entries = [dict(entry, file=None, archived=True) if entry["session_id"] in archived else entry
+                       for entry in manifest["sessions"]]
+            self._write_manifest(user_id, {"dir_mtime_ns": self._dir_mtime_ns(user_id), "sessions": entries})
+            return len(archived)
+
+    def trim_archive(self, user_id: str, max_bytes: int = 0, garbage_ratio: float = 0.5,
+                     index_bytes: Optional[Dict[str, int]] = None) -> Tuple[List[str], int]:
+        """Apply the per-user cap and reclaim dead space in the user's pack
+        
+        Drops the oldest archived sessions while the user's live logs, pack
+        records and search index together exceed max_bytes (0 for no cap),
+        plus archived copies of sessions that have since been resumed.
+        index_bytes is each session's share of the search index
+        (RetrievalIndex.session_bytes); the caller drops the returned sessions
+        from the index. The pack is rewritten when anything is dropped or more
+        than garbage_ratio of it is dead. Returns (IDs of the sessions
+        dropped, bytes reclaimed).
+        """
+        index_bytes = index_bytes or {}
+        with self._user_locks.hold(user_id):
+            pack_bytes, used = self.archive.size(user_id)
+            if not pack_bytes:
+                return [], 0
+            manifest = self.load_manifest(user_id)
+            resumed = {entry["session_id"] for entry in manifest["sessions"] if not entry.get("archived")}
+            archived = self.archive.entries(user_id)
+
+            shadowed = [entry for entry in archived if entry["session_id"] in resumed]
+            shadowed_bytes = sum(RECORD_HEADER.size + entry["length"] for entry in shadowed)
+            garbage = pack_bytes - used + shadowed_bytes
+            expired = []
+            if max_bytes:
+                user_sessions_dir = os.path.join(self.sessions_dir, user_id)
+                usage = used - shadowed_bytes + sum(index_bytes.values())
+                if os.path.isdir(user_sessions_dir):
+                    usage += sum(os.path.getsize(os.path.join(user_sessions_dir, filename))
+                                 for filename in os.listdir(user_sessions_dir))
+                for entry in reversed(archived):  # oldest first
+                    if usage <= max_bytes:
+                        break
+                    if entry["session_id"] not in resumed:
+                        expired.append(entry["session_id"])
+                        usage -= RECORD_HEADER.size + entry["length"] + index_bytes.get(entry["session_id"], 0)
+            
+            if not expired and garbage <= pack_bytes * garbage_ratio:
+                return [], 0
+            reclaimed = self.archive.rewrite(user_id, expired + [entry["session_id"] for entry in shadowed])
+            if expired:
+                dropped = set(expired)
+                entries = [entry for entry in manifest["sessions"]
+                           if not (entry.get("archived") and entry["session_id"] in dropped)]
+                self._write_manifest(user_id, {"dir_mtime_ns": manifest["dir_mtime_ns"], "sessions": entries})
+                print(f"🗂️ Dropped {len(expired)} archived sessions for {user_id} (over the per-user cap)")
+            return expired, reclaimed
+    
+    def sync(self):
+        """fsync every file (and directory, for renames) written since the last sync"""
+        with self._state_lock:
+            paths = self._dirty_paths
+            self._dirty_paths = set()
+        for path in paths:
+            try:
+                fd = os.open(path, os.O_RDONLY)
+            except FileNotFoundError:
+                continue
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def close(self):
+        self.archive.close()
+
+
+class SQLiteStorageBackend(StorageBackend):
+    """SQLite store in WAL mode, indexed by user, (user_id, updated_at) and session
+
+    Sessions are listed most recently updated first, as the file backend lists
+    them, so both backends agree on which sessions are "recent".
+
+    Each thread gets its own connection; WAL plus a busy timeout lets several
+    server processes read and write the same database file.
+    """
+
+    name = "sqlite"
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS users (
+            user_id TEXT PRIMARY KEY,
+            name TEXT NOT NULL DEFAULT '',
+            last_active TEXT NOT NULL DEFAULT '',
+            profile TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS sessions (
+            session_id TEXT PRIMARY KEY,
+            user_id TEXT NOT NULL,
+            started_at TEXT NOT NULL,
+            updated_at TEXT NOT NULL,
+            header TEXT NOT NULL
+        );
+        DROP INDEX IF EXISTS idx_sessions_user_started;
+        CREATE INDEX IF NOT EXISTS idx_sessions_user_updated
+            ON sessions (user_id, updated_at DESC);
+        CREATE TABLE IF NOT EXISTS messages (
+            session_id TEXT NOT NULL,
+            seq INTEGER NOT NULL,
+            role TEXT NOT NULL,
+            content TEXT NOT NULL,
+            timestamp TEXT NOT NULL DEFAULT '',
+            PRIMARY KEY (session_id, seq)
+        ) WITHOUT ROWID;
+    """
+
+    def __init__(self, db_path: str, busy_timeout: float = 10.0):
+        self.db_path = db_path
+        self.busy_timeout = busy_timeout
+        self._local = threading.local()
+        # Every thread's connection, so close() can reach them all
+        self._connections = []
+        self._connections_lock = threading.Lock()
+
+        db_dir = os.path.dirname(db_path)
+        if db_dir:
+            os.makedirs(db_dir, exist_ok=True)
+
+        conn = self._conn()
+        conn.executescript(self.SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # Used only by this thread, but close() may run on another
+            conn = sqlite3.connect(self.db_path, timeout=self.busy_timeout, isolation_level=None,
+                                   check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA foreign_keys=ON")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    # Profiles
+
+    def load_profile(self, user_id: str) -> Optional[UserProfile]:
+        self._count(reads=1)
+        row = self._conn().execute(
+            "SELECT profile FROM users WHERE user_id = ?", (user_id,)
+        ).fetchone()
+        return UserProfile.from_dict(json.loads(row[0])) if row else None
+
+    def save_profile(self, profile: UserProfile):
+        self._count(writes=1)
+        self._conn().execute(
+            "INSERT INTO users (user_id, name, last_active, profile) VALUES (?, ?, ?, ?) "
+            "ON CONFLICT(user_id) DO UPDATE SET name = excluded.name, "
+            "last_active = excluded.last_active, profile = excluded.profile",
+            (profile.user_id, profile.name, profile.last_active, _dumps(profile.to_dict()))
+        )
+
+    def list_users(self) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT user_id FROM users UNION SELECT DISTINCT user_id FROM sessions ORDER BY 1"
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    # Sessions
+
+    def list_sessions(self, user_id: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT session_id FROM sessions WHERE user_id = ? ORDER BY updated_at DESC", (user_id,)
+        ).fetchall()
+        return [row[0] for row in rows]
+
+    def _load_messages(self, session_id: str) -> List[Message]:
+        rows = self._conn().execute(
+            "SELECT role, content, timestamp FROM messages WHERE session_id = ? ORDER BY seq",
+            (session_id,)
+        ).fetchall()
+        return [Message(role, content, timestamp) for role, content, timestamp in rows]
+    
+    def _build_session(self, header: str) -> ChatSession:
+        """Session from its header row; messages are queried on first access"""
+        header = json.loads(header)
+        return ChatSession.from_header(header, lambda: self._load_messages(header["session_id"]))
+    
+    def load_recent_sessions(self, user_id: str, limit: int) -> List[ChatSession]:
+        self._count(reads=1)
+        rows = self._conn().execute(
+            "SELECT header FROM sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT ?",
+            (user_id, limit)
+        ).fetchall()
+        return [self._build_session(row[0]) for row in rows]
+    
+    def load_session(self, user_id: str, session_id: str) -> Optional[ChatSession]:
+        self._count(reads=1)
+        row = self._conn().execute(
+            "SELECT header FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+        ).fetchone()
+        if not row:
+            return None
+        # A session about to be continued needs its messages anyway
+        session = self._build_session(row[0])
+        session.messages = self._load_messages(session_id)
+        return session
+
+    def session_version(self, user_id: str, session_id: str) -> Optional[Any]:
+        row = self._conn().execute(
+            "SELECT updated_at FROM sessions WHERE session_id = ? AND user_id = ?", (session_id, user_id)
+        ).fetchone()
+        return row[0] if row else None
+
+    def save_session(self, session: ChatSession):
+        header = session.header()
+        messages = session.messages
+        conn = self._conn()
+        self._count(writes=1)
+
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT INTO sessions (session_id, user_id, started_at, updated_at, header) "
+                "VALUES (?, ?, ?, ?, ?) ON CONFLICT(session_id) DO UPDATE SET "
+                "updated_at = excluded.updated_at, header = excluded.header",
+                (session.session_id, session.user_id, session.started_at,
+                 datetime.now().isoformat(), _dumps(header))
+            )
+
+            # Only the messages added since the last save are inserted
+            stored = conn.execute(
+                "SELECT COALESCE(MAX(seq) + 1, 0) FROM messages WHERE session_id = ?",
+                (session.session_id,)
+            ).fetchone()[0]
+            if stored > len(messages):
+                conn.execute("DELETE FROM messages WHERE session_id = ?", (session.session_id,))
+                stored = 0
+            conn.executemany(
+                "INSERT INTO messages (session_id, seq, role, content, timestamp) VALUES (?, ?, ?, ?, ?)",
+                [(session.session_id, seq, msg.role, msg.content, msg.timestamp)
+                 for seq, msg in enumerate(messages[stored:], start=stored)]
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def sync(self):
+        # WAL commits under synchronous=NORMAL are durable once checkpointed
+        self._conn().execute("PRAGMA wal_checkpoint(FULL)")
+
+    def close(self):
+        with self._connections_lock:
+            connections = self._connections
+            self._connections = []
+        for conn in connections:
+            conn.close()
+        self._local.conn = None
+
+
+def create_backend(kind: str, data_dir: str) -> StorageBackend:
+    """Build the storage backend named by MEMORY_BACKEND"""
+    kind = (kind or "file").lower()
+    if kind == "file":
+        return FileStorageBackend(data_dir)
+    if kind == "sqlite":
+        return SQLiteStorageBackend(os.environ.get("MEMORY_DB_PATH", os.path.join(data_dir, "memory.db")))
+    raise ValueError(f"Unknown memory backend: {kind}")
@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""
+Local stub for the OpenAI-compatible /v1/chat/completions API.
+Used to exercise llm_client and the Flask app without calling Mistral.
+
+Usage:
+    python stub_mistral.py --port 8100 --latency 0.2 --jitter 0.05 --token-rate 40 --error-rate 0.02
+    OPENAI_BASE_URL=http://127.0.0.1:8100/v1 python api_server.py
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import threading
+import time
+import uuid
+
+from aiohttp import web
+
+DEFAULT_REPLY = ("I understand this feels overwhelming. Work pressure can really affect our sleep, "
+                 "especially with long commutes and deadlines. How long have you been experiencing this?")
+
+
+class StubMistralServer:
+    """OpenAI-compatible completions server with injectable latency and errors
+
+    latency/jitter: seconds before the first token (uniform +/- jitter)
+    token_rate:     tokens per second after that (0 = send everything at once)
+    error_rate:     fraction of requests answered with error_status instead
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 8100,
+                 latency: float = 0.0, reply: str = DEFAULT_REPLY,
+                 jitter: float = 0.0, token_rate: float = 0.0,
+                 error_rate: float = 0.0, error_status: int = 503,
+                 seed: int = None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.reply = reply
+        self.jitter = jitter
+        self.token_rate = token_rate
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.random = random.Random(seed)
+        self.requests_served = 0
+        self.errors_injected = 0
+
+        self._runner = None
+        self._loop = None
+        self._thread = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}/v1"
+
+    def make_app(self) -> web.Application:
+        app = web.Application()
+        app.router.add_post("/v1/chat/completions", self.handle_completions)
+        app.router.add_get("/v1/models", self.handle_models)
+        return app
+
+    async def handle_models(self, request: web.Request) -> web.Response:
+        return web.json_response({"object": "list", "data": [{"id": "stub", "object": "model"}]})
+
+    async def handle_completions(self, request: web.Request) -> web.StreamResponse:
+        body = await request.json()
+        model = body.get("model", "stub")
+        self.requests_served += 1
+
+        delay = self.latency
+        if self.jitter:
+            delay += self.random.uniform(-self.jitter, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.errors_injected += 1
+            return web.json_response(
+                {"error": {"message": "Injected failure", "type": "server_error"}},
+                status=self.error_status
+            )
+
+        words = self.reply.split(" ")
+        token_delay = 1.0 / self.token_rate if self.token_rate else 0.0
+
+        completion_id = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+        created = int(time.time())
+
+        if not body.get("stream"):
+            if token_delay:
+                await asyncio.sleep(token_delay * len(words))
+            return web.json_response({
+                "id": completion_id,
+                "object": "chat.completion",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "message": {"role": "assistant", "content": self.reply},
+                    "finish_reason": "stop",
+                }],
+                "usage": {"prompt_tokens": 0, "completion_tokens": len(words)},
+            })
+
+        response = web.StreamResponse(headers={"Content-Type": "text/event-stream"})
+        await response.prepare(request)
+        for word in words:
+            if token_delay:
+                await asyncio.sleep(token_delay)
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": {"content": word + " "}, "finish_reason": None}],
+            }
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+        await response.write_eof()
+        return response
+
+    # ------------------------------------------------------------------
+    # Running in a background thread (for tests and benchmarks)
+    # ------------------------------------------------------------------
+
+    def start(self) -> "StubMistralServer":
+        """Serve from a daemon thread and return once the socket is listening"""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.make_app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            if self.port == 0:
+                self.port = self._runner.addresses[0][1]
+            started.set()
+            self._loop.run_forever()
+
+        self._thread = threading.Thread(target=run, name="stub-mistral", daemon=True)
+        self._thread.start()
+        started.wait(timeout=5)
+        return self
+
+    def stop(self):
+        if self._loop is None:
+            return
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join(timeout=5)
+        self._loop = None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Local stub for the Mistral chat completions API")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8100)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to wait before replying")
+    parser.add_argument("--jitter", type=float, default=0.0, help="Uniform +/- jitter on the latency")
+    parser.add_argument("--token-rate", type=float, default=0.0, help="Tokens per second (0 = instant)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--error-status", type=int, default=503, help="HTTP status for injected failures")
+    parser.add_argument("--seed", type=int, default=None, help="Seed for jitter and error injection")
+    args = parser.parse_args()
+
+    stub = StubMistralServer(host=args.host, port=args.port, latency=args.latency,
+                             jitter=args.jitter, token_rate=args.token_rate,
+                             error_rate=args.error_rate, error_status=args.error_status,
+                             seed=args.seed)
+    print(f"🧪 Stub Mistral API listening on {stub.base_url}")
+    web.run_app(stub.make_app(), host=args.host, port=args.port, print=None)
+
+
+if __name__ == "__main__":
+    main()
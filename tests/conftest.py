@@ -0,0 +1,83 @@
+"""
+Shared fixtures: the Flask app wired to a fresh user_data directory and a
+scripted model client, so tests run without network access or Mistral keys
+"""
+
+import os
+import sys
+import tempfile
+import threading
+from types import SimpleNamespace
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Synchronous saves, per-process session cache and no archive sweeps, so every
+# test sees its own writes as soon as a request returns
+os.environ.setdefault("MEMORY_WRITE_BEHIND", "0")
+os.environ.setdefault("SHARED_SESSIONS", "0")
+os.environ.setdefault("ARCHIVE_INTERVAL", "0")
+os.environ.setdefault("OPENAI_API_KEY", "test")
+
+# The app builds its default MemoryManager at import time, relative to the cwd
+_import_dir = tempfile.mkdtemp(prefix="mh_tests_")
+_cwd = os.getcwd()
+os.chdir(_import_dir)
+try:
+    import api_server  # noqa: E402
+finally:
+    os.chdir(_cwd)
+
+
+class FakeLLMClient:
+    """Answers every call with the same reply; gate, if set, holds calls until it is"""
+
+    model = "fake"
+
+    def __init__(self, reply: str = "That sounds hard. Tell me more about it."):
+        self.reply = reply
+        self.calls = []
+        self.gate = None
+        self.started = threading.Event()
+
+    def _call(self, messages):
+        self.calls.append(messages)
+        self.started.set()
+        if self.gate is not None:
+            self.gate.wait(10)
+
+    def complete(self, messages, **kwargs):
+        self._call(messages)
+        return self.reply
+
+    def stream(self, messages, **kwargs):
+        self._call(messages)
+        for word in self.reply.split(" "):
+            yield word + " "
+
+    def stats(self):
+        return {"calls": len(self.calls)}
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    """The API with its own storage, model client, admission and idempotency state"""
+    from admission import AdmissionController
+    from idempotency import IdempotencyCache
+    from memory_system import MemoryManager
+
+    memory = MemoryManager(data_dir=str(tmp_path / "user_data"))
+    llm = FakeLLMClient()
+    monkeypatch.setattr(api_server, "memory_manager", memory)
+    monkeypatch.setattr(api_server, "llm_client", llm)
+    monkeypatch.setattr(api_server, "admission", AdmissionController(rate_per_minute=6000, burst=100))
+    monkeypatch.setattr(api_server, "idempotency", IdempotencyCache())
+    api = api_server.MentalHealthAPI()
+    monkeypatch.setattr(api_server, "mental_health_api", api)
+
+    yield SimpleNamespace(client=api_server.app.test_client(), api=api, memory=memory, llm=llm)
+
+    api.background.shutdown(wait=True)
+    memory.close()
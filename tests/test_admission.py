@@ -0,0 +1,55 @@
+"""Admission control: crisis turns go first but stay inside the limits"""
+
+import threading
+import time
+
+import pytest
+
+from admission import AdmissionController, AdmissionRejected
+
+
+def test_priority_turns_have_their_own_rate_limit():
+    admission = AdmissionController(burst=1, priority_burst=2, priority_rate_per_minute=1)
+    admission.acquire("client").release()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("client")
+    assert rejected.value.reason == "rate_limited"
+
+    # Crisis turns still get through, up to their own burst
+    admission.acquire("client", priority=True).release()
+    admission.acquire("client", priority=True).release()
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("client", priority=True)
+    assert rejected.value.reason == "priority_rate_limited"
+
+
+def test_priority_turns_share_the_in_flight_cap():
+    admission = AdmissionController(max_in_flight=1, max_queue=0, rate_per_minute=6000, burst=100)
+    running = admission.acquire("a")
+    with pytest.raises(AdmissionRejected) as rejected:
+        admission.acquire("b", priority=True)
+    assert rejected.value.reason == "overloaded"
+    running.release()
+
+
+def test_priority_turns_jump_the_queue():
+    admission = AdmissionController(max_in_flight=1, max_queue=2, rate_per_minute=6000, burst=100)
+    running = admission.acquire("a")
+    order = []
+
+    def turn(client, priority):
+        with admission.acquire(client, priority=priority):
+            order.append(client)
+
+    ordinary = threading.Thread(target=turn, args=("ordinary", False))
+    ordinary.start()
+    time.sleep(0.05)
+    crisis = threading.Thread(target=turn, args=("crisis", True))
+    crisis.start()
+    time.sleep(0.05)
+
+    running.release()
+    ordinary.join(5)
+    crisis.join(5)
+    assert order == ["crisis", "ordinary"]
+    assert admission.stats()["in_flight"] == 0
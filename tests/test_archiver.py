@@ -0,0 +1,54 @@
+"""Archive retention: the per-user cap also covers, and trims, the search index"""
+
+from datetime import datetime, timedelta
+
+from archiver import SessionArchiver
+from models import ChatSession, Message
+from retrieval import RetrievalIndex
+from storage import FileStorageBackend
+
+
+def _session(n):
+    session = ChatSession(session_id=f"u1_2024010{n}_120000", user_id="u1")
+    session.messages = [Message("user", f"exam number {n} keeps me awake " * 20, "2024-01-01T12:00:00"),
+                        Message("assistant", "That sounds stressful. " * 20, "2024-01-01T12:00:01")]
+    return session
+
+
+def _archived_user(tmp_path):
+    backend = FileStorageBackend(str(tmp_path))
+    index = RetrievalIndex(str(tmp_path / "index"))
+    for n in range(6):
+        session = _session(n)
+        backend.save_session(session)
+        index.add_session(session)
+    backend.archive_sessions("u1", (datetime.now() + timedelta(days=1)).isoformat())
+    return backend, index
+
+
+def test_expired_sessions_leave_the_search_index(tmp_path):
+    backend, index = _archived_user(tmp_path)
+    _, used = backend.archive.size("u1")
+    archiver = SessionArchiver(backend, max_user_bytes=used // 2, interval=0, retrieval=index)
+
+    assert archiver.run_once()["dropped"]
+    kept = set(backend.list_sessions("u1"))
+    assert set(index.session_bytes("u1")) == kept
+    assert all(memory["session_id"] in kept for memory in index.search("u1", "exam keeps me awake", k=6))
+
+    # Another process's view picks up the rewritten files
+    other = RetrievalIndex(str(tmp_path / "index"))
+    assert {memory["session_id"] for memory in other.search("u1", "exam keeps me awake", k=6)} <= kept
+    backend.close()
+
+
+def test_index_counts_toward_the_cap(tmp_path):
+    backend, index = _archived_user(tmp_path)
+    _, used = backend.archive.size("u1")
+
+    # Under the cap on pack bytes alone, over it once the index is counted
+    dropped, _ = backend.trim_archive("u1", used + 1, 0.5)
+    assert dropped == []
+    dropped, _ = backend.trim_archive("u1", used + 1, 0.5, index.session_bytes("u1"))
+    assert dropped
+    backend.close()
@@ -0,0 +1,58 @@
+"""Token-budgeted prompts: folding into the summary without touching the session"""
+
+from context_builder import ContextBuilder
+from models import ChatSession, Message
+
+
+def _session(turns: int) -> ChatSession:
+    session = ChatSession(session_id="s_20260101_120000", user_id="s")
+    for i in range(turns):
+        session.messages.append(Message("user", f"question {i}", ""))
+        session.messages.append(Message("assistant", f"answer {i}", ""))
+    return session
+
+
+def _history(messages):
+    return [m["content"] for m in messages[1:-1]]
+
+
+def test_build_leaves_the_session_alone():
+    session = _session(10)
+    messages, stats, summary = ContextBuilder(max_history_messages=4).build("persona", session, "next")
+
+    assert session.session_summary == "" and session.summarized_messages == 0
+    assert summary.summarized_messages == 16 and stats["folded_messages"] == 16
+    assert "question 0" in messages[0]["content"]
+    assert _history(messages) == ["question 8", "answer 8", "question 9", "answer 9"]
+
+
+def test_summary_is_applied_forward_only():
+    session = _session(10)
+    _, _, summary = ContextBuilder(max_history_messages=4).build("persona", session, "next")
+    _, _, older = ContextBuilder(max_history_messages=8).build("persona", session, "next")
+
+    summary.apply(session)
+    older.apply(session)
+    assert session.summarized_messages == 16
+
+
+def test_summarized_messages_do_not_reenter_the_window():
+    session = _session(10)
+    _, _, summary = ContextBuilder(max_history_messages=4).build("persona", session, "next")
+    summary.apply(session)
+
+    # A roomier window would reach back further, but not into the summary
+    messages, stats, summary = ContextBuilder(max_history_messages=10).build("persona", session, "next")
+    assert _history(messages) == ["question 8", "answer 8", "question 9", "answer 9"]
+    assert summary is None and stats["folded_messages"] == 0
+
+
+def test_turn_commits_the_summary(app, monkeypatch):
+    monkeypatch.setattr(app.api.context_builder, "max_history_messages", 2)
+    session_id = None
+    for text in ("My name is Asha", "I can't sleep", "Work is hard"):
+        session_id = app.client.post("/chat", json={"message": text, "session_id": session_id}).get_json()["session_id"]
+
+    session = app.memory.load_session(app.api.identities.owner(session_id), session_id)
+    assert session.summarized_messages == 2
+    assert "My name is Asha" in session.session_summary
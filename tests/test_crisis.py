@@ -0,0 +1,40 @@
+"""Crisis detection: apostrophe look-alikes and overdose phrasing"""
+
+import pytest
+
+from crisis import CrisisDetector, crisis_detector
+
+
+@pytest.mark.parametrize("message", [
+    "I don't want to live anymore",
+    "I don’t want to live anymore",
+    "I don‘t want to live anymore",
+    "I donʼt want to live anymore",
+    "I don`t want to live anymore",
+])
+def test_apostrophe_variants_match(message):
+    assert crisis_detector.detect(message) == ["crisis:suicide"]
+
+
+def test_curly_apostrophe_in_other_phrases():
+    assert crisis_detector.detect("I’m in danger") == ["crisis:danger"]
+
+
+@pytest.mark.parametrize("message", [
+    "I took too many pills",
+    "I think I overdosed",
+    "I'm overdosing",
+    "I swallowed all my pills",
+])
+def test_overdose_phrasing(message):
+    assert crisis_detector.detect(message) == ["crisis:self_harm"]
+
+
+def test_ordinary_messages_do_not_match():
+    assert crisis_detector.detect("I don’t want to lie to my mother") == []
+    assert crisis_detector.detect("My doctor changed my pills") == []
+
+
+def test_custom_terms_are_normalized_too():
+    detector = CrisisDetector({"crisis:test": ["can’t go on"]})
+    assert detector.detect("I can't go on") == ["crisis:test"]
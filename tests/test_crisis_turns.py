@@ -0,0 +1,84 @@
+"""Crisis turns get the helplines at once and are saved before the session takes its next turn"""
+
+import json
+import threading
+import time
+
+import api_server
+
+from crisis import CRISIS_RESPONSE
+
+
+def _events(response):
+    events = []
+    for block in response.get_data(as_text=True).split("\n\n"):
+        if block.strip():
+            event, data = block.split("\n", 1)
+            events.append((event[len("event: "):], json.loads(data[len("data: "):])))
+    return events
+
+
+def _saved_session(app, session_id):
+    app.api.background.shutdown(wait=True)
+    return app.memory.load_session(app.api.identities.owner(session_id), session_id)
+
+
+def test_chat_returns_helplines_without_waiting_for_the_model(app):
+    app.llm.gate = threading.Event()
+    try:
+        reply = app.client.post("/chat", json={"message": "My name is Asha and I want to kill myself"}).get_json()
+        assert reply["response"] == CRISIS_RESPONSE
+    finally:
+        app.llm.gate.set()
+
+    # The follow-up is saved with the turn once the model answers
+    session = _saved_session(app, reply["session_id"])
+    assert session.risk_level == "high"
+    assert session.messages[-1].content.startswith(CRISIS_RESPONSE)
+    assert app.llm.reply in session.messages[-1].content
+
+
+def test_crisis_turn_is_saved_before_the_next_turn(app):
+    app.llm.gate = threading.Event()
+    first = app.client.post("/chat", json={"message": "My name is Asha and I want to kill myself"}).get_json()
+    app.llm.started.wait(5)
+
+    # The next turn waits for the follow-up's session lock
+    second = threading.Thread(target=app.client.post, args=("/chat",),
+                              kwargs={"json": {"message": "I am still here", "session_id": first["session_id"]}})
+    second.start()
+    time.sleep(0.1)
+    assert len(app.llm.calls) == 1
+    app.llm.gate.set()
+    second.join(5)
+
+    # The follow-up turn's prompt already carries the crisis exchange
+    history = [m["content"] for m in app.llm.calls[-1]]
+    assert "My name is Asha and I want to kill myself" in history
+    assert any(content.startswith(CRISIS_RESPONSE) for content in history)
+
+    session = _saved_session(app, first["session_id"])
+    assert session.risk_level == "high"
+    assert len(session.messages) == 4
+
+
+def test_crisis_turns_release_admission_when_saved(app):
+    reply = app.client.post("/chat", json={"message": "I want to end my life"}).get_json()
+    _saved_session(app, reply["session_id"])
+
+    stats = api_server.admission.stats()
+    assert stats["in_flight"] == 0 and stats["active_sessions"] == 0
+
+
+def test_stream_sends_helplines_first_and_saves_the_turn(app):
+    response = app.client.post("/chat/stream", json={"message": "I keep cutting myself"})
+    events = _events(response)
+
+    assert events[0] == ("token", {"token": CRISIS_RESPONSE + "\n\n"})
+    assert events[1][0] == "session"
+    done = events[-1][1]
+    assert done["response"].startswith(CRISIS_RESPONSE) and app.llm.reply in done["response"]
+
+    session = _saved_session(app, done["session_id"])
+    assert session.risk_level == "high"
+    assert [m.content for m in session.messages] == ["I keep cutting myself", done["response"]]
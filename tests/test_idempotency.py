@@ -0,0 +1,117 @@
+"""Duplicate submissions: coalescing, replay, and key scoping"""
+
+import threading
+
+import pytest
+
+import api_server
+
+from idempotency import IdempotencyCache, KeyReused, RequestInProgress, fingerprint
+
+
+def test_explicit_keys_are_scoped_to_session_or_client():
+    cache = IdempotencyCache()
+    a = cache.request_key("k1", "alice_20260101_120000", "hi")
+    b = cache.request_key("k1", "bob_20260101_120000", "hi")
+    c = cache.request_key("k1", None, "hi", client="10.0.0.1")
+    d = cache.request_key("k1", None, "hi", client="10.0.0.2")
+    assert len({a, b, c, d}) == 4
+
+
+def test_finished_turn_is_replayed():
+    cache = IdempotencyCache()
+    key = cache.request_key("k1", "s_20260101_120000", "hi")
+    turn = cache.begin(key, fingerprint("hi"))
+    turn.complete({"response": "hello", "session_id": "s_20260101_120000"})
+
+    again = cache.begin(key, fingerprint("hi"))
+    assert again.replayed and again.source == "cache"
+    assert again.result["response"] == "hello"
+
+
+def test_reused_key_with_another_message_is_refused():
+    cache = IdempotencyCache()
+    key = cache.request_key("k1", "s_20260101_120000", "hi")
+    cache.begin(key, fingerprint("hi")).complete({"response": "hello", "session_id": "s"})
+
+    with pytest.raises(KeyReused):
+        cache.begin(key, fingerprint("something else"))
+
+
+def test_abandoned_turn_is_not_replayed():
+    cache = IdempotencyCache()
+    key = cache.request_key(None, "s_20260101_120000", "hi")
+    cache.begin(key, fingerprint("hi")).abandon()
+
+    assert not cache.begin(key, fingerprint("hi")).replayed
+
+
+def test_duplicate_waits_for_the_original():
+    cache = IdempotencyCache()
+    key = cache.request_key("k1", "s_20260101_120000", "hi")
+    leader = cache.begin(key, fingerprint("hi"))
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(cache.begin(key, fingerprint("hi"))))
+    waiter.start()
+
+    leader.complete({"response": "hello", "session_id": "s"})
+    waiter.join(5)
+    assert results[0].source == "in_flight" and results[0].result["response"] == "hello"
+
+
+def test_duplicate_gives_up_after_wait_timeout():
+    cache = IdempotencyCache(wait_timeout=0.05)
+    key = cache.request_key("k1", "s_20260101_120000", "hi")
+    cache.begin(key, fingerprint("hi"))
+
+    with pytest.raises(RequestInProgress):
+        cache.begin(key, fingerprint("hi"))
+
+
+def test_capacity_holds_behind_an_in_flight_entry():
+    cache = IdempotencyCache(max_entries=3)
+    slow = cache.begin("key:session:s:slow", fingerprint("slow"))
+    for n in range(10):
+        cache.begin(f"key:session:s:{n}", fingerprint(str(n))).complete({"response": str(n)})
+
+    assert cache.stats()["entries"] == 3
+    assert cache.stats()["in_flight"] == 1
+    # The newest finished replies are the ones kept
+    assert cache.begin("key:session:s:9", fingerprint("9")).replayed
+    slow.abandon()
+
+
+def test_chat_replays_and_refuses_a_reused_key(app):
+    first = app.client.post("/chat", json={"message": "I can't sleep", "idempotency_key": "k1"}).get_json()
+    again = app.client.post("/chat", json={"message": "I can't sleep", "idempotency_key": "k1"}).get_json()
+    assert again["replayed"] and again["session_id"] == first["session_id"]
+    assert len(app.llm.calls) == 1
+
+    reused = app.client.post("/chat", json={"message": "Something else", "idempotency_key": "k1"})
+    assert reused.status_code == 422
+
+    # The same key from another client is its own request
+    other = app.client.post("/chat", json={"message": "I can't sleep", "idempotency_key": "k1"},
+                            environ_base={"REMOTE_ADDR": "10.1.2.3"}).get_json()
+    assert "replayed" not in other and other["session_id"] != first["session_id"]
+
+
+def test_waiting_copy_holds_an_admission_slot(app, monkeypatch):
+    from admission import AdmissionController
+    monkeypatch.setattr(api_server, "admission", AdmissionController(max_in_flight=1, max_queue=0,
+                                                                   rate_per_minute=6000, burst=100))
+    app.llm.gate = threading.Event()
+    original = threading.Thread(target=app.client.post, args=("/chat",),
+                                kwargs={"json": {"message": "I can't sleep", "idempotency_key": "k1"}})
+    original.start()
+    try:
+        assert app.llm.started.wait(5)
+        # The copy would wait on the original; it has to be admitted to do so
+        copy = app.client.post("/chat", json={"message": "I can't sleep", "idempotency_key": "k1"})
+        assert copy.status_code == 429
+    finally:
+        app.llm.gate.set()
+        original.join(5)
+
+    again = app.client.post("/chat", json={"message": "I can't sleep", "idempotency_key": "k1"}).get_json()
+    assert again["replayed"]
@@ -0,0 +1,86 @@
+"""Session-bound identity: parsing, validation and forged session IDs"""
+
+import identity
+from identity import IdentityMap, extract_name, is_guest, session_owner, valid_session_id
+from models import UserProfile
+
+
+def test_session_owner_parses_our_ids_only():
+    assert session_owner("a2d5dc83dddc_20260101_120000") == "a2d5dc83dddc"
+    assert session_owner("guest-0011aabbccdd_20260101_120000") == "guest-0011aabbccdd"
+    assert session_owner("../../etc/passwd_20260101_120000") is None
+    assert session_owner("a2d5dc83dddc_2026_12") is None
+    assert session_owner(42) is None
+    assert not valid_session_id(["a_20260101_120000"])
+
+
+def test_owner_needs_a_parsed_session_to_exist():
+    identities = IdentityMap()
+    assert identities.owner("alice_20260101_120000", exists=lambda user_id, session_id: False) is None
+    assert identities.owner("alice_20260101_120000", exists=lambda user_id, session_id: True) == "alice"
+    # Now bound, so no further checks
+    assert identities.owner("alice_20260101_120000", exists=lambda user_id, session_id: False) == "alice"
+
+
+def test_forged_session_id_starts_a_guest_session(app):
+    victim = app.client.post("/chat", json={"message": "My name is Asha"}).get_json()
+    victim_id = app.api.identities.owner(victim["session_id"])
+
+    # A session under Asha's user ID that was never issued
+    app.api.identities = IdentityMap()
+    forged = f"{victim_id}_20200101_000000"
+    reply = app.client.post("/chat", json={"message": "What did I tell you?", "session_id": forged}).get_json()
+
+    assert reply["session_id"] != forged
+    assert is_guest(app.api.identities.owner(reply["session_id"]))
+
+
+def test_existing_session_is_resumed_by_another_worker(app):
+    first = app.client.post("/chat", json={"message": "My name is Asha"}).get_json()
+
+    # A worker that has never seen the session
+    app.api.identities = IdentityMap()
+    app.api.current_sessions.discard(first["session_id"])
+    reply = app.client.post("/chat", json={"message": "I'm back", "session_id": first["session_id"]}).get_json()
+
+    assert reply["session_id"] == first["session_id"]
+
+
+def test_path_like_session_id_is_ignored(app):
+    reply = app.client.post("/chat", json={"message": "hello", "session_id": "../../x_20260101_120000"})
+
+    assert reply.status_code == 200
+    assert is_guest(app.api.identities.owner(reply.get_json()["session_id"]))
+
+
+
+def test_remembered_profile_expires(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(identity.time, "monotonic", lambda: now[0])
+    identities = IdentityMap(profile_ttl=60)
+    identities.remember_profile(UserProfile(user_id="alice", name="Alice"))
+    assert identities.profile("alice").name == "Alice"
+
+    # Another worker may have changed it since: reread after the TTL
+    now[0] += 61
+    assert identities.profile("alice") is None
+    assert identities.stats()["profile_expired"] == 1
+    assert identities.stats()["profiles"] == 0
+
+
+def test_only_explicit_introductions_name_a_user():
+    assert extract_name("My name is Asha") == "Asha"
+    assert extract_name("you can call me ravi.") == "Ravi"
+    assert extract_name("I'm feeling low") is None
+    assert extract_name("I am tired") is None
+    assert extract_name("my name is not important") is None
+    assert extract_name("call me crazy but I can't sleep") is None
+
+
+def test_feelings_do_not_merge_guests(app):
+    first = app.client.post("/chat", json={"message": "I'm feeling low"}).get_json()
+    second = app.client.post("/chat", json={"message": "I'm feeling low"},
+                             environ_base={"REMOTE_ADDR": "10.1.2.3"}).get_json()
+
+    owners = {app.api.identities.owner(reply["session_id"]) for reply in (first, second)}
+    assert len(owners) == 2 and all(is_guest(owner) for owner in owners)
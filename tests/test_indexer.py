@@ -0,0 +1,108 @@
+"""Background indexing: ordering, coalescing, bounded backfill memory, and recall"""
+
+import threading
+
+from indexer import BackgroundIndexer
+from models import ChatSession, Message, UserProfile
+
+
+def test_tasks_run_in_order_and_coalesce():
+    indexer = BackgroundIndexer()
+    gate = threading.Event()
+    ran = []
+    indexer.submit("block", gate.wait)
+    indexer.submit("a", lambda: ran.append("a1"))
+    indexer.submit("b", lambda: ran.append("b"))
+    indexer.submit("a", lambda: ran.append("a2"))
+    gate.set()
+
+    assert indexer.flush(5)
+    assert ran == ["b", "a2"]
+    assert indexer.stats()["coalesced"] == 1
+    indexer.close()
+
+
+def test_submit_once_is_bounded():
+    indexer = BackgroundIndexer(max_remembered=2)
+    ran = []
+    for key in ("u1", "u2", "u1", "u3", "u1"):
+        indexer.submit_once(key, lambda key=key: ran.append(key))
+    indexer.flush(5)
+
+    assert ran == ["u1", "u2", "u3"]
+    assert indexer.stats()["backfills_remembered"] == 2
+    indexer.close()
+
+
+def test_failed_task_does_not_stop_the_queue():
+    indexer = BackgroundIndexer()
+    ran = []
+    indexer.submit("bad", lambda: 1 / 0)
+    indexer.submit("good", lambda: ran.append("good"))
+    indexer.flush(5)
+
+    assert ran == ["good"] and indexer.stats()["failed"] == 1
+    indexer.close()
+
+
+def test_close_runs_what_is_left():
+    indexer = BackgroundIndexer()
+    indexer.close()
+    ran = []
+    indexer.submit("late", lambda: ran.append("late"))
+    assert ran == ["late"]
+
+
+def _session(user_id, session_id, text):
+    return ChatSession(session_id=session_id, user_id=user_id, started_at="2026-01-01T12:00:00",
+                       messages=[Message("user", text, "2026-01-01T12:00:00"),
+                                 Message("assistant", "I hear you.", "2026-01-01T12:00:01")],
+                       topics_discussed=["sleep"], mood_indicators=["tired"])
+
+
+def test_saved_sessions_are_indexed_in_the_background(app):
+    app.memory.save_session(_session("asha", "asha_20260101_120000", "I can't sleep before exams"))
+    app.memory.flush()
+
+    memories = app.memory.recall("asha", "exams keep me awake at night")
+    assert memories and memories[0]["session_id"] == "asha_20260101_120000"
+    assert app.memory.get_timeline("asha")["topics"]["sleep"]["total"] == 1
+
+
+def test_sessions_saved_before_the_index_are_backfilled(app):
+    # Stored straight through the backend, as by a version without retrieval
+    app.memory.backend.save_session(_session("ravi", "ravi_20260101_120000", "Work deadlines scare me"))
+
+    assert app.memory.recall("ravi", "deadlines at work") == []
+    app.memory.flush()
+    assert app.memory.recall("ravi", "deadlines at work")
+
+
+def test_timeline_backfill_runs_before_the_first_update(app):
+    app.memory.backend.save_session(_session("mira", "mira_20260101_120000", "I feel tired all day"))
+    app.memory.save_session(_session("mira", "mira_20260102_120000", "Still tired"))
+    app.memory.flush()
+
+    assert app.memory.get_timeline("mira")["total_sessions"] == 2
+
+
+def test_timeline_requests_queue_the_backfill_instead_of_running_it(app):
+    app.memory.backend.save_session(_session("noor", "noor_20260101_120000", "I feel tired all day"))
+    gate = threading.Event()
+    app.memory.indexer.submit("block", gate.wait)
+
+    assert app.memory.get_timeline("noor")["total_sessions"] == 0
+    gate.set()
+    app.memory.flush()
+    assert app.memory.get_timeline("noor")["total_sessions"] == 1
+
+
+def test_profiles_named_by_a_guessed_word_are_not_recalled(app):
+    # Everyone who once said "I'm feeling ..." shared this profile
+    user_id = app.memory.generate_user_id("Feeling")
+    app.memory.save_user_profile(UserProfile(user_id=user_id, name="Feeling"))
+    app.memory.save_session(_session(user_id, f"{user_id}_20260101_120000", "My brother hits me at home"))
+    app.memory.flush()
+
+    assert not app.memory.retrieval.exists(user_id)
+    assert app.memory.recall(user_id, "trouble at home with my brother") == []
@@ -0,0 +1,52 @@
+"""Slotted models: round trips and lazily built messages"""
+
+import threading
+
+from models import ChatSession, Message, UserProfile
+
+
+def _data(messages: int = 4):
+    return {
+        "session_id": "s_20260101_120000",
+        "user_id": "s",
+        "messages": [{"role": "user" if i % 2 == 0 else "assistant", "content": f"m{i}", "timestamp": "t"}
+                     for i in range(messages)],
+        "topics_discussed": ["sleep"],
+        "started_at": "2026-01-01T12:00:00",
+    }
+
+
+def test_session_round_trip():
+    session = ChatSession.from_dict(_data())
+    again = ChatSession.from_dict(session.to_dict())
+
+    assert again.to_dict() == session.to_dict()
+    assert again.messages[1] == Message("assistant", "m1", "t")
+
+
+def test_messages_are_built_on_first_access():
+    session = ChatSession.from_dict(_data())
+
+    assert session._messages is None
+    assert session.message_count == 4 and session.header()["message_count"] == 4
+    assert session._messages is None
+    assert [m.content for m in session.messages] == ["m0", "m1", "m2", "m3"]
+
+
+def test_concurrent_first_access_shares_one_list():
+    session = ChatSession.from_dict(_data(200))
+    seen = []
+    threads = [threading.Thread(target=lambda: seen.append(session.messages)) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert all(messages is seen[0] for messages in seen)
+
+
+def test_profile_round_trip():
+    profile = UserProfile("u1", "Asha", concerns=["sleep"])
+    again = UserProfile.from_dict(profile.to_dict())
+
+    assert (again.user_id, again.name, again.concerns) == ("u1", "Asha", ["sleep"])
@@ -0,0 +1,38 @@
+"""System prompt layout: persona, patient block, session summary, then memories"""
+
+from context_builder import ContextBuilder
+from models import ChatSession, Message
+from prompts import MEMORIES_HEADER, PERSONA, PromptBuilder
+
+CONTEXT = {"profile": {"name": "Asha"}, "key_topics": ["sleep"], "mood_patterns": ["tired"],
+           "previous_advice": [], "follow_ups": []}
+MEMORIES = [{"timestamp": "2026-01-01T12:00:00", "text": "I can't sleep", "reply": "Let's look at your evenings."}]
+
+
+def test_sections_are_in_stable_to_volatile_order():
+    prompts = PromptBuilder()
+    session = ChatSession(session_id="s_20260101_120000", user_id="s", session_summary="- Patient: hello",
+                          summarized_messages=2,
+                          messages=[Message("user", "hello", ""), Message("assistant", "hi", "")])
+    messages, _, _ = ContextBuilder().build(prompts.build(CONTEXT), session, "still tired",
+                                            prompts.memories_section(CONTEXT, MEMORIES))
+    system = messages[0]["content"]
+
+    assert system.startswith(PERSONA)
+    positions = [system.index(marker) for marker in
+                 ("PATIENT HISTORY", ContextBuilder.SUMMARY_HEADER, MEMORIES_HEADER)]
+    assert positions == sorted(positions)
+
+
+def test_patient_block_is_memoized():
+    prompts = PromptBuilder()
+    first = prompts.build(CONTEXT)
+
+    assert prompts.build(dict(CONTEXT)) == first
+    assert prompts.stats()["block_hits"] == 1
+
+
+def test_memories_need_a_known_patient():
+    assert PromptBuilder.memories_section(None, MEMORIES) == ""
+    assert PromptBuilder.memories_section({"profile": None}, MEMORIES) == ""
+    assert MEMORIES_HEADER in PromptBuilder.memories_section(CONTEXT, MEMORIES)
@@ -0,0 +1,94 @@
+"""Storage backends: session order, and concurrent access to the file backend"""
+
+import sqlite3
+import threading
+import time
+
+import pytest
+
+from models import ChatSession, Message
+from storage import FileStorageBackend, SQLiteStorageBackend
+
+
+@pytest.fixture(params=["file", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "file":
+        backend = FileStorageBackend(str(tmp_path / "user_data"))
+    else:
+        backend = SQLiteStorageBackend(str(tmp_path / "memory.db"))
+    yield backend
+    backend.close()
+
+
+def _session(session_id: str, started_at: str) -> ChatSession:
+    return ChatSession(session_id=session_id, user_id="u1", started_at=started_at,
+                       messages=[Message("user", "hello", started_at)])
+
+
+def test_sessions_are_listed_by_last_update(backend):
+    old = _session("u1_20260101_120000", "2026-01-01T12:00:00")
+    new = _session("u1_20260102_120000", "2026-01-02T12:00:00")
+    backend.save_session(old)
+    time.sleep(0.02)
+    backend.save_session(new)
+    time.sleep(0.02)
+    # The older session is continued, so it becomes the most recent
+    old.messages.append(Message("assistant", "welcome back", "2026-01-03T12:00:00"))
+    backend.save_session(old)
+
+    assert backend.list_sessions("u1") == ["u1_20260101_120000", "u1_20260102_120000"]
+    assert [s.session_id for s in backend.load_recent_sessions("u1", 1)] == ["u1_20260101_120000"]
+
+
+def test_sqlite_indexes_updated_at(tmp_path):
+    path = str(tmp_path / "memory.db")
+    SQLiteStorageBackend(path).close()
+    plan = sqlite3.connect(path).execute(
+        "EXPLAIN QUERY PLAN SELECT header FROM sessions WHERE user_id = ? ORDER BY updated_at DESC LIMIT 3",
+        ("u1",)
+    ).fetchall()
+
+    assert any("idx_sessions_user_updated" in row[-1] for row in plan)
+    assert not any("TEMP B-TREE" in row[-1] for row in plan)
+
+
+def test_sqlite_close_closes_every_threads_connection(tmp_path):
+    backend = SQLiteStorageBackend(str(tmp_path / "memory.db"))
+    connections = []
+    threads = [threading.Thread(target=lambda: connections.append(backend._conn())) for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    backend.close()
+
+    for conn in connections:
+        with pytest.raises(sqlite3.ProgrammingError, match="closed"):
+            conn.execute("SELECT 1")
+
+
+def test_file_backend_concurrent_saves_and_loads(tmp_path):
+    backend = FileStorageBackend(str(tmp_path / "user_data"), compact_every=5)
+    sessions = [ChatSession(session_id=f"u{i}_20260101_120000", user_id=f"u{i % 3}") for i in range(6)]
+    errors = []
+
+    def chat(session):
+        try:
+            for turn in range(20):
+                session.messages.append(Message("user", f"{session.session_id} {turn}", ""))
+                backend.save_session(session)
+                backend.load_session(session.user_id, session.session_id)
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=chat, args=(session,)) for session in sessions]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    for session in sessions:
+        stored = backend.load_session(session.user_id, session.session_id)
+        assert [m.content for m in stored.messages] == [f"{session.session_id} {turn}" for turn in range(20)]
+    assert sorted(backend.list_sessions("u0")) == ["u0_20260101_120000", "u3_20260101_120000"]
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Per-user mood and topic timelines
+
+Every session records the topics and moods picked up in it, but nothing
+looked across sessions. Here each user gets running counts per day: how many
+sessions they had, and in how many of them each topic and mood came up.
+Labels are attributed to the day the session started, so a timeline can be
+rebuilt from session headers alone, without reading transcripts.
+
+The counts are updated incrementally as sessions are saved, and held in
+memory as a (days x labels) int32 matrix. A timeline request slices it (or
+folds it into weeks) and works out streaks and last-seen days with a few
+array operations. That takes the same time for a user with ten sessions as
+for one with ten thousand.
+
+On disk, each user has one append-only file under user_data/timeline/:
+    <user_id>.jsonl   one line per save that added labels:
+                      {"session_id": ..., "day": "2024-05-01", "labels": [...]}
+Appends happen under a per-user file lock, and readers pick up lines other
+worker processes appended, as in retrieval.py. A rebuild replaces the file,
+and readers notice the new inode and reload.
+
+Usage (recompute from stored sessions, e.g. after a migration):
+    python timeline.py
+    python timeline.py --data-dir user_data --user 1a2b3c4d5e6f
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from file_lock import StripedFileLocks
+
+GRANULARITIES = ("day", "week")
+SESSION_LABEL = "session"
+MAX_WINDOW_DAYS = 3660
+
+
+def _dumps(record: Dict[str, Any]) -> str:
+    return json.dumps(record, ensure_ascii=False, separators=(",", ":"))
+
+
+def _tmp_path(path: str) -> str:
+    return f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+
+
+def session_day(started_at: str) -> int:
+    """Date ordinal of the day a session started (today if it isn't recorded)"""
+    try:
+        return date.fromisoformat(started_at[:10]).toordinal()
+    except (TypeError, ValueError):
+        return date.today().toordinal()
+
+
+def session_labels(header: Dict[str, Any]) -> List[str]:
+    """Timeline labels for a session header, named like keyword_matcher labels"""
+    labels = [SESSION_LABEL]
+    labels.extend(f"topic:{topic}" for topic in header.get("topics_discussed", ()))
+    labels.extend(f"mood:{mood}" for mood in header.get("mood_indicators", ()))
+    return labels
+
+
+def _iso(day: int) -> str:
+    return date.fromordinal(int(day)).isoformat()
+
+
+def _week_start(day: int) -> int:
+    # Ordinal 1 (0001-01-01) is a Monday
+    return day - (day - 1) % 7
+
+
+def run_lengths(active: np.ndarray) -> np.ndarray:
+    """For a (days x labels) bool matrix, the length of the run of True ending at each cell"""
+    counts = np.cumsum(active, axis=0, dtype=np.int32)
+    # The running count at each label's latest False, carried forward
+    resets = np.maximum.accumulate(np.where(active, 0, counts), axis=0)
+    return counts - resets
+
+
+class UserTimeline:
+    """One user's daily label counts, mirrored from their timeline file"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self._reset()
+
+    def _reset(self):
+        self.labels: List[str] = []
+        self.codes: Dict[str, int] = {}
+        self.first_day: Optional[int] = None
+        self.daily = np.zeros((0, 0), dtype=np.int32)  # row = first_day + i, column = label code
+        self.last_seen = np.zeros(0, dtype=np.int32)   # latest day ordinal per label
+        self.recorded: Dict[str, set] = {}  # session_id -> labels already counted
+        self._bytes = 0
+        self._inode = None
+
+    @property
+    def last_day(self) -> Optional[int]:
+        return None if self.first_day is None else self.first_day + len(self.daily) - 1
+
+    def refresh(self):
+        """Read lines appended since the last refresh; start over if the file was rebuilt"""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        if self._inode is not None and (st.st_ino != self._inode or st.st_size < self._bytes):
+            self._reset()
+        self._inode = st.st_ino
+        if st.st_size == self._bytes:
+            return
+
+        with open(self.path, "rb") as f:
+            f.seek(self._bytes)
+            tail = f.read()
+        # Only whole lines: a writer may be midway through one
+        complete = tail[:tail.rfind(b"\n") + 1]
+        if not complete:
+            return
+        self._bytes += len(complete)
+        self._add(json.loads(line) for line in complete.decode("utf-8").splitlines() if line)
+
+    def new_labels(self, session_id: str, labels: Iterable[str]) -> List[str]:
+        recorded = self.recorded.get(session_id, ())
+        return [label for label in labels if label not in recorded]
+
+    def append(self, records: List[Dict[str, Any]]):
+        """Persist and count new records (caller holds the user's file lock, after refresh())"""
+        payload = "".join(_dumps(record) + "\n" for record in records).encode("utf-8")
+        with open(self.path, "ab") as f:
+            # Cut anything past what refresh() accepted: a torn line from a crash
+            if f.tell() != self._bytes:
+                f.truncate(self._bytes)
+            f.write(payload)
+            self._inode = os.fstat(f.fileno()).st_ino
+        self._bytes += len(payload)
+        self._add(records)
+
+    def _add(self, records: Iterable[Dict[str, Any]]):
+        """Fold records into the count matrix with one scatter-add"""
+        days, codes = [], []
+        for record in records:
+            day = session_day(record["day"])
+            recorded = self.recorded.setdefault(record["session_id"], set())
+            for label in record["labels"]:
+                if label in recorded:
+                    continue
+                recorded.add(label)
+                code = self.codes.get(label)
+                if code is None:
+                    code = self.codes[label] = len(self.labels)
+                    self.labels.append(label)
+                days.append(day)
+                codes.append(code)
+        if not days:
+            return
+
+        days = np.asarray(days, dtype=np.int32)
+        codes = np.asarray(codes, dtype=np.int32)
+        self._grow(int(days.min()), int(days.max()))
+        np.add.at(self.daily, (days - self.first_day, codes), 1)
+        np.maximum.at(self.last_seen, codes, days)
+
+    def _grow(self, low: int, high: int):
+        """Widen the matrix to cover days low..high and every known label"""
+        if self.first_day is None:
+            first, last = low, high
+        else:
+            first, last = min(low, self.first_day), max(high, self.last_day)
+        shape = (last - first + 1, len(self.labels))
+        if shape == self.daily.shape:
+            return
+        daily = np.zeros(shape, dtype=np.int32)
+        if self.daily.size:
+            offset = self.first_day - first
+            daily[offset:offset + len(self.daily), :self.daily.shape[1]] = self.daily
+        self.daily = daily
+        self.first_day = first
+        self.last_seen = np.concatenate([
+            self.last_seen, np.zeros(len(self.labels) - len(self.last_seen), dtype=np.int32)])
+
+
+class TimelineStore:
+    """Per-user mood and topic timelines, kept current by save_session"""
+
+    def __init__(self, timeline_dir: str, max_cached_users: int = 256):
+        self.timeline_dir = timeline_dir
+        self.max_cached_users = max_cached_users
+        os.makedirs(timeline_dir, exist_ok=True)
+        self._locks = StripedFileLocks(os.path.join(os.path.dirname(timeline_dir), "locks"), "timeline")
+        self._users: "OrderedDict[str, UserTimeline]" = OrderedDict()
+        self._users_lock = threading.Lock()
+
+        self.updates = 0
+        self.rebuilds = 0
+        self.queries = 0
+        self.query_seconds = 0.0
+
+    def _path(self, user_id: str) -> str:
+        return os.path.join(self.timeline_dir, f"{user_id}.jsonl")
+
+    def exists(self, user_id: str) -> bool:
+        return os.path.exists(self._path(user_id))
+
+    def _user(self, user_id: str) -> UserTimeline:
+        with self._users_lock:
+            timeline = self._users.get(user_id)
+            if timeline is None:
+                timeline = self._users[user_id] = UserTimeline(self._path(user_id))
+                while len(self._users) > self.max_cached_users:
+                    self._users.popitem(last=False)
+            else:
+                self._users.move_to_end(user_id)
+            return timeline
+
+    def add_session(self, header: Dict[str, Any]) -> int:
+        """Count the session's labels not counted yet; returns how many were added"""
+        timeline = self._user(header["user_id"])
+        with self._locks.hold(header["user_id"]), timeline.lock:
+            timeline.refresh()
+            labels = timeline.new_labels(header["session_id"], session_labels(header))
+            if labels:
+                timeline.append([{
+                    "session_id": header["session_id"],
+                    "day": header.get("started_at", "")[:10],
+                    "labels": labels,
+                }])
+                self.updates += 1
+            return len(labels)
+
+    def rebuild(self, user_id: str, load_headers: Callable[[], List[Dict[str, Any]]]) -> int:
+        """Replace a user's timeline with one recomputed from their session headers
+
+        load_headers is called under the user's lock, so saves made meanwhile
+        are appended to the new file rather than lost with the old one.
+        """
+        path = self._path(user_id)
+        with self._locks.hold(user_id):
+            records = [{"session_id": header["session_id"], "day": header.get("started_at", "")[:10],
+                        "labels": session_labels(header)}
+                       for header in load_headers()]
+            if not records:
+                # No history: no file, rather than an empty one per unknown user ID
+                if os.path.exists(path):
+                    os.remove(path)
+                return 0
+            tmp_path = _tmp_path(path)
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                f.write("".join(_dumps(record) + "\n" for record in records))
+            os.replace(tmp_path, path)
+        self.rebuilds += 1
+        return len(records)
+
+    def timeline(self, user_id: str, granularity: str = "day", days: int = 90,
+                 today: Optional[int] = None) -> Dict[str, Any]:
+        """Counts for the `days` up to today, by day or week, plus all-time totals and streaks"""
+        if granularity not in GRANULARITIES:
+            raise ValueError(f"Unknown granularity: {granularity} (expected one of {GRANULARITIES})")
+        days = max(1, min(int(days), MAX_WINDOW_DAYS))
+        started = time.perf_counter()
+
+        timeline = self._user(user_id)
+        with timeline.lock:
+            timeline.refresh()
+            labels = list(timeline.labels)
+            daily, first_day, last_day = timeline.daily.copy(), timeline.first_day, timeline.last_day
+            last_seen = timeline.last_seen.copy()
+
+        today = today or date.today().toordinal()
+        start = today - days + 1
+        end = today
+        if granularity == "week":
+            start = _week_start(start)
+            end = _week_start(today) + 6
+
+        # Window of the matrix, zero-filled where there's no history
+        window = np.zeros((end - start + 1, len(labels)), dtype=np.int32)
+        if first_day is not None:
+            low, high = max(start, first_day), min(end, last_day)
+            if low <= high:
+                window[low - start:high - start + 1] = daily[low - first_day:high - first_day + 1]
+        step = 7 if granularity == "week" else 1
+        if step > 1:
+            window = window.reshape(len(window) // step, step, len(labels)).sum(axis=1)
+        periods = [_iso(day) for day in range(start, end + 1, step)]
+
+        totals = daily.sum(axis=0) if len(daily) else np.zeros(len(labels), dtype=np.int64)
+        # Streaks of consecutive days; a current one must reach today or yesterday
+        runs = run_lengths(daily > 0) if len(daily) else np.zeros((1, len(labels)), dtype=np.int32)
+        longest = runs.max(axis=0)
+        current = runs[-1] if last_day is not None and last_day >= today - 1 else np.zeros(len(labels), dtype=np.int32)
+
+        result = {
+            "user_id": user_id,
+            "granularity": granularity,
+            "periods": periods,
+            "sessions": [0] * len(periods),
+            "total_sessions": 0,
+            "first_day": _iso(first_day) if first_day is not None else None,
+            "last_day": _iso(last_day) if last_day is not None else None,
+            "topics": {},
+            "moods": {},
+        }
+        for code, label in enumerate(labels):
+            counts = window[:, code].tolist()
+            if label == SESSION_LABEL:
+                result["sessions"] = counts
+                result["total_sessions"] = int(totals[code])
+                continue
+            kind, _, name = label.partition(":")
+            result["topics" if kind == "topic" else "moods"][name] = {
+                "counts": counts,
+                "total": int(totals[code]),
+                "last_seen": _iso(last_seen[code]),
+                "current_streak_days": int(current[code]),
+                "longest_streak_days": int(longest[code]),
+            }
+
+        self.queries += 1
+        self.query_seconds += time.perf_counter() - started
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        with self._users_lock:
+            users = list(self._users.values())
+        queries = self.queries or 1
+        return {
+            "cached_users": len(users),
+            "cached_days": sum(len(timeline.daily) for timeline in users),
+            "updates": self.updates,
+            "rebuilds": self.rebuilds,
+            "queries": self.queries,
+            "avg_query_ms": round(self.query_seconds / queries * 1000, 3),
+        }
+
+
+def rebuild_all(data_dir: str, user_ids: Optional[List[str]] = None) -> Tuple[int, int]:
+    """Recompute timelines for every (or the given) user from stored session headers"""
+    from storage import create_backend
+
+    backend = create_backend(os.environ.get("MEMORY_BACKEND", "file"), data_dir)
+    store = TimelineStore(os.path.join(data_dir, "timeline"))
+    users = sessions = 0
+    try:
+        for user_id in user_ids or backend.list_users():
+            def load_headers(user_id=user_id):
+                limit = len(backend.list_sessions(user_id))
+                return [session.header() for session in backend.load_recent_sessions(user_id, limit)]
+            try:
+                sessions += store.rebuild(user_id, load_headers)
+                users += 1
+            except Exception as e:
+                print(f"❌ Error rebuilding timeline for {user_id}: {e}")
+    finally:
+        backend.close()
+    return users, sessions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recompute mood and topic timelines from stored sessions")
+    parser.add_argument("--data-dir", default="user_data", help="Storage directory")
+    parser.add_argument("--user", action="append", help="Only this user (repeatable)")
+    args = parser.parse_args()
+
+    print(f"📊 Rebuilding timelines in {args.data_dir}")
+    started = time.perf_counter()
+    users, sessions = rebuild_all(args.data_dir, args.user)
+    print(f"✅ Rebuilt {users} timelines from {sessions} sessions in {time.perf_counter() - started:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,221 @@
+#!/usr/bin/env python3
+"""
+Write-behind persistence for MemoryManager
+
+Saves are queued and written by a background thread, so request latency no
+longer includes disk I/O. Repeated saves of the same session or profile
+between flushes collapse into one write. Pending (not yet written) objects
+stay readable through the queue, and the queue is drained on shutdown.
+
+Durability modes:
+    "none"    never fsync; rely on the OS page cache
+    "batch"   fsync once after every flushed batch (default)
+    "always"  fsync after every individual write
+"""
+
+import atexit
+import copy
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+from models import UserProfile, ChatSession, SESSION_LIST_FIELDS
+
+DURABILITY_MODES = ("none", "batch", "always")
+
+
+def snapshot_session(session: ChatSession) -> ChatSession:
+    """Copy a session deeply enough that later turns don't change the snapshot"""
+    snapshot = copy.copy(session)
+    snapshot.messages = list(session.messages)
+    for key in SESSION_LIST_FIELDS:
+        setattr(snapshot, key, list(getattr(session, key)))
+    return snapshot
+
+
+def snapshot_profile(profile: UserProfile) -> UserProfile:
+    snapshot = copy.copy(profile)
+    snapshot.concerns = list(profile.concerns)
+    snapshot.preferences = dict(profile.preferences)
+    return snapshot
+
+
+class WriteBehindQueue:
+    """Coalescing background writer in front of a StorageBackend"""
+
+    def __init__(self, backend, flush_interval: float = 0.5, batch_size: int = 64,
+                 durability: str = "batch"):
+        if durability not in DURABILITY_MODES:
+            raise ValueError(f"Unknown durability mode: {durability} (expected one of {DURABILITY_MODES})")
+        self.backend = backend
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.durability = durability
+
+        # ("session"|"profile", id) -> snapshot, oldest first
+        self._pending = OrderedDict()
+        self._in_flight = {}
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()  # one batch in flight at a time
+        self._thread = None
+        self._thread_pid = None
+        self._closed = False
+
+        self.enqueued = 0
+        self.coalesced = 0
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.syncs = 0
+
+        atexit.register(self.close)
+
+    # Producers
+
+    def enqueue_session(self, session: ChatSession):
+        self._enqueue(("session", session.session_id), snapshot_session(session))
+
+    def enqueue_profile(self, profile: UserProfile):
+        self._enqueue(("profile", profile.user_id), snapshot_profile(profile))
+
+    def _enqueue(self, key, snapshot):
+        with self._cond:
+            if self._closed:
+                # Shutting down: write through rather than lose the save
+                self._write(key, snapshot)
+                return
+            self._ensure_thread()
+            self.enqueued += 1
+            if key in self._pending:
+                self.coalesced += 1
+                del self._pending[key]
+            self._pending[key] = snapshot
+            if len(self._pending) >= self.batch_size:
+                self._cond.notify()
+
+    def _ensure_thread(self):
+        """Start the writer lazily, and again in a forked child"""
+        if self._thread is None or self._thread_pid != os.getpid():
+            self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+            self._thread_pid = os.getpid()
+            self._thread.start()
+
+    # Read-your-writes
+
+    def _latest(self, key):
+        with self._cond:
+            snapshot = self._pending.get(key)
+            if snapshot is None:
+                snapshot = self._in_flight.get(key)
+            return snapshot
+
+    def pending_session(self, session_id: str) -> Optional[ChatSession]:
+        snapshot = self._latest(("session", session_id))
+        return snapshot_session(snapshot) if snapshot is not None else None
+
+    def pending_profile(self, user_id: str) -> Optional[UserProfile]:
+        snapshot = self._latest(("profile", user_id))
+        return snapshot_profile(snapshot) if snapshot is not None else None
+
+    def pending_sessions_for(self, user_id: str) -> List[ChatSession]:
+        """Unwritten sessions of a user, most recently saved first"""
+        with self._cond:
+            latest = dict(self._in_flight)
+            latest.update(self._pending)
+            order = list(self._in_flight) + [key for key in self._pending if key not in self._in_flight]
+            sessions = [latest[key] for key in reversed(order)
+                        if key[0] == "session" and latest[key].user_id == user_id]
+        return [snapshot_session(session) for session in sessions]
+
+    # Writer
+
+    def _run(self):
+        while True:
+            with self._cond:
+                deadline = time.monotonic() + self.flush_interval
+                while not self._closed and len(self._pending) < self.batch_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+                if self._closed and not self._pending:
+                    return
+            self.flush()
+
+    def flush(self):
+        """Write everything pending now; safe to call from any thread"""
+        with self._flush_lock:
+            with self._cond:
+                if not self._pending:
+                    return
+                batch = self._pending
+                self._pending = OrderedDict()
+                self._in_flight = dict(batch)
+
+            wrote = False
+            for key, snapshot in batch.items():
+                wrote = self._write(key, snapshot) or wrote
+
+            with self._cond:
+                self._in_flight = {}
+                self.batches += 1
+            if wrote and self.durability == "batch":
+                self._sync()
+
+    def _write(self, key, snapshot) -> bool:
+        try:
+            if key[0] == "session":
+                self.backend.save_session(snapshot)
+            else:
+                self.backend.save_profile(snapshot)
+            self.written += 1
+            if self.durability == "always":
+                self._sync()
+            return True
+        except Exception as e:
+            self.failed += 1
+            print(f"❌ Write-behind failed for {key[0]} {key[1]}: {e}")
+            with self._cond:
+                # Retry on the next flush unless a newer version is already queued
+                if key not in self._pending and not self._closed:
+                    self._pending[key] = snapshot
+            return False
+
+    def _sync(self):
+        try:
+            self.backend.sync()
+            self.syncs += 1
+        except Exception as e:
+            print(f"❌ Storage sync failed: {e}")
+
+    def close(self):
+        """Drain everything pending and stop the writer"""
+        with self._cond:
+            if self._closed:
+                return
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread if self._thread_pid == os.getpid() else None
+        if thread is not None:
+            thread.join(timeout=30)
+        self.flush()
+        if self.durability != "none":
+            self._sync()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._cond:
+            return {
+                "pending": len(self._pending),
+                "in_flight": len(self._in_flight),
+                "enqueued": self.enqueued,
+                "coalesced": self.coalesced,
+                "written": self.written,
+                "failed": self.failed,
+                "batches": self.batches,
+                "syncs": self.syncs,
+                "flush_interval_seconds": self.flush_interval,
+                "batch_size": self.batch_size,
+                "durability": self.durability,
+            }
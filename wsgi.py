@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+WSGI entry point for the multi-process production server
+
+    gunicorn -c gunicorn.conf.py wsgi:app
+
+Every worker process loads its own copy of the app. Live sessions are shared
+through the storage backend (see SharedSessionCache), so consecutive turns of
+a conversation can land on any worker. For local development, run
+api_server.py directly.
+"""
+
+import os
+
+# Must be set before api_server builds its session cache
+os.environ.setdefault("SHARED_SESSIONS", "1")
+
+from api_server import app
+
+application = app